@@ -0,0 +1,166 @@
+"""
+Admission control per workload class (ingest-OCR, ingest-Gemini, search).
+
+Each class admits up to `limit` requests at once and queues up to `queue` more
+(FIFO) for at most `timeout` seconds. Anything beyond that is rejected with
+AdmissionRejected, which the API turns into 429 + Retry-After. Works from both
+threadpool endpoints (slot / acquire) and async endpoints (aslot / acquire_async).
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from typing import Dict, Any
+from config import (
+    INGEST_OCR_CONCURRENCY, INGEST_OCR_QUEUE, INGEST_GEMINI_CONCURRENCY, INGEST_GEMINI_QUEUE,
+    INGEST_QUEUE_TIMEOUT, SEARCH_MAX_CONCURRENCY, SEARCH_MAX_QUEUE, SEARCH_QUEUE_TIMEOUT
+)
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, workload: str, reason: str, retry_after: int):
+        super().__init__(f"{workload}: {reason}")
+        self.workload = workload
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _ThreadWaiter:
+    def __init__(self):
+        self.event = threading.Event()
+
+    def grant(self):
+        self.event.set()
+
+
+class _AsyncWaiter:
+    def __init__(self, loop):
+        self.loop = loop
+        self.future = loop.create_future()
+
+    def grant(self):
+        self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(True))
+
+
+class WorkloadClass:
+    def __init__(self, name: str, limit: int, queue: int, timeout: float):
+        self.name = name
+        self.limit = max(1, limit)
+        self.queue_limit = max(0, queue)
+        self.timeout = timeout
+        self.in_flight = 0
+        self._waiters: deque = deque()
+        self._lock = threading.Lock()
+        self._avg_service_s = 1.0  # EMA of time a request holds a slot, for Retry-After
+        self.counters = {"admitted": 0, "rejected_queue_full": 0, "rejected_timeout": 0, "cancelled": 0, "completed": 0}
+
+    def retry_after(self) -> int:
+        # Roughly how long until the current backlog drains through the slots
+        backlog = len(self._waiters) + 1
+        return max(1, round(self._avg_service_s * backlog / self.limit))
+
+    def _enter(self, waiter) -> bool:
+        """True if admitted immediately, False if queued. Raises when the queue is full."""
+        with self._lock:
+            if self.in_flight < self.limit and not self._waiters:
+                self.in_flight += 1
+                self.counters["admitted"] += 1
+                return True
+            if len(self._waiters) >= self.queue_limit:
+                self.counters["rejected_queue_full"] += 1
+                raise AdmissionRejected(self.name, "queue full", self.retry_after())
+            self._waiters.append(waiter)
+            return False
+
+    def _abandon(self, waiter, counter: str = "rejected_timeout") -> bool:
+        """Called when a queued wait ends early. False means the slot was granted meanwhile."""
+        with self._lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                self.counters[counter] += 1
+                return True
+            return False
+
+    def _granted(self):
+        with self._lock:
+            self.counters["admitted"] += 1
+
+    def acquire(self) -> float:
+        """Blocking acquire for threadpool endpoints. Returns the start time to pass to release()."""
+        waiter = _ThreadWaiter()
+        if not self._enter(waiter):
+            if not waiter.event.wait(self.timeout) and self._abandon(waiter):
+                raise AdmissionRejected(self.name, "timed out in queue", self.retry_after())
+            self._granted()
+        return time.perf_counter()
+
+    async def acquire_async(self) -> float:
+        """Acquire for async endpoints; waits without blocking the event loop."""
+        waiter = _AsyncWaiter(asyncio.get_running_loop())
+        if not self._enter(waiter):
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.timeout)
+            except asyncio.TimeoutError:
+                if self._abandon(waiter):
+                    raise AdmissionRejected(self.name, "timed out in queue", self.retry_after())
+            except asyncio.CancelledError:
+                # Client went away while queued: give back the slot if it was already handed over
+                if not self._abandon(waiter, "cancelled"):
+                    self.release(time.perf_counter())
+                raise
+            self._granted()
+        return time.perf_counter()
+
+    def release(self, started: float):
+        with self._lock:
+            self.counters["completed"] += 1
+            self._avg_service_s = 0.8 * self._avg_service_s + 0.2 * (time.perf_counter() - started)
+            if self._waiters:
+                # Hand the slot straight to the next waiter; in_flight stays the same
+                self._waiters.popleft().grant()
+            else:
+                self.in_flight -= 1
+
+    @contextmanager
+    def slot(self):
+        started = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(started)
+
+    @asynccontextmanager
+    async def aslot(self):
+        started = await self.acquire_async()
+        try:
+            yield
+        finally:
+            self.release(started)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "queue_limit": self.queue_limit,
+                "queue_timeout_s": self.timeout,
+                "in_flight": self.in_flight,
+                "queued": len(self._waiters),
+                "avg_service_ms": round(self._avg_service_s * 1000, 1),
+                **self.counters,
+            }
+
+
+class AdmissionController:
+    def __init__(self):
+        self.classes: Dict[str, WorkloadClass] = {
+            "ingest_ocr": WorkloadClass("ingest_ocr", INGEST_OCR_CONCURRENCY, INGEST_OCR_QUEUE, INGEST_QUEUE_TIMEOUT),
+            "ingest_gemini": WorkloadClass("ingest_gemini", INGEST_GEMINI_CONCURRENCY, INGEST_GEMINI_QUEUE, INGEST_QUEUE_TIMEOUT),
+            "search": WorkloadClass("search", SEARCH_MAX_CONCURRENCY, SEARCH_MAX_QUEUE, SEARCH_QUEUE_TIMEOUT),
+        }
+
+    def __getitem__(self, name: str) -> WorkloadClass:
+        return self.classes[name]
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: workload.stats() for name, workload in self.classes.items()}
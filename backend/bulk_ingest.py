@@ -0,0 +1,273 @@
+"""
+Bulk ingestion of a PDF archive: `python manage.py bulk-ingest <dir or manifest>`.
+
+Parsing, OCR and embedding (Pipeline.prepare) are fanned out over a pool of
+spawned processes, each loading its own models. Workers never open the vector
+store: they send chunks and vectors back, and the parent (Pipeline.commit) is the
+only process that writes, so an embedded Chroma store is safe. Workers are
+spawned rather than forked, since torch's thread pools do not survive a fork.
+Progress is checkpointed per file in a SQLite state file (BULK_INGEST_STATE_PATH):
+  - a rerun resumes where the last one stopped (crashed runs included),
+  - files whose content hash was already ingested are skipped, under any path,
+  - failed files are retried up to `max_attempts` times across runs.
+Deferred captions / table summaries are queued as usual and filled in by the
+API's enrichment worker once it runs.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from custom_storage.metadata import doc_id_from_filename
+from config import BULK_INGEST_STATE_PATH, BULK_INGEST_WORKERS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    sha256 TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    pages INTEGER,
+    chunks INTEGER,
+    seconds REAL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_files_doc ON files(doc_id);
+"""
+
+_pipeline = None
+
+
+def _init_worker(threads: int):
+    global _pipeline
+    try:
+        import torch
+        # Every worker would otherwise size its thread pool to the whole machine
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    from pipeline import Pipeline
+    _pipeline = Pipeline(store=False)
+
+
+def _prepare(path: str, mode: str, partition: Optional[str]) -> Dict[str, Any]:
+    """Runs in a pool worker. Never raises: failures come back as {"result": error}."""
+    start = time.perf_counter()
+    try:
+        with open(path, "rb") as f:
+            ingest = _pipeline.prepare(f, os.path.basename(path), extraction_mode=mode, partition=partition)
+    except Exception as e:
+        ingest = {"result": {"status": "error", "message": f"{type(e).__name__}: {e}"}}
+    ingest["seconds"] = round(time.perf_counter() - start, 2)
+    return ingest
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def iter_sources(source: str, mode: str, partition: Optional[str]) -> Iterator[Tuple[str, str, Optional[str]]]:
+    """
+    Yields (path, mode, partition) for every PDF under a directory, or for every
+    line of a manifest: a path, or a JSON object {"path", "mode"?, "partition"?}.
+    Relative manifest paths are resolved against the manifest's directory.
+    """
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(".pdf"):
+                    yield os.path.join(root, name), mode, partition
+        return
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            entry = json.loads(line) if line.startswith("{") else {"path": line}
+            yield (os.path.join(base, entry["path"]), entry.get("mode", mode),
+                   entry.get("partition", partition))
+
+
+class BulkIngestor:
+    def __init__(self, state_path: str = BULK_INGEST_STATE_PATH, workers: int = BULK_INGEST_WORKERS,
+                 max_attempts: int = 3):
+        os.makedirs(os.path.dirname(os.path.abspath(state_path)), exist_ok=True)
+        self.workers = max(1, workers)
+        self.max_attempts = max_attempts
+        self._db = sqlite3.connect(state_path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+
+    # --- State ---
+
+    def _record(self, sha: str, path: str, doc_id: str, status: str, **fields):
+        columns = ["sha256", "path", "doc_id", "status", "updated_at"] + list(fields)
+        values = [sha, path, doc_id, status, time.time()] + list(fields.values())
+        updates = ", ".join(f"{c} = excluded.{c}" for c in columns[1:])
+        with self._db:
+            self._db.execute(
+                f"INSERT INTO files ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                f"ON CONFLICT(sha256) DO UPDATE SET {updates}",
+                values
+            )
+
+    def _state(self, sha: str) -> Optional[Tuple[str, int, str]]:
+        return self._db.execute("SELECT status, attempts, path FROM files WHERE sha256 = ?", (sha,)).fetchone()
+
+    def _owner(self, doc_id: str, sha: str) -> Optional[str]:
+        """Path of a different file already ingested (or in flight) under the same doc_id."""
+        row = self._db.execute(
+            "SELECT path FROM files WHERE doc_id = ? AND sha256 != ? AND status IN ('done', 'running')", (doc_id, sha)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _attempts(self, sha: str) -> int:
+        row = self._db.execute("SELECT attempts FROM files WHERE sha256 = ?", (sha,)).fetchone()
+        return row[0] if row else 0
+
+    # --- Run ---
+
+    def _plan(self, sources, report: Dict[str, Any]) -> Iterator[Tuple[str, str, str, str, Optional[str]]]:
+        """Yields the files that still need ingesting; counts the rest in `report`."""
+        seen = set()
+        for path, mode, partition in sources:
+            report["files"] += 1
+            try:
+                sha = file_sha256(path)
+            except OSError as e:
+                report["failed"] += 1
+                report["failures"].append({"path": path, "error": f"unreadable: {e}"})
+                continue
+            doc_id = doc_id_from_filename(os.path.basename(path))
+            state = self._state(sha)
+            if sha in seen or (state and state[0] == "done"):
+                report["skipped_ingested"] += 1
+                continue
+            if state and state[0] == "failed" and state[1] >= self.max_attempts:
+                report["skipped_failed"] += 1
+                continue
+            owner = self._owner(doc_id, sha)
+            if owner:
+                # Same filename, different content: ingesting it would replace the other document
+                report["skipped_conflict"] += 1
+                report["failures"].append({"path": path, "error": f"doc_id '{doc_id}' already taken by {owner}"})
+                continue
+            seen.add(sha)
+            yield sha, path, doc_id, mode, partition
+
+    def _commit(self, ingest: Dict[str, Any]) -> Dict[str, Any]:
+        seconds = ingest.pop("seconds", None)
+        start = time.perf_counter()
+        try:
+            result = self._writer.commit(ingest)
+        except Exception as e:
+            result = {"status": "error", "message": f"{type(e).__name__}: {e}"}
+        result["seconds"] = round((seconds or 0) + time.perf_counter() - start, 2)
+        return result
+
+    def run(self, sources, progress_every: int = 25) -> Dict[str, Any]:
+        report: Dict[str, Any] = {
+            "files": 0, "ingested": 0, "unchanged": 0, "failed": 0, "skipped_ingested": 0, "skipped_failed": 0,
+            "skipped_conflict": 0, "pages": 0, "chunks": 0, "workers": self.workers, "failures": [],
+        }
+        durations: List[float] = []
+        from pipeline import Pipeline
+        # The only process that opens the vector store; Docling is only loaded by the workers
+        self._writer = Pipeline(parse=False)
+        context = multiprocessing.get_context("spawn")
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        started = time.perf_counter()
+        pending = self._plan(sources, report)
+        pool = ProcessPoolExecutor(self.workers, mp_context=context, initializer=_init_worker, initargs=(threads,))
+        in_flight: Dict[Any, Tuple[str, str, str]] = {}
+        try:
+            while True:
+                # Keep a bounded window queued so a huge archive isn't hashed/submitted up front
+                while len(in_flight) < self.workers * 2:
+                    job = next(pending, None)
+                    if job is None:
+                        break
+                    sha, path, doc_id, mode, partition = job
+                    self._record(sha, path, doc_id, "running", attempts=self._attempts(sha) + 1)
+                    in_flight[pool.submit(_prepare, path, mode, partition)] = (sha, path, doc_id)
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    sha, path, doc_id = in_flight.pop(future)
+                    try:
+                        result = self._commit(future.result())
+                    except BrokenProcessPool:
+                        broken = True
+                        result = {"status": "error", "message": "worker process died (out of memory?)"}
+                    self._finish(sha, path, doc_id, result, report, durations)
+                    completed = report["ingested"] + report["unchanged"] + report["failed"]
+                    if progress_every and completed % progress_every == 0:
+                        print(f"[bulk] {completed} done, {report['failed']} failed, "
+                              f"{completed / (time.perf_counter() - started) * 60:.1f} docs/min")
+                if broken:
+                    # A dead worker takes the whole pool down; the files it held fail too (retried next run)
+                    for sha, path, doc_id in in_flight.values():
+                        self._finish(sha, path, doc_id, {"status": "error", "message": "worker pool crashed"},
+                                     report, durations)
+                    in_flight.clear()
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = ProcessPoolExecutor(self.workers, mp_context=context, initializer=_init_worker,
+                                               initargs=(threads,))
+        except KeyboardInterrupt:
+            print("[bulk] Interrupted; in-flight files stay 'running' and are retried on the next run.")
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        pool.shutdown(wait=True)
+
+        elapsed = time.perf_counter() - started
+        durations.sort()
+        report.update({
+            "elapsed_s": round(elapsed, 1),
+            "docs_per_min": round(report["ingested"] / elapsed * 60, 2) if elapsed else 0,
+            "pages_per_s": round(report["pages"] / elapsed, 2) if elapsed else 0,
+            "doc_seconds": {
+                "p50": durations[len(durations) // 2] if durations else None,
+                "p95": durations[min(len(durations) - 1, int(len(durations) * 0.95))] if durations else None,
+                "max": durations[-1] if durations else None,
+            },
+        })
+        return report
+
+    def _finish(self, sha: str, path: str, doc_id: str, result: Dict[str, Any], report: Dict[str, Any],
+                durations: List[float]):
+        seconds = result.get("seconds")
+        if result.get("status") != "success":
+            error = str(result.get("message") or result.get("failed_pages") or "unknown error")[:500]
+            self._record(sha, path, doc_id, "failed", error=error, seconds=seconds)
+            report["failed"] += 1
+            report["failures"].append({"path": path, "error": error})
+            return
+        pages = (result.get("incremental") or {}).get("pages")
+        self._record(sha, path, doc_id, "done", error=None, pages=pages, chunks=result.get("chunks"), seconds=seconds)
+        if result.get("chunks") is None:
+            # Already in the store with identical pages (incremental re-ingest found nothing to do)
+            report["unchanged"] += 1
+            return
+        report["ingested"] += 1
+        report["pages"] += pages or 0
+        report["chunks"] += result["chunks"]
+        if seconds is not None:
+            durations.append(seconds)
+
+    def status(self) -> Dict[str, int]:
+        return dict(self._db.execute("SELECT status, COUNT(*) FROM files GROUP BY status").fetchall())
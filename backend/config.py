@@ -2,7 +2,7 @@ import os
 
 # Project Paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-DATA_DIR = os.path.join(BASE_DIR, "data")
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(BASE_DIR, "data"))
 
 # Static Storage (Served via HTTP)
 STATIC_DIR = os.path.join(DATA_DIR, "static")
@@ -11,7 +11,10 @@ IMAGE_DIR = os.path.join(STATIC_DIR, "images")
 
 # Internal Processing Paths
 PROCESSED_DIR = os.path.join(DATA_DIR, "processed")
+METADATA_DB_PATH = os.path.join(DATA_DIR, "metadata.sqlite")
 VECTOR_DB_DIR = os.path.join(DATA_DIR, "vectordb")
+SNAPSHOT_DIR = os.path.join(DATA_DIR, "snapshots")
+PACK_DIR = os.path.join(DATA_DIR, "packs")
 
 # Upload (Temporary)
 UPLOAD_DIR = os.path.join(DATA_DIR, "uploads")
@@ -22,6 +25,122 @@ UPLOAD_DIR = os.path.join(DATA_DIR, "uploads")
 # Model Configuration
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 
+# Vector Backend ("chroma" or "compact_ann")
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+
+# Chroma Client/Server Mode: the embedded store (PersistentClient on VECTOR_DB_DIR) and the
+# compact ANN index must only be opened by one process. Point every API worker at a Chroma
+# server instead to run more than one (gunicorn.conf.py enforces this).
+CHROMA_SERVER_HOST = os.getenv("CHROMA_SERVER_HOST", "")
+CHROMA_SERVER_PORT = int(os.getenv("CHROMA_SERVER_PORT", "8000"))
+
+# Vector Sharding
+VECTOR_SHARDS = int(os.getenv("VECTOR_SHARDS", "1"))
+VECTOR_SHARD_KEY = os.getenv("VECTOR_SHARD_KEY", "doc_id")  # "doc_id" (hashed) or a partition field such as "tenant"
+VECTOR_SHARD_WORKERS = int(os.getenv("VECTOR_SHARD_WORKERS", "8"))  # thread pool for fan-out queries
+
+# Compact ANN Backend (IVF over memory-mapped float16/int8 vectors)
+ANN_INDEX_DIR = os.path.join(DATA_DIR, "ann_index")
+ANN_VECTOR_DTYPE = os.getenv("ANN_VECTOR_DTYPE", "float16")  # "float16" or "int8"
+ANN_NLIST = int(os.getenv("ANN_NLIST", "256"))    # IVF partitions, trained once enough vectors exist
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "16"))   # partitions scanned per query
+
+# Search
+BATCH_SEARCH_MAX_QUERIES = int(os.getenv("BATCH_SEARCH_MAX_QUERIES", "1000"))
+BATCH_SYNTHESIS_CONCURRENCY = int(os.getenv("BATCH_SYNTHESIS_CONCURRENCY", "4"))  # parallel Gemini calls per batch
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "8"))  # thread pool for embedding + index lookups
+SEARCH_MAX_CONCURRENCY = int(os.getenv("SEARCH_MAX_CONCURRENCY", "64"))  # searches in flight per worker process
+SEARCH_MAX_QUEUE = int(os.getenv("SEARCH_MAX_QUEUE", "256"))  # searches waiting for a slot before 429
+SEARCH_QUEUE_TIMEOUT = float(os.getenv("SEARCH_QUEUE_TIMEOUT", "5"))  # seconds to wait for a slot before 429
+SEARCH_RETRIEVAL_TIMEOUT = float(os.getenv("SEARCH_RETRIEVAL_TIMEOUT", "10"))  # seconds
+SEARCH_LLM_TIMEOUT = float(os.getenv("SEARCH_LLM_TIMEOUT", "30"))  # seconds; retrieved sources are still returned
+
+# Ingestion Admission Control (per worker process; excess uploads get 429)
+INGEST_OCR_CONCURRENCY = int(os.getenv("INGEST_OCR_CONCURRENCY", "2"))  # Docling/OCR pipelines at once
+INGEST_OCR_QUEUE = int(os.getenv("INGEST_OCR_QUEUE", "8"))
+INGEST_GEMINI_CONCURRENCY = int(os.getenv("INGEST_GEMINI_CONCURRENCY", "1"))  # Gemini-mode uploads at once
+INGEST_GEMINI_QUEUE = int(os.getenv("INGEST_GEMINI_QUEUE", "4"))
+INGEST_QUEUE_TIMEOUT = float(os.getenv("INGEST_QUEUE_TIMEOUT", "60"))  # seconds an upload may wait for a slot
+
+# Knowledge Packs (custom_storage/knowledge_pack.py): portable export/import of ingested documents
+KNOWLEDGE_PACK_VECTOR_DTYPE = os.getenv("KNOWLEDGE_PACK_VECTOR_DTYPE", "float16")  # or "float32" for bit-exact vectors
+
+# Bulk Ingestion (python manage.py bulk-ingest; checkpoint state for resume)
+BULK_INGEST_WORKERS = int(os.getenv("BULK_INGEST_WORKERS", "2"))  # parse/embed processes, each with its own models; the parent alone writes the stores
+BULK_INGEST_STATE_PATH = os.getenv("BULK_INGEST_STATE_PATH", os.path.join(DATA_DIR, "bulk_ingest.sqlite"))
+
+# Table Pre-detection: Docling's table-structure model only runs on pages a cheap PyMuPDF pass flags
+DOCLING_TABLE_PREDETECT = os.getenv("DOCLING_TABLE_PREDETECT", "true").lower() == "true"
+DOCLING_TABLE_FULL_FRACTION = float(os.getenv("DOCLING_TABLE_FULL_FRACTION", "0.5"))  # above this share of candidate pages, run one full pass
+
+# Incremental Re-ingest: re-uploading a doc_id only re-parses pages whose fingerprint (text + coarse raster) changed
+INCREMENTAL_REINGEST = os.getenv("INCREMENTAL_REINGEST", "true").lower() == "true"
+
+# Page Renditions (data/static/pages/<doc_id>/)
+PAGE_THUMB_WIDTH = int(os.getenv("PAGE_THUMB_WIDTH", "256"))
+PAGE_SCREEN_WIDTH = int(os.getenv("PAGE_SCREEN_WIDTH", "1280"))
+PAGE_SCREEN_FORMAT = os.getenv("PAGE_SCREEN_FORMAT", "webp")  # "webp" or "jpeg"
+PAGE_IMAGE_QUALITY = int(os.getenv("PAGE_IMAGE_QUALITY", "80"))
+PAGE_FULL_DPI = int(os.getenv("PAGE_FULL_DPI", "300"))  # full renditions are only kept when Gemini reads the pages
+PAGE_KEEP_FULL = os.getenv("PAGE_KEEP_FULL", "false").lower() == "true"  # keep them for every document
+
+# Visual Citations
+CITATION_CACHE_DIR = os.path.join(DATA_DIR, "cache", "citations")
+CITATION_DPI = int(os.getenv("CITATION_DPI", "200"))
+CITATION_MAX_DPI = int(os.getenv("CITATION_MAX_DPI", "400"))
+CITATION_MEMORY_CACHE_MB = int(os.getenv("CITATION_MEMORY_CACHE_MB", "64"))
+CITATION_PDF_POOL = int(os.getenv("CITATION_PDF_POOL", "16"))  # open PDF handles kept for cropping
+CITATION_PRERENDER_TABLES = os.getenv("CITATION_PRERENDER_TABLES", "true").lower() == "true"
+
+# Artifact Garbage Collection
+GC_INTERVAL_SECONDS = int(os.getenv("GC_INTERVAL_SECONDS", "3600"))  # 0 disables the background collector
+GC_GRACE_SECONDS = int(os.getenv("GC_GRACE_SECONDS", "900"))  # files younger than this are never collected
+
 # API Keys
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "Gemini_API_Key")
 GEMINI_MODEL = "gemini-2.5-pro"
+
+# Answer Context Packing (modules/context.py)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))  # estimated tokens of context per answer (0 disables)
+CONTEXT_TABLE_MAX_ROWS = int(os.getenv("CONTEXT_TABLE_MAX_ROWS", "25"))  # table rows kept per hit, most query-relevant first
+
+# Extractive Answers: skip the LLM when retrieval is decisive (answer_mode=auto on /search)
+EXTRACTIVE_MIN_COVERAGE = float(os.getenv("EXTRACTIVE_MIN_COVERAGE", "0.8"))  # share of query terms the sentence must contain
+EXTRACTIVE_MAX_DISTANCE_RATIO = float(os.getenv("EXTRACTIVE_MAX_DISTANCE_RATIO", "0.8"))  # top-1 / top-2 distance; lower = clearer lead
+EXTRACTIVE_TOP_CHUNKS = int(os.getenv("EXTRACTIVE_TOP_CHUNKS", "3"))  # hits searched for the answer sentence
+
+# Semantic Answer Cache (custom_storage/answer_cache.py)
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", os.path.join(DATA_DIR, "cache", "answers.sqlite"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))  # cosine similarity to reuse an answer
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "86400"))  # seconds
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+
+# Gemini Gateway (every LLM call goes through modules/gemini_gateway.py)
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "")  # e.g. http://localhost:8089 to test against a stub server
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "120"))  # seconds per HTTP call
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))  # calls in flight per worker
+GEMINI_QUEUE = int(os.getenv("GEMINI_QUEUE", "256"))
+GEMINI_QUEUE_TIMEOUT = float(os.getenv("GEMINI_QUEUE_TIMEOUT", "300"))
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "150"))  # requests per minute per worker (0 disables)
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", "2000000"))  # estimated prompt tokens per minute per worker (0 disables)
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "4"))
+GEMINI_BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", "1.0"))  # seconds; doubles per attempt, full jitter
+GEMINI_BACKOFF_MAX = float(os.getenv("GEMINI_BACKOFF_MAX", "30"))
+GEMINI_BREAKER_THRESHOLD = int(os.getenv("GEMINI_BREAKER_THRESHOLD", "5"))  # consecutive failures to open
+GEMINI_BREAKER_COOLDOWN = float(os.getenv("GEMINI_BREAKER_COOLDOWN", "30"))
+# Images are sent inline, preprocessed ("inline"), or as the original file via the Files API ("upload"; A/B baseline)
+GEMINI_IMAGE_MODE = os.getenv("GEMINI_IMAGE_MODE", "inline")
+GEMINI_IMAGE_FORMAT = os.getenv("GEMINI_IMAGE_FORMAT", "webp")  # webp | jpeg
+GEMINI_IMAGE_QUALITY = int(os.getenv("GEMINI_IMAGE_QUALITY", "85"))
+GEMINI_OCR_MAX_SIDE = int(os.getenv("GEMINI_OCR_MAX_SIDE", "2048"))  # px; ~150 DPI on A4, enough for body text
+GEMINI_OCR_GRAYSCALE = os.getenv("GEMINI_OCR_GRAYSCALE", "true").lower() == "true"
+GEMINI_CAPTION_MAX_SIDE = int(os.getenv("GEMINI_CAPTION_MAX_SIDE", "768"))  # one Gemini image tile
+
+# Background Enrichment (modules/enrichment.py): Gemini figure captions / table summaries after ingest commits
+ENRICHMENT_DEFER_CAPTIONS = os.getenv("ENRICHMENT_DEFER_CAPTIONS", "true").lower() == "true"
+ENRICHMENT_DEFER_TABLE_SUMMARIES = os.getenv("ENRICHMENT_DEFER_TABLE_SUMMARIES", "true").lower() == "true"
+ENRICHMENT_WORKERS = int(os.getenv("ENRICHMENT_WORKERS", "2"))  # threads per API worker (0 = no worker in this process)
+ENRICHMENT_POLL_SECONDS = float(os.getenv("ENRICHMENT_POLL_SECONDS", "2"))
+ENRICHMENT_MAX_ATTEMPTS = int(os.getenv("ENRICHMENT_MAX_ATTEMPTS", "5"))
+ENRICHMENT_LEASE_SECONDS = float(os.getenv("ENRICHMENT_LEASE_SECONDS", "600"))  # a running job older than this was orphaned by a crash
@@ -0,0 +1,527 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+_WHERE_OPS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _where_sql(where: Dict[str, Any]):
+    """
+    Translates a Chroma-style `where` filter into a SQL clause over the rows table.
+    Supports equality, comparison operators, $in / $nin and nested $and / $or.
+    """
+    clauses, params = [], []
+    for key, cond in where.items():
+        if key in ("$and", "$or"):
+            parts = [_where_sql(sub) for sub in cond]
+            joiner = " AND " if key == "$and" else " OR "
+            clauses.append("(" + joiner.join(p[0] for p in parts) + ")")
+            for p in parts:
+                params.extend(p[1])
+            continue
+
+        if not key.replace("_", "").isalnum():
+            raise ValueError(f"Unsupported metadata key in filter: {key}")
+        column = "doc_id" if key == "doc_id" else f"json_extract(metadata, '$.{key}')"
+
+        if isinstance(cond, dict):
+            op, value = next(iter(cond.items()))
+        else:
+            op, value = "$eq", cond
+
+        if op in ("$in", "$nin"):
+            values = list(value)
+            if not values:
+                clauses.append("0" if op == "$in" else "1")
+                continue
+            neg = "NOT " if op == "$nin" else ""
+            clauses.append(f"{column} {neg}IN ({','.join('?' * len(values))})")
+            params.extend(values)
+        elif op in _WHERE_OPS:
+            clauses.append(f"{column} {_WHERE_OPS[op]} ?")
+            params.append(value)
+        else:
+            raise ValueError(f"Unsupported filter operator: {op}")
+
+    return " AND ".join(clauses) or "1", params
+
+
+class CompactANNCollection:
+    """
+    In-process IVF index over vectors stored as float16 or int8 in memory-mapped files.
+    Several worker processes opening the same directory share the page cache for the
+    vectors. Mirrors the subset of the Chroma collection API that VectorStore uses.
+
+    On-disk layout (one directory per collection):
+        header.json   - dim, dtype, row count, capacity
+        vectors.bin   - (capacity, dim) float16 / int8 vectors, L2-normalized
+        scales.bin    - (capacity,) float32 per-row scale (int8 only)
+        lists.bin     - (capacity,) int32 IVF partition per row (-1 = not yet assigned)
+        live.bin      - (capacity,) uint8 tombstone mask (0 = deleted)
+        centroids.npy - (nlist, dim) float32 IVF centroids, once trained
+        rows.sqlite   - ids, documents and metadata (WAL mode)
+    """
+
+    SCAN_BLOCK = 65536
+    TRAIN_POINTS_PER_LIST = 40
+
+    def __init__(self, name: str, path: str, embedding_function=None,
+                 dtype: str = "float16", nlist: int = 256, nprobe: int = 16):
+        if dtype not in ("float16", "int8"):
+            raise ValueError(f"Unsupported ANN vector dtype: {dtype}")
+
+        self.name = name
+        self.path = path
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self._embedding_function = embedding_function
+        self._lock = threading.RLock()
+        self._header_stamp = None
+        self._centroids = None
+        self._inverted = None
+
+        os.makedirs(self.path, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(self.path, "rows.sqlite"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rows ("
+            " row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, doc_id TEXT,"
+            " deleted INTEGER NOT NULL DEFAULT 0, document TEXT, metadata TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_rows_doc_id ON rows(doc_id)")
+        self._db.commit()
+
+        header_path = os.path.join(self.path, "header.json")
+        if os.path.exists(header_path):
+            self._load_header()
+        else:
+            self.header = {"dim": None, "dtype": dtype, "count": 0, "capacity": 0}
+            self._arrays = {}
+
+    # --- Storage plumbing ---
+
+    @contextmanager
+    def _write_lock(self):
+        """Serializes writers within the process and, where available, across processes."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.path, ".lock"), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._refresh()
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _header_path(self) -> str:
+        return os.path.join(self.path, "header.json")
+
+    def _load_header(self):
+        header_path = self._header_path()
+        with open(header_path, "r", encoding="utf-8") as f:
+            self.header = json.load(f)
+        st = os.stat(header_path)
+        self._header_stamp = (st.st_mtime_ns, st.st_size)
+        self._open_arrays()
+
+        centroid_path = os.path.join(self.path, "centroids.npy")
+        self._centroids = np.load(centroid_path) if os.path.exists(centroid_path) else None
+
+    def _save_header(self):
+        tmp = self._header_path() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.header, f)
+        os.replace(tmp, self._header_path())
+        st = os.stat(self._header_path())
+        self._header_stamp = (st.st_mtime_ns, st.st_size)
+
+    def _refresh(self):
+        """Picks up rows appended by other processes sharing this index."""
+        header_path = self._header_path()
+        if not os.path.exists(header_path):
+            return
+        st = os.stat(header_path)
+        if (st.st_mtime_ns, st.st_size) != self._header_stamp:
+            self._load_header()
+
+    def _array_specs(self) -> Dict[str, Any]:
+        dim = self.header["dim"]
+        specs = {
+            "vectors": (np.dtype(self.header["dtype"]), (dim,)),
+            "lists": (np.dtype(np.int32), ()),
+            "live": (np.dtype(np.uint8), ()),
+        }
+        if self.header["dtype"] == "int8":
+            specs["scales"] = (np.dtype(np.float32), ())
+        return specs
+
+    def _open_arrays(self):
+        self._arrays = {}
+        self._inverted = None
+        capacity = self.header["capacity"]
+        if not capacity:
+            return
+        for key, (dtype, tail) in self._array_specs().items():
+            self._arrays[key] = np.memmap(
+                os.path.join(self.path, f"{key}.bin"), dtype=dtype, mode="r+", shape=(capacity,) + tail
+            )
+
+    def _grow(self, needed: int):
+        capacity = self.header["capacity"]
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, 1024)
+        for arr in self._arrays.values():
+            arr.flush()
+        self._arrays = {}
+
+        for key, (dtype, tail) in self._array_specs().items():
+            row_bytes = dtype.itemsize * int(np.prod(tail or (1,)))
+            file_path = os.path.join(self.path, f"{key}.bin")
+            with open(file_path, "ab") as f:
+                f.truncate(new_capacity * row_bytes)
+            if key == "lists":
+                # New slots start unassigned
+                mm = np.memmap(file_path, dtype=dtype, mode="r+", shape=(new_capacity,))
+                mm[capacity:] = -1
+                mm.flush()
+                del mm
+
+        self.header["capacity"] = new_capacity
+        self._open_arrays()
+
+    # --- Quantization ---
+
+    def _encode(self, vectors: np.ndarray):
+        if self.header["dtype"] == "float16":
+            return vectors.astype(np.float16), None
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def _decode(self, rows: np.ndarray) -> np.ndarray:
+        block = np.asarray(self._arrays["vectors"][rows], dtype=np.float32)
+        if self.header["dtype"] == "int8":
+            block *= self._arrays["scales"][rows][:, None]
+        return block
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        if self._embedding_function is None:
+            raise ValueError("No embedding function configured; pass embeddings explicitly.")
+        return np.asarray(self._embedding_function(list(texts)), dtype=np.float32)
+
+    # --- IVF ---
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        if self._centroids is None:
+            return np.full(len(vectors), -1, dtype=np.int32)
+        return np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+
+    def _inverted_lists(self) -> List[np.ndarray]:
+        """
+        Row ids grouped by IVF list, ascending within each list; entry 0 holds the rows still
+        unassigned (list -1). Built once per index change rather than per query.
+        """
+        if self._inverted is None:
+            lists = np.asarray(self._arrays["lists"][: self.header["count"]])
+            order = np.argsort(lists, kind="stable")
+            bounds = np.searchsorted(lists[order], np.arange(-1, self.nlist + 1))
+            self._inverted = [order[bounds[i]:bounds[i + 1]] for i in range(self.nlist + 1)]
+        return self._inverted
+
+    def _maybe_train(self):
+        live_count = int(self._arrays["live"][: self.header["count"]].sum())
+        if self._centroids is not None or live_count < self.nlist * self.TRAIN_POINTS_PER_LIST:
+            return
+        self.train()
+
+    def train(self, iterations: int = 10, sample_size: Optional[int] = None):
+        """
+        Trains IVF centroids (spherical k-means on a sample) and assigns every live row.
+        Runs automatically once enough vectors exist; call again to rebalance after heavy churn.
+        """
+        with self._lock:
+            count = self.header["count"]
+            live_rows = np.flatnonzero(self._arrays["live"][:count]) if count else np.array([], dtype=np.int64)
+            if len(live_rows) < self.nlist:
+                return
+
+            rng = np.random.default_rng(0)
+            sample_size = sample_size or self.nlist * 256
+            sample_rows = np.sort(rng.choice(live_rows, size=min(sample_size, len(live_rows)), replace=False))
+            sample = self._decode(sample_rows)
+
+            centroids = sample[rng.choice(len(sample), size=self.nlist, replace=False)]
+            for _ in range(iterations):
+                labels = np.argmax(sample @ centroids.T, axis=1)
+                for c in range(self.nlist):
+                    members = sample[labels == c]
+                    if len(members):
+                        centroids[c] = members.mean(axis=0)
+                centroids = _normalize(centroids)
+
+            self._centroids = centroids.astype(np.float32)
+            np.save(os.path.join(self.path, "centroids.npy"), self._centroids)
+
+            lists = self._arrays["lists"]
+            for start in range(0, len(live_rows), self.SCAN_BLOCK):
+                rows = live_rows[start : start + self.SCAN_BLOCK]
+                lists[rows] = self._assign(self._decode(rows))
+            lists.flush()
+            self._inverted = None
+            self._save_header()
+            print(f"[ANN:{self.name}] Trained {self.nlist} IVF lists over {len(live_rows)} vectors.")
+
+    # --- Chroma-compatible API ---
+
+    def count(self) -> int:
+        with self._lock:
+            self._refresh()
+            count = self.header["count"]
+            return int(self._arrays["live"][:count].sum()) if count else 0
+
+    def add(self, ids: List[str], documents: Optional[List[str]] = None,
+            metadatas: Optional[List[Dict[str, Any]]] = None, embeddings=None):
+        if not ids:
+            return
+        documents = documents or [""] * len(ids)
+        metadatas = metadatas or [{} for _ in ids]
+        vectors = np.asarray(embeddings, dtype=np.float32) if embeddings is not None else self._embed(documents)
+        vectors = _normalize(vectors)
+
+        with self._write_lock():
+            if self.header["dim"] is None:
+                self.header["dim"] = int(vectors.shape[1])
+            elif vectors.shape[1] != self.header["dim"]:
+                raise ValueError(f"Embedding dim {vectors.shape[1]} != index dim {self.header['dim']}")
+
+            start = self.header["count"]
+            end = start + len(ids)
+            self._grow(end)
+
+            codes, scales = self._encode(vectors)
+            self._arrays["vectors"][start:end] = codes
+            if scales is not None:
+                self._arrays["scales"][start:end] = scales
+            self._arrays["lists"][start:end] = self._assign(vectors)
+            self._arrays["live"][start:end] = 1
+            self._inverted = None
+
+            with self._db:
+                # Ids of deleted rows can be reused (a re-ingested document); their slots stay dead
+                for i in range(0, len(ids), 500):
+                    batch = list(ids[i:i + 500])
+                    self._db.execute(f"DELETE FROM rows WHERE deleted = 1 AND id IN ({','.join('?' * len(batch))})", batch)
+                self._db.executemany(
+                    "INSERT INTO rows (row, id, doc_id, document, metadata) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (start + i, ids[i], (metadatas[i] or {}).get("doc_id"), documents[i], json.dumps(metadatas[i] or {}))
+                        for i in range(len(ids))
+                    ],
+                )
+
+            for arr in self._arrays.values():
+                arr.flush()
+            self.header["count"] = end
+            self._save_header()
+            self._maybe_train()
+
+    def _select_rows(self, ids=None, where=None, limit=None, offset=None,
+                     documents: bool = True, metadatas: bool = True) -> List[tuple]:
+        columns = f"row, id, {'document' if documents else 'NULL'}, {'metadata' if metadatas else 'NULL'}"
+        sql = f"SELECT {columns} FROM rows WHERE deleted = 0"
+        params: List[Any] = []
+        if ids is not None:
+            ids = list(ids)
+            if not ids:
+                return []
+            sql += f" AND id IN ({','.join('?' * len(ids))})"
+            params.extend(ids)
+        if where:
+            clause, where_params = _where_sql(where)
+            sql += f" AND {clause}"
+            params.extend(where_params)
+        sql += " ORDER BY row"
+        if limit is not None or offset:
+            sql += " LIMIT ? OFFSET ?"
+            params.extend([limit if limit is not None else -1, offset or 0])
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=None) -> Dict[str, Any]:
+        if include is None:
+            include = ["metadatas", "documents"]
+        with self._lock:
+            self._refresh()
+            rows = self._select_rows(ids, where, limit, offset,
+                                     documents="documents" in include, metadatas="metadatas" in include)
+            embeddings = None
+            if "embeddings" in include:
+                row_idx = np.array([r[0] for r in rows], dtype=np.int64)
+                embeddings = self._decode(row_idx) if len(row_idx) else np.zeros((0, self.header["dim"] or 0))
+        return {
+            "ids": [r[1] for r in rows],
+            "documents": [r[2] for r in rows] if "documents" in include else None,
+            "metadatas": [json.loads(r[3]) for r in rows] if "metadatas" in include else None,
+            "embeddings": embeddings,
+        }
+
+    def update(self, ids: List[str], documents: Optional[List[str]] = None,
+               metadatas: Optional[List[Dict[str, Any]]] = None, embeddings=None):
+        """Rewrites existing rows in place (same surface as Chroma's update); unknown ids are ignored."""
+        if not ids:
+            return
+        if embeddings is None and documents is not None:
+            embeddings = self._embed(documents)
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32)) if embeddings is not None else None
+
+        with self._write_lock():
+            rows = {r[1]: r[0] for r in self._select_rows(ids, documents=False, metadatas=False)}
+            positions = [i for i, chunk_id in enumerate(ids) if chunk_id in rows]
+            if not positions:
+                return
+            row_idx = np.array([rows[ids[i]] for i in positions], dtype=np.int64)
+            if vectors is not None:
+                codes, scales = self._encode(vectors[positions])
+                self._arrays["vectors"][row_idx] = codes
+                if scales is not None:
+                    self._arrays["scales"][row_idx] = scales
+                self._arrays["lists"][row_idx] = self._assign(vectors[positions])
+                self._inverted = None
+                for arr in self._arrays.values():
+                    arr.flush()
+            with self._db:
+                for i, row in zip(positions, row_idx.tolist()):
+                    if documents is not None:
+                        self._db.execute("UPDATE rows SET document = ? WHERE row = ?", (documents[i], row))
+                    if metadatas is not None:
+                        self._db.execute(
+                            "UPDATE rows SET doc_id = ?, metadata = ? WHERE row = ?",
+                            ((metadatas[i] or {}).get("doc_id"), json.dumps(metadatas[i] or {}), row)
+                        )
+            self._save_header()
+
+    def delete(self, ids=None, where=None):
+        with self._write_lock():
+            rows = [r[0] for r in self._select_rows(ids, where, documents=False, metadatas=False)]
+            if not rows:
+                return
+            with self._db:
+                self._db.executemany("UPDATE rows SET deleted = 1 WHERE row = ?", [(r,) for r in rows])
+            self._arrays["live"][np.array(rows, dtype=np.int64)] = 0
+            self._arrays["live"].flush()
+            self._save_header()
+
+    def _scan(self, queries: np.ndarray, candidates: np.ndarray, k: int):
+        """Exact top-k over `candidates` for a block of queries sharing the candidate set."""
+        n_q = len(queries)
+        best_scores = np.full((n_q, 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((n_q, 0), dtype=np.int64)
+
+        for start in range(0, len(candidates), self.SCAN_BLOCK):
+            rows = candidates[start : start + self.SCAN_BLOCK]
+            scores = queries @ self._decode(rows).T
+            take = min(k, len(rows))
+            top = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            best_rows = np.concatenate([best_rows, rows[top]], axis=1)
+
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+        order = np.argsort(-best_scores, axis=1)
+        return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+    def query(self, query_texts=None, query_embeddings=None, n_results: int = 10,
+              where=None, include=None) -> Dict[str, Any]:
+        if include is None:
+            include = ["metadatas", "documents", "distances"]
+        queries = np.asarray(query_embeddings, dtype=np.float32) if query_embeddings is not None else self._embed(query_texts)
+        queries = _normalize(queries)
+
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": [], "embeddings": None}
+
+        with self._lock:
+            self._refresh()
+            count = self.header["count"]
+            if not count or n_results <= 0:
+                for _ in queries:
+                    for key in ("ids", "documents", "metadatas", "distances"):
+                        results[key].append([])
+                return results
+
+            filtered = None
+            if where:
+                filtered = np.array([r[0] for r in self._select_rows(where=where, documents=False, metadatas=False)],
+                                    dtype=np.int64)
+
+            if self._centroids is None:
+                candidates = filtered if filtered is not None else np.flatnonzero(self._arrays["live"][:count])
+                hit_rows, hit_scores = self._scan(queries, candidates, n_results) if len(candidates) else (
+                    np.zeros((len(queries), 0), dtype=np.int64), np.zeros((len(queries), 0), dtype=np.float32))
+            else:
+                inverted = self._inverted_lists()
+                live = self._arrays["live"]
+                nprobe = min(self.nprobe, self.nlist)
+                probes = np.argpartition(-(queries @ self._centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+                hit_rows, hit_scores = [], []
+                for q, probe in zip(queries, probes):
+                    # Rows appended before training sit in list -1 until the next train()
+                    cand = np.concatenate([inverted[0]] + [inverted[p + 1] for p in probe])
+                    cand = cand[live[cand].astype(bool)]
+                    if filtered is not None:
+                        cand = np.intersect1d(cand, filtered, assume_unique=True)
+                        if len(cand) < n_results:
+                            # A selective filter can leave the probed lists short; its rows are few enough to scan
+                            cand = filtered
+                    r, s = self._scan(q[None, :], cand, n_results) if len(cand) else (
+                        np.zeros((1, 0), dtype=np.int64), np.zeros((1, 0), dtype=np.float32))
+                    hit_rows.append(r[0])
+                    hit_scores.append(s[0])
+
+            all_rows = sorted({int(r) for row_set in hit_rows for r in row_set})
+            columns = (f"row, id, {'document' if 'documents' in include else 'NULL'}, "
+                       f"{'metadata' if 'metadatas' in include else 'NULL'}")
+            lookup = {}
+            for start in range(0, len(all_rows), 900):
+                batch = all_rows[start : start + 900]
+                for row, chunk_id, document, metadata in self._db.execute(
+                    f"SELECT {columns} FROM rows WHERE row IN ({','.join('?' * len(batch))})", batch
+                ):
+                    lookup[row] = (chunk_id, document, json.loads(metadata) if metadata is not None else None)
+
+        for rows, scores in zip(hit_rows, hit_scores):
+            results["ids"].append([lookup[int(r)][0] for r in rows])
+            results["documents"].append([lookup[int(r)][1] for r in rows])
+            results["metadatas"].append([lookup[int(r)][2] for r in rows])
+            # Cosine distance (smaller is closer), the metric ChromaBackend creates its collections with
+            results["distances"].append([float(1.0 - s) for s in scores])
+        return results
+
+    def close(self):
+        with self._lock:
+            for arr in self._arrays.values():
+                arr.flush()
+            self._arrays = {}
+            self._db.close()
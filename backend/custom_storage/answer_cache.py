@@ -0,0 +1,255 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import List, Dict, Any, Optional
+import numpy as np
+from config import (
+    ANSWER_CACHE_PATH, ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_ENTRIES
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    scope TEXT NOT NULL,
+    query TEXT NOT NULL,
+    embedding BLOB NOT NULL,
+    response BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS answer_docs (
+    answer_id INTEGER NOT NULL,
+    doc_id TEXT NOT NULL,
+    version REAL,
+    PRIMARY KEY (answer_id, doc_id)
+);
+CREATE INDEX IF NOT EXISTS idx_answer_docs_doc ON answer_docs(doc_id);
+CREATE TABLE IF NOT EXISTS cache_meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER
+);
+CREATE TABLE IF NOT EXISTS deleted_answers (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    answer_id INTEGER NOT NULL
+);
+"""
+# A full cache is trimmed to this share of max_entries, so eviction runs once per batch of stores
+EVICTION_TARGET = 0.9
+# Deletion log rows kept for workers to catch up from; one lagging further reloads everything
+DELETION_LOG_ROWS = 20000
+
+
+class AnswerCache:
+    """
+    Semantic cache of synthesized answers, shared by all workers through SQLite.
+
+    A query hits when a prior query over the same scope (partition, mode, limit)
+    has cosine similarity >= `threshold` and is younger than `ttl` seconds. Each
+    entry records the documents its sources came from together with their
+    metadata-store `updated_at`, so re-ingesting or deleting any of them retires
+    the entry: explicitly through invalidate(), and by a version check on every
+    hit for changes made by another worker.
+
+    Query vectors are mirrored in memory. New rows are picked up incrementally, and
+    so are deletions, through a log of deleted ids that every worker replays.
+    """
+
+    def __init__(self, metadata_store, path: str = ANSWER_CACHE_PATH, threshold: float = ANSWER_CACHE_THRESHOLD,
+                 ttl: int = ANSWER_CACHE_TTL, max_entries: int = ANSWER_CACHE_MAX_ENTRIES):
+        self.metadata_store = metadata_store
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._scopes = np.zeros(0, dtype=object)
+        self._created = np.zeros(0, dtype=np.float64)
+        self._matrix: Optional[np.ndarray] = None
+        self._max_id = 0
+        self._deleted_seq = None
+        self.counters = {"hits": 0, "misses": 0, "stale": 0, "stored": 0}
+
+    @staticmethod
+    def scope_key(**scope) -> str:
+        return json.dumps(scope, sort_keys=True, default=str)
+
+    @staticmethod
+    def _unit(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    # --- Memory mirror ---
+
+    def _meta(self, key: str) -> int:
+        row = self._db.execute("SELECT value FROM cache_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def _sync(self):
+        if self._deleted_seq is None or self._deleted_seq < self._meta("log_floor"):
+            # First load, or deletions this worker missed were pruned from the log: reload everything
+            self._deleted_seq = self._db.execute("SELECT COALESCE(MAX(seq), 0) FROM deleted_answers").fetchone()[0]
+            self._max_id = 0
+            self._ids = np.zeros(0, dtype=np.int64)
+            self._scopes = np.zeros(0, dtype=object)
+            self._created = np.zeros(0, dtype=np.float64)
+            self._matrix = None
+        else:
+            deleted = self._db.execute(
+                "SELECT seq, answer_id FROM deleted_answers WHERE seq > ? ORDER BY seq", (self._deleted_seq,)
+            ).fetchall()
+            if deleted:
+                self._deleted_seq = deleted[-1][0]
+                keep = ~np.isin(self._ids, np.array([d[1] for d in deleted], dtype=np.int64))
+                if not keep.all():
+                    self._ids, self._scopes, self._created = self._ids[keep], self._scopes[keep], self._created[keep]
+                    self._matrix = self._matrix[keep] if self._matrix is not None and keep.any() else None
+        rows = self._db.execute(
+            "SELECT id, scope, embedding, created_at FROM answers WHERE id > ? ORDER BY id", (self._max_id,)
+        ).fetchall()
+        if not rows:
+            return
+        vectors = np.stack([np.frombuffer(blob, dtype=np.float32) for _, _, blob, _ in rows])
+        if self._matrix is not None and self._matrix.shape[1] != vectors.shape[1]:
+            self._matrix = None  # Embedding model changed; old rows are simply never matched again
+            self._ids, self._scopes, self._created = self._ids[:0], self._scopes[:0], self._created[:0]
+        self._matrix = vectors if self._matrix is None else np.vstack([self._matrix, vectors])
+        self._ids = np.concatenate([self._ids, np.array([r[0] for r in rows], dtype=np.int64)])
+        self._scopes = np.concatenate([self._scopes, np.array([r[1] for r in rows], dtype=object)])
+        self._created = np.concatenate([self._created, np.array([r[3] for r in rows], dtype=np.float64)])
+        self._max_id = int(self._ids[-1])
+
+    # --- Reads ---
+
+    def _is_current(self, answer_id: int) -> bool:
+        for doc_id, version in self._db.execute(
+            "SELECT doc_id, version FROM answer_docs WHERE answer_id = ?", (answer_id,)
+        ):
+            if self.metadata_store.updated_at(doc_id) != version:
+                return False
+        return True
+
+    def lookup(self, scope: str, embedding) -> Optional[Dict[str, Any]]:
+        """
+        Returns {"response", "similarity", "cached_query", "age_s"} for the closest
+        cached query in `scope`, or None when nothing clears the threshold.
+        """
+        query = self._unit(embedding)
+        with self._lock:
+            self._sync()
+            if self._matrix is None or self._matrix.shape[1] != query.shape[0]:
+                self.counters["misses"] += 1
+                return None
+            candidates = np.nonzero((self._scopes == scope) & (self._created > time.time() - self.ttl))[0]
+            if not len(candidates):
+                self.counters["misses"] += 1
+                return None
+            similarities = self._matrix[candidates] @ query
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                self.counters["misses"] += 1
+                return None
+
+            answer_id = int(self._ids[candidates[best]])
+            if not self._is_current(answer_id):
+                # A contributing document was re-ingested or deleted by another worker
+                self.counters["stale"] += 1
+                self.counters["misses"] += 1
+                with self._db:
+                    self._delete_answers([answer_id])
+                return None
+
+            row = self._db.execute(
+                "SELECT query, response, created_at FROM answers WHERE id = ?", (answer_id,)
+            ).fetchone()
+            if not row:
+                self.counters["misses"] += 1
+                return None
+            with self._db:
+                self._db.execute("UPDATE answers SET hits = hits + 1 WHERE id = ?", (answer_id,))
+            self.counters["hits"] += 1
+        return {
+            "response": json.loads(zlib.decompress(row[1]).decode("utf-8")),
+            "similarity": round(similarity, 4),
+            "cached_query": row[0],
+            "age_s": round(time.time() - row[2], 1),
+        }
+
+    # --- Writes ---
+
+    def store(self, scope: str, query: str, embedding, response: Dict[str, Any], doc_ids: List[str]):
+        """Caches `response` for `query`, tied to the current version of every doc in `doc_ids`."""
+        vector = self._unit(embedding)
+        blob = zlib.compress(json.dumps(response, default=str).encode("utf-8"))
+        doc_ids = sorted({d for d in doc_ids if d})
+        versions = [(doc_id, self.metadata_store.updated_at(doc_id)) for doc_id in doc_ids]
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "INSERT INTO answers (scope, query, embedding, response, created_at) VALUES (?, ?, ?, ?, ?)",
+                (scope, query, vector.tobytes(), blob, time.time())
+            )
+            self._db.executemany(
+                "INSERT INTO answer_docs (answer_id, doc_id, version) VALUES (?, ?, ?)",
+                [(cursor.lastrowid, doc_id, version) for doc_id, version in versions]
+            )
+            self.counters["stored"] += 1
+            # Keep the cache bounded: drop expired entries, and once over max_entries the
+            # oldest ones down to EVICTION_TARGET of it
+            expired = {r[0] for r in self._db.execute(
+                "SELECT id FROM answers WHERE created_at < ?", (time.time() - self.ttl,)
+            )}
+            if self._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0] - len(expired) > self.max_entries:
+                expired.update(r[0] for r in self._db.execute(
+                    "SELECT id FROM answers ORDER BY id DESC LIMIT -1 OFFSET ?",
+                    (int(self.max_entries * EVICTION_TARGET),)
+                ))
+            if expired:
+                self._delete_answers(sorted(expired))
+
+    def _delete_answers(self, answer_ids: List[int]):
+        """Deletes entries and logs them for the other workers; the caller holds the lock and an open transaction."""
+        for start in range(0, len(answer_ids), 500):  # Stay under SQLite's bound-parameter limit
+            batch = answer_ids[start:start + 500]
+            marks = ",".join("?" * len(batch))
+            self._db.execute(f"DELETE FROM answer_docs WHERE answer_id IN ({marks})", batch)
+            self._db.execute(f"DELETE FROM answers WHERE id IN ({marks})", batch)
+        self._db.executemany("INSERT INTO deleted_answers (answer_id) VALUES (?)", [(i,) for i in answer_ids])
+        last = self._db.execute("SELECT MAX(seq) FROM deleted_answers").fetchone()[0]
+        if last - self._meta("log_floor") > 2 * DELETION_LOG_ROWS:
+            floor = last - DELETION_LOG_ROWS
+            self._db.execute("DELETE FROM deleted_answers WHERE seq <= ?", (floor,))
+            self._db.execute(
+                "INSERT INTO cache_meta (key, value) VALUES ('log_floor', ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value", (floor,)
+            )
+
+    def invalidate(self, doc_id: Optional[str] = None) -> int:
+        """Drops every entry whose sources include `doc_id` (or every entry). Returns the count."""
+        with self._lock, self._db:
+            if doc_id is None:
+                ids = [r[0] for r in self._db.execute("SELECT id FROM answers")]
+            else:
+                ids = [r[0] for r in self._db.execute(
+                    "SELECT DISTINCT answer_id FROM answer_docs WHERE doc_id = ?", (doc_id,)
+                )]
+            if ids:
+                self._delete_answers(ids)
+        return len(ids)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, hits = self._db.execute("SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM answers").fetchone()
+            return {
+                "entries": entries, "lifetime_hits": hits, "threshold": self.threshold,
+                "ttl_s": self.ttl, "max_entries": self.max_entries, **self.counters,
+            }
@@ -0,0 +1,170 @@
+import os
+import time
+import uuid
+import shutil
+from typing import List
+import resources
+from config import (
+    VECTOR_BACKEND, VECTOR_DB_DIR, ANN_INDEX_DIR,
+    ANN_VECTOR_DTYPE, ANN_NLIST, ANN_NPROBE,
+    CHROMA_SERVER_HOST, CHROMA_SERVER_PORT
+)
+
+class ChromaBackend:
+    """
+    Persistent Chroma client (SQLite + HNSW on disk), or an HTTP client when
+    CHROMA_SERVER_HOST is set (the server owns the storage; `path` is unused).
+    """
+
+    def __init__(self, embedding_fn, path: str = VECTOR_DB_DIR):
+        self.path = path
+        self.embedding_fn = embedding_fn
+        if CHROMA_SERVER_HOST:
+            self.client = resources.chroma_http_client(CHROMA_SERVER_HOST, CHROMA_SERVER_PORT)
+        else:
+            self.client = resources.chroma_client(path)
+
+    # Cosine distances (1 - similarity), the metric CompactANNBackend returns
+    COLLECTION_METADATA = {"hnsw:space": "cosine"}
+
+    def get_or_create_collection(self, name: str):
+        try:
+            collection = self.client.get_collection(name=name, embedding_function=self.embedding_fn)
+        except Exception:  # Missing collection: ValueError or NotFoundError, depending on the Chroma release
+            return self.client.get_or_create_collection(name=name, embedding_function=self.embedding_fn,
+                                                        metadata=self.COLLECTION_METADATA)
+        # A collection's space is fixed at creation; older stores keep Chroma's default L2
+        space = (collection.metadata or {}).get("hnsw:space", "l2")
+        if space != "cosine":
+            print(f"Chroma collection '{name}' uses {space} distances, not cosine. "
+                  "Run `python manage.py compact` to rebuild it.")
+        return collection
+
+    def create_collection(self, name: str):
+        return self.client.create_collection(name=name, embedding_function=self.embedding_fn,
+                                             metadata=self.COLLECTION_METADATA)
+
+    def delete_collection(self, name: str):
+        self.client.delete_collection(name)
+
+    def list_collections(self) -> List[str]:
+        # Newer Chroma returns names, older releases return Collection objects
+        return [c if isinstance(c, str) else c.name for c in self.client.list_collections()]
+
+    def close(self):
+        # Chroma has no public close; dropping the client lets its SQLite handles be collected
+        self.client = None
+        if not CHROMA_SERVER_HOST:
+            resources.release_chroma_client(self.path)
+
+
+class CompactANNBackend:
+    """In-process IVF index with float16/int8 memory-mapped vectors (see ann_index.py)."""
+
+    def __init__(self, embedding_fn, path: str = ANN_INDEX_DIR):
+        self.path = path
+        self.embedding_fn = embedding_fn
+        self._collections = {}
+        os.makedirs(self.path, exist_ok=True)
+
+    def get_or_create_collection(self, name: str):
+        from custom_storage.ann_index import CompactANNCollection
+        if name not in self._collections:
+            self._collections[name] = CompactANNCollection(
+                name,
+                os.path.join(self.path, name),
+                embedding_function=self.embedding_fn,
+                dtype=ANN_VECTOR_DTYPE,
+                nlist=ANN_NLIST,
+                nprobe=ANN_NPROBE,
+            )
+        return self._collections[name]
+
+    def create_collection(self, name: str):
+        if os.path.exists(os.path.join(self.path, name)):
+            raise ValueError(f"Collection {name} already exists")
+        return self.get_or_create_collection(name)
+
+    def delete_collection(self, name: str):
+        collection = self._collections.pop(name, None)
+        if collection:
+            collection.close()
+        collection_dir = os.path.join(self.path, name)
+        if os.path.exists(collection_dir):
+            shutil.rmtree(collection_dir)
+
+    def list_collections(self) -> List[str]:
+        return sorted(
+            name for name in os.listdir(self.path)
+            if os.path.exists(os.path.join(self.path, name, "rows.sqlite"))
+        )
+
+    def close(self):
+        for collection in self._collections.values():
+            collection.close()
+        self._collections = {}
+
+
+BACKENDS = {
+    "chroma": ChromaBackend,
+    "compact_ann": CompactANNBackend,
+}
+
+BACKEND_ROOTS = {
+    "chroma": VECTOR_DB_DIR,
+    "compact_ann": ANN_INDEX_DIR,
+}
+
+# --- Generations ---
+# Compaction and restore build a fresh store in a sibling "gen-*" directory and then
+# flip the CURRENT pointer, so the live store is never rewritten in place.
+
+def backend_root(name: str = None) -> str:
+    return BACKEND_ROOTS[name or VECTOR_BACKEND]
+
+def active_path(root: str) -> str:
+    """Directory of the live generation (the root itself for stores that predate generations)."""
+    pointer = os.path.join(root, "CURRENT")
+    if os.path.exists(pointer):
+        with open(pointer, "r", encoding="utf-8") as f:
+            generation = f.read().strip()
+        if generation and os.path.isdir(os.path.join(root, generation)):
+            return os.path.join(root, generation)
+    return root
+
+def new_generation_path(root: str) -> str:
+    return os.path.join(root, f"gen-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}")
+
+def set_active_generation(root: str, generation_path: str):
+    pointer = os.path.join(root, "CURRENT")
+    with open(pointer + ".tmp", "w", encoding="utf-8") as f:
+        f.write(os.path.basename(generation_path))
+    os.replace(pointer + ".tmp", pointer)
+
+def remove_generation(root: str, path: str):
+    """Deletes a retired generation. For the legacy root layout, removes everything except gen-* dirs."""
+    if os.path.abspath(path) != os.path.abspath(root):
+        shutil.rmtree(path, ignore_errors=True)
+        return
+    for name in os.listdir(root):
+        if name.startswith("gen-") or name == "CURRENT":
+            continue
+        target = os.path.join(root, name)
+        if os.path.isdir(target):
+            shutil.rmtree(target, ignore_errors=True)
+        else:
+            os.remove(target)
+
+def uses_server(name: str = None) -> bool:
+    """
+    True when the vector store lives in a separate server process. Only then may
+    several processes (API workers) open it, and there are no local generations to swap.
+    """
+    return (name or VECTOR_BACKEND) == "chroma" and bool(CHROMA_SERVER_HOST)
+
+def create_backend(embedding_fn, name: str = None, path: str = None):
+    """Builds the vector backend selected by config.VECTOR_BACKEND, opened on its live generation."""
+    name = name or VECTOR_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown VECTOR_BACKEND '{name}'. Options: {', '.join(BACKENDS)}")
+    return BACKENDS[name](embedding_fn, path or active_path(BACKEND_ROOTS[name]))
@@ -0,0 +1,200 @@
+import os
+import shutil
+import threading
+import time
+from typing import List, Dict, Any, Callable, Optional
+from config import (
+    DATA_DIR, STATIC_DIR, PDF_DIR, IMAGE_DIR, PROCESSED_DIR,
+    METADATA_DB_PATH, SNAPSHOT_DIR, GC_GRACE_SECONDS
+)
+from custom_storage.metadata import figure_doc_id, doc_id_from_filename
+from custom_storage.backends import backend_root
+from custom_storage.snapshot import dir_size
+
+PAGES_DIR = os.path.join(STATIC_DIR, "pages")
+
+def _legacy_json_doc_id(name: str) -> Optional[str]:
+    for suffix in ("_tables.json", "_images.json"):
+        if name.endswith(suffix):
+            return name[: -len(suffix)]
+    return None
+
+def _pdf_doc_id(name: str) -> Optional[str]:
+    return doc_id_from_filename(name) if name.lower().endswith(".pdf") else None
+
+def _page_dir_doc_id(name: str) -> Optional[str]:
+    return name if os.path.isdir(os.path.join(PAGES_DIR, name)) else None
+
+def _entry_size(path: str) -> int:
+    if os.path.isdir(path):
+        return dir_size(path)
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class ArtifactCollector:
+    """
+    Reconciles on-disk artifacts (data/static, data/processed) and the vector store
+    against the live document registry in the metadata store, and reports disk usage.
+
+    Each artifact rule maps a directory entry back to the doc_id that owns it; entries
+    whose doc_id is not registered are orphans. Files younger than GC_GRACE_SECONDS are
+    never collected, so a half-written upload is safe even before it is registered.
+    """
+
+    def __init__(self, vector_store, metadata_store, grace_seconds: int = GC_GRACE_SECONDS):
+        self.vector_store = vector_store
+        self.metadata_store = metadata_store
+        self.grace_seconds = grace_seconds
+        # (kind, directory, entry name -> owning doc_id or None)
+        self.rules: List[tuple] = [
+            ("pdfs", PDF_DIR, _pdf_doc_id),
+            ("pages", PAGES_DIR, _page_dir_doc_id),
+            ("figures", IMAGE_DIR, figure_doc_id),
+            ("processed", PROCESSED_DIR, _legacy_json_doc_id),
+            ("processed", os.path.join(PROCESSED_DIR, "json_backup"), _legacy_json_doc_id),
+        ]
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_rule(self, kind: str, directory: str, owner: Callable[[str], Optional[str]]):
+        """Registers another per-document artifact directory with the collector."""
+        self.rules.append((kind, directory, owner))
+
+    def _live_doc_ids(self) -> set:
+        # Stores that predate the registry: adopt every document already in the vector store once
+        self.metadata_store.seed_documents(lambda: list(self.vector_store.chunk_counts()))
+        return set(self.metadata_store.list_documents())
+
+    def _scan(self):
+        """Yields (kind, path, doc_id, size, mtime) for every artifact that maps to a document."""
+        for kind, directory, owner in self.rules:
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                doc_id = owner(name)
+                if not doc_id:
+                    continue
+                try:
+                    mtime = os.path.getmtime(path)
+                except OSError:
+                    continue  # Removed while scanning
+                yield kind, path, doc_id, _entry_size(path), mtime
+
+    # --- Collection ---
+
+    def collect(self, dry_run: bool = False) -> Dict[str, Any]:
+        """Removes artifacts, vector chunks and metadata rows that belong to no live document."""
+        if not self._run_lock.acquire(blocking=False):
+            return {"status": "busy", "message": "A collection is already running."}
+        try:
+            started = time.time()
+            live = self._live_doc_ids()
+            cutoff = started - self.grace_seconds
+
+            files: List[Dict[str, Any]] = []
+            reclaimed = 0
+            for kind, path, doc_id, size, mtime in self._scan():
+                if doc_id in live or mtime > cutoff:
+                    continue
+                if not dry_run:
+                    if os.path.isdir(path):
+                        shutil.rmtree(path, ignore_errors=True)
+                    elif os.path.exists(path):
+                        os.remove(path)
+                files.append({"kind": kind, "path": os.path.relpath(path, DATA_DIR), "doc_id": doc_id, "bytes": size})
+                reclaimed += size
+
+            orphan_vectors = sorted(d for d in self.vector_store.chunk_counts() if d not in live)
+            if not dry_run:
+                for doc_id in orphan_vectors:
+                    self.vector_store.delete_document(doc_id)
+            orphan_rows = self.metadata_store.delete_orphan_rows(dry_run=dry_run)
+
+            result = {
+                "status": "success",
+                "dry_run": dry_run,
+                "live_documents": len(live),
+                "orphan_files": files,
+                "orphan_vector_documents": orphan_vectors,
+                "orphan_metadata_documents": orphan_rows,
+                "reclaimed_bytes": reclaimed,
+                "elapsed_ms": round((time.time() - started) * 1000, 1),
+                "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+            if not dry_run:
+                self.last_run = result
+                if files or orphan_vectors or orphan_rows:
+                    print(f"GC: removed {len(files)} files ({reclaimed} bytes), "
+                          f"{len(orphan_vectors)} vector docs, {len(orphan_rows)} metadata docs")
+            return result
+        finally:
+            self._run_lock.release()
+
+    # --- Accounting ---
+
+    def usage(self) -> Dict[str, Any]:
+        """Disk usage per document and per storage area."""
+        live = self._live_doc_ids()
+        chunks = self.vector_store.chunk_counts()
+        metadata_bytes = self.metadata_store.artifact_bytes()
+
+        documents: Dict[str, Dict[str, Any]] = {}
+        def entry(doc_id: str) -> Dict[str, Any]:
+            return documents.setdefault(doc_id, {
+                "doc_id": doc_id, "live": doc_id in live, "bytes": 0,
+                "pdfs": 0, "pages": 0, "figures": 0, "processed": 0,
+                "metadata": metadata_bytes.get(doc_id, 0), "chunks": chunks.get(doc_id, 0),
+            })
+
+        for doc_id in live | set(chunks) | set(metadata_bytes):
+            entry(doc_id)
+        for kind, _, doc_id, size, _ in self._scan():
+            doc = entry(doc_id)
+            doc[kind] = doc.get(kind, 0) + size
+        for doc in documents.values():
+            doc["bytes"] = sum(v for k, v in doc.items() if k not in ("doc_id", "live", "bytes", "chunks"))
+
+        areas = {
+            "pdfs": dir_size(PDF_DIR),
+            "pages": dir_size(PAGES_DIR),
+            "figures": dir_size(IMAGE_DIR),
+            "static_total": dir_size(STATIC_DIR),
+            "processed": dir_size(PROCESSED_DIR),
+            "vector_store": dir_size(backend_root()),
+            "snapshots": dir_size(SNAPSHOT_DIR),
+            "metadata_db": sum(_entry_size(METADATA_DB_PATH + suffix) for suffix in ("", "-wal", "-shm")),
+        }
+        return {
+            "total_bytes": dir_size(DATA_DIR),
+            "areas": areas,
+            "documents": sorted(documents.values(), key=lambda d: d["bytes"], reverse=True),
+            "orphan_documents": sorted(d for d in documents if d not in live),
+            "last_gc": self.last_run,
+        }
+
+    # --- Background ---
+
+    def start(self, interval_seconds: int):
+        """Runs collect() every `interval_seconds` on a daemon thread (0 disables)."""
+        if interval_seconds <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval_seconds):
+                try:
+                    self.collect()
+                except Exception as e:
+                    print(f"GC: background collection failed: {e}")
+
+        self._thread = threading.Thread(target=loop, name="artifact-gc", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
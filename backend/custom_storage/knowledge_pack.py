@@ -0,0 +1,279 @@
+"""
+Knowledge packs: everything a node needs to serve some documents, without
+re-running OCR, Gemini or the embedding model.
+
+A pack is one zip file (PACK_DIR/<name>.pack) holding:
+    manifest.json               - format version, embedding model, documents
+    <shard>.vectors.npy / .rows.jsonl.gz
+                                - chunks with their vectors (snapshot format)
+    documents.vectors.npy / .rows.jsonl.gz
+                                - document centroids for two-stage search
+    documents.jsonl.gz          - per document: tables, figures, ingest stats,
+                                  page fingerprints, unfinished enrichment jobs
+    static/pdfs|pages|images/   - original PDF, page renditions, figures
+Vectors are stored as KNOWLEDGE_PACK_VECTOR_DTYPE. Import refuses packs built
+with a different embedding model, since their vectors would not match queries.
+"""
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from typing import Any, Dict, List, Optional
+import numpy as np
+from custom_storage.metadata import doc_id_from_filename, figure_doc_id
+from modules.renditions import pages_dir
+from config import EMBEDDING_MODEL, GEMINI_MODEL, PDF_DIR, IMAGE_DIR, PACK_DIR, KNOWLEDGE_PACK_VECTOR_DTYPE
+
+PACK_FORMAT = "intel-nexus-pack"
+PACK_VERSION = 1
+# Already-compressed members are stored as is
+STORED_SUFFIXES = (".gz", ".npy", ".jpg", ".jpeg", ".png", ".webp")
+
+
+def pack_path(name: str) -> str:
+    if not name or os.path.basename(name) != name or name.startswith("."):
+        raise ValueError(f"Invalid pack name: {name!r}")
+    return os.path.join(PACK_DIR, name if name.endswith(".pack") else f"{name}.pack")
+
+
+def read_pack_manifest(path: str) -> Dict[str, Any]:
+    with zipfile.ZipFile(path) as pack:
+        return json.loads(pack.read("manifest.json"))
+
+
+def list_packs() -> List[Dict[str, Any]]:
+    if not os.path.exists(PACK_DIR):
+        return []
+    packs = []
+    for name in sorted(os.listdir(PACK_DIR)):
+        if not name.endswith(".pack"):
+            continue
+        path = os.path.join(PACK_DIR, name)
+        try:
+            manifest = read_pack_manifest(path)
+        except (zipfile.BadZipFile, KeyError, ValueError):
+            continue
+        packs.append({
+            "name": name[: -len(".pack")],
+            "created_at": manifest.get("created_at"),
+            "embedding_model": manifest.get("embedding_model"),
+            "documents": len(manifest.get("documents", [])),
+            "size_bytes": os.path.getsize(path),
+        })
+    return packs
+
+
+def _static_files(doc_id: str) -> Dict[str, str]:
+    """Pack member name -> local path of a document's static artifacts."""
+    files = {}
+    if os.path.exists(PDF_DIR):
+        for name in os.listdir(PDF_DIR):
+            if doc_id_from_filename(name) == doc_id:
+                files[f"static/pdfs/{name}"] = os.path.join(PDF_DIR, name)
+    if os.path.isdir(pages_dir(doc_id)):
+        for name in os.listdir(pages_dir(doc_id)):
+            files[f"static/pages/{doc_id}/{name}"] = os.path.join(pages_dir(doc_id), name)
+    if os.path.exists(IMAGE_DIR):
+        for name in os.listdir(IMAGE_DIR):
+            if figure_doc_id(name) == doc_id:
+                files[f"static/images/{name}"] = os.path.join(IMAGE_DIR, name)
+    return files
+
+
+def export_pack(vector_store, metadata_store, name: Optional[str] = None,
+                doc_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Writes the given documents (default: every registered one) to PACK_DIR/<name>.pack."""
+    name = name or time.strftime("pack-%Y%m%d-%H%M%S")
+    path = pack_path(name)
+    if os.path.exists(path):
+        raise ValueError(f"Pack '{name}' already exists")
+    known = set(metadata_store.list_documents())
+    doc_ids = list(dict.fromkeys(doc_ids)) if doc_ids else sorted(known)
+    missing = [d for d in doc_ids if d not in known]
+    if missing:
+        raise ValueError(f"Unknown documents: {', '.join(missing)}")
+    if not doc_ids:
+        raise ValueError("No documents to export")
+
+    start = time.perf_counter()
+    os.makedirs(PACK_DIR, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=PACK_DIR) as work:
+        collections = vector_store.export_documents(work, doc_ids, dtype=np.dtype(KNOWLEDGE_PACK_VECTOR_DTYPE))
+        static: Dict[str, str] = {}
+        documents = []
+        with gzip.open(os.path.join(work, "documents.jsonl.gz"), "wt", encoding="utf-8") as out:
+            for doc_id in doc_ids:
+                fingerprints = metadata_store.page_fingerprints(doc_id)
+                entry = {
+                    "doc_id": doc_id,
+                    "ingest_stats": metadata_store.ingest_stats(doc_id),
+                    "page_fingerprints": [fingerprints.get(p, "") for p in range(1, max(fingerprints, default=0) + 1)],
+                    "tables": metadata_store.load_tables(doc_id),
+                    "images": metadata_store.load_images(doc_id),
+                    "enrichment": metadata_store.outstanding_enrichment(doc_id),
+                }
+                out.write(json.dumps(entry, default=str) + "\n")
+                files = _static_files(doc_id)
+                static.update(files)
+                documents.append({"doc_id": doc_id, "tables": len(entry["tables"]), "images": len(entry["images"]),
+                                  "files": len(files)})
+        chunk_counts: Dict[str, int] = {}
+        for cname in collections:
+            if cname == "documents":
+                continue
+            with gzip.open(os.path.join(work, f"{cname}.rows.jsonl.gz"), "rt", encoding="utf-8") as rows:
+                for line in rows:
+                    doc_id = json.loads(line)["metadata"].get("doc_id")
+                    chunk_counts[doc_id] = chunk_counts.get(doc_id, 0) + 1
+        for doc in documents:
+            doc["chunks"] = chunk_counts.get(doc["doc_id"], 0)
+        manifest = {
+            "format": PACK_FORMAT,
+            "version": PACK_VERSION,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "embedding_model": EMBEDDING_MODEL,
+            "gemini_model": GEMINI_MODEL,
+            "vector_dtype": KNOWLEDGE_PACK_VECTOR_DTYPE,
+            "dim": next((c["dim"] for c in collections.values() if c.get("dim")), None),
+            "collections": collections,
+            "documents": documents,
+        }
+
+        partial = path + ".partial"
+        with zipfile.ZipFile(partial, "w") as pack:
+            pack.writestr("manifest.json", json.dumps(manifest, indent=2), compress_type=zipfile.ZIP_DEFLATED)
+            for member in sorted(os.listdir(work)):
+                pack.write(os.path.join(work, member), member, compress_type=_compression(member))
+            for member, local in sorted(static.items()):
+                if os.path.exists(local):  # Removed meanwhile (e.g. a re-ingest dropping a page)
+                    pack.write(local, member, compress_type=_compression(member))
+        os.replace(partial, path)
+
+    return {
+        "name": os.path.basename(path)[: -len(".pack")],
+        "path": path,
+        "documents": len(doc_ids),
+        "chunks": sum(chunk_counts.values()),
+        "size_bytes": os.path.getsize(path),
+        "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+
+
+def _compression(member: str) -> int:
+    return zipfile.ZIP_STORED if member.lower().endswith(STORED_SUFFIXES) else zipfile.ZIP_DEFLATED
+
+
+def _extract(pack: zipfile.ZipFile, dest: str):
+    root = os.path.realpath(dest)
+    for member in pack.namelist():
+        target = os.path.realpath(os.path.join(dest, member))
+        if not target.startswith(root + os.sep):
+            raise ValueError(f"Unsafe path in pack: {member}")
+    pack.extractall(dest)
+
+
+def import_pack(vector_store, metadata_store, path: str, partition: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Loads a pack into the stores without re-embedding. Documents already present
+    are replaced. `partition` overrides the packed partition (shard routing).
+    Returns the imported doc_ids so callers can drop their caches.
+    """
+    if not os.path.exists(path):
+        raise ValueError(f"Pack not found: {path}")
+    start = time.perf_counter()
+    with zipfile.ZipFile(path) as pack:
+        manifest = json.loads(pack.read("manifest.json"))
+        if manifest.get("format") != PACK_FORMAT or manifest.get("version", 0) > PACK_VERSION:
+            raise ValueError(f"Unsupported pack format: {manifest.get('format')} v{manifest.get('version')}")
+        if manifest.get("embedding_model") != EMBEDDING_MODEL:
+            raise ValueError(
+                f"Pack was built with '{manifest.get('embedding_model')}', current model is '{EMBEDDING_MODEL}'"
+            )
+        os.makedirs(PACK_DIR, exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=PACK_DIR) as work:
+            _extract(pack, work)
+            with gzip.open(os.path.join(work, "documents.jsonl.gz"), "rt", encoding="utf-8") as f:
+                entries = [json.loads(line) for line in f]
+            doc_ids = [e.get("doc_id") for e in entries]
+            _validate(manifest["collections"], doc_ids, work)
+
+            # Registered first so the artifact collector leaves the incoming files alone
+            for doc_id in doc_ids:
+                metadata_store.register_document(doc_id)
+            loaded = vector_store.import_documents(work, manifest["collections"], doc_ids, partition=partition)
+            for entry in entries:
+                _restore_document(metadata_store, entry, work, partition)
+        size = os.path.getsize(path)
+
+    return {
+        "status": "success",
+        "doc_ids": doc_ids,
+        "chunks": loaded["chunks"],
+        "embedding_model": manifest["embedding_model"],
+        "size_bytes": size,
+        "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+
+
+def _validate(collections: Dict[str, Any], doc_ids: List[Any], work: str):
+    """
+    doc_ids become directory names on import, so only ones an upload could produce
+    are accepted, and every packed vector row must belong to one of them.
+    """
+    for doc_id in doc_ids:
+        if not isinstance(doc_id, str) or not doc_id or doc_id_from_filename(doc_id) != doc_id:
+            raise ValueError(f"Invalid doc_id in pack: {doc_id!r}")
+    known = set(doc_ids)
+    for cname in collections:
+        if os.path.basename(cname) != cname or cname.startswith("."):
+            raise ValueError(f"Invalid collection name in pack: {cname!r}")
+        with gzip.open(os.path.join(work, f"{cname}.rows.jsonl.gz"), "rt", encoding="utf-8") as rows:
+            for line in rows:
+                doc_id = (json.loads(line).get("metadata") or {}).get("doc_id")
+                if doc_id not in known:
+                    raise ValueError(f"Pack collection '{cname}' holds rows of an unlisted document: {doc_id!r}")
+
+
+def _copy_files(src: str, dest: str, belongs):
+    if not os.path.isdir(src):
+        return
+    os.makedirs(dest, exist_ok=True)
+    for name in os.listdir(src):
+        if belongs(name):
+            shutil.copy2(os.path.join(src, name), os.path.join(dest, name))
+
+
+def _restore_document(metadata_store, entry: Dict[str, Any], work: str, partition: Optional[str]):
+    doc_id = entry["doc_id"]
+    # Static files replace the node's current copies
+    if os.path.isdir(pages_dir(doc_id)):
+        shutil.rmtree(pages_dir(doc_id))
+    if os.path.exists(IMAGE_DIR):
+        for name in os.listdir(IMAGE_DIR):
+            if figure_doc_id(name) == doc_id:
+                os.remove(os.path.join(IMAGE_DIR, name))
+    static = os.path.join(work, "static")
+    _copy_files(os.path.join(static, "pdfs"), PDF_DIR, lambda name: doc_id_from_filename(name) == doc_id)
+    _copy_files(os.path.join(static, "pages", doc_id), pages_dir(doc_id), lambda name: True)
+    _copy_files(os.path.join(static, "images"), IMAGE_DIR, lambda name: figure_doc_id(name) == doc_id)
+
+    # Figure paths were absolute on the exporting node
+    images = [dict(img, path=os.path.join(IMAGE_DIR, img["image_id"])) if img.get("path") else img
+              for img in entry["images"]]
+    metadata_store.save_artifacts(doc_id, entry["tables"], images)
+    stats = dict(entry.get("ingest_stats") or {}, imported_at=time.strftime("%Y-%m-%dT%H:%M:%S"))
+    if partition:
+        stats["partition"] = partition
+    metadata_store.save_ingest_stats(doc_id, stats)
+    metadata_store.save_page_fingerprints(doc_id, entry.get("page_fingerprints") or [])
+    jobs = []
+    for job in entry.get("enrichment") or []:
+        payload = dict(job["payload"])
+        if payload.get("path"):
+            payload["path"] = os.path.join(IMAGE_DIR, os.path.basename(payload["path"]))
+        jobs.append({"kind": job["kind"], "payload": payload})
+    if jobs:
+        metadata_store.enqueue_enrichment(doc_id, jobs)
@@ -1,81 +1,592 @@
 import json
 import os
-from typing import List, Dict, Any
-from config import PROCESSED_DIR
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import zlib
+from typing import List, Dict, Any, Optional
+from config import PROCESSED_DIR, METADATA_DB_PATH
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id TEXT PRIMARY KEY,
+    updated_at REAL NOT NULL,
+    ingest_stats TEXT
+);
+CREATE TABLE IF NOT EXISTS doc_tables (
+    doc_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    page INTEGER,
+    n_rows INTEGER,
+    n_cols INTEGER,
+    headers TEXT,
+    bbox TEXT,
+    cells BLOB,
+    column_types TEXT,
+    typed_cells BLOB,
+    PRIMARY KEY (doc_id, idx)
+);
+CREATE INDEX IF NOT EXISTS idx_doc_tables_page ON doc_tables(doc_id, page);
+CREATE TABLE IF NOT EXISTS doc_images (
+    doc_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    page INTEGER,
+    image_id TEXT,
+    caption TEXT,
+    extra TEXT,
+    PRIMARY KEY (doc_id, idx)
+);
+CREATE INDEX IF NOT EXISTS idx_doc_images_page ON doc_images(doc_id, page);
+CREATE TABLE IF NOT EXISTS store_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS enrichment_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    doc_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_enrichment_status ON enrichment_jobs(status, not_before);
+CREATE INDEX IF NOT EXISTS idx_enrichment_doc ON enrichment_jobs(doc_id);
+CREATE TABLE IF NOT EXISTS page_fingerprints (
+    doc_id TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    fingerprint TEXT NOT NULL,
+    PRIMARY KEY (doc_id, page)
+);
+"""
+
+# Extracted figures are written by VisionProcessor as {doc_id}_page{n}_img{k}.{ext}
+FIGURE_NAME_RE = re.compile(r"^(?P<doc_id>.+?)_page\d+_img\d+\.\w+$")
+
+def figure_doc_id(filename: str) -> Optional[str]:
+    match = FIGURE_NAME_RE.match(filename)
+    return match.group("doc_id") if match else None
+
+def doc_id_from_filename(filename: str) -> str:
+    """The doc_id the pipeline derives from an uploaded PDF's filename."""
+    doc_id = filename.replace(".pdf", "").strip().replace(" ", "_")
+    return "".join(c for c in doc_id if c.isalnum() or c in ("_", "-")).strip()
+
+def encode_cells(rows: List[List[Any]]) -> bytes:
+    """Row-major cells -> zlib-compressed column-major JSON (columns compress far better than rows)."""
+    width = max((len(r) for r in rows), default=0)
+    padded = [list(r) + [None] * (width - len(r)) for r in rows]
+    columns = [list(col) for col in zip(*padded)] if padded else []
+    return zlib.compress(json.dumps(columns, separators=(",", ":"), default=str).encode("utf-8"))
+
+def decode_cells(blob: bytes) -> List[List[Any]]:
+    columns = json.loads(zlib.decompress(blob).decode("utf-8")) if blob else []
+    return [list(row) for row in zip(*columns)]
+
+_NUMBER_RE = re.compile(r"^\(?\s*([-+]?)\s*[$€£₹]?\s*([-+]?[\d,]*\.?\d+)\s*(%?)\s*\)?$")
+
+def parse_number(value: Any) -> Optional[float]:
+    """Parses table-style numbers: '1,234', '$5.2', '(12)' (negative), '12%'. Returns None if not numeric."""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    match = _NUMBER_RE.match(text)
+    if not match:
+        return None
+    try:
+        number = float(match.group(2).replace(",", ""))
+    except ValueError:
+        return None
+    if match.group(1) == "-" or (text.startswith("(") and text.endswith(")")):
+        number = -number
+    return number
+
+def type_columns(rows: List[List[Any]]):
+    """
+    Infers a type per column ("integer", "real" or "text") and returns
+    (column_types, typed_columns). A column is numeric when at least 80%
+    of its non-empty cells parse as numbers; the rest become NULL.
+    """
+    width = max((len(r) for r in rows), default=0)
+    column_types, typed_columns = [], []
+    for j in range(width):
+        raw = [r[j] if j < len(r) else None for r in rows]
+        non_empty = [v for v in raw if v is not None and str(v).strip() not in ("", "nan", "None", "-")]
+        parsed = [parse_number(v) for v in raw]
+        numeric = [p for p in parsed if p is not None]
+        if non_empty and len(numeric) >= 0.8 * len(non_empty):
+            is_int = all(p.is_integer() for p in numeric)
+            column_types.append("integer" if is_int else "real")
+            typed_columns.append([(int(p) if is_int else p) if p is not None else None for p in parsed])
+        else:
+            column_types.append("text")
+            typed_columns.append([None if v is None else str(v) for v in raw])
+    return column_types, typed_columns
 
 class MetadataStore:
+    """
+    SQLite (WAL) store for per-document artifacts, indexed by (doc_id, page).
+    Table cells are kept as compressed column-major blobs; lookups can be paginated.
+    """
+
     def __init__(self):
         if not os.path.exists(PROCESSED_DIR):
             os.makedirs(PROCESSED_DIR)
 
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(METADATA_DB_PATH, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        # Databases created before typed tables existed
+        existing = {r[1] for r in self._db.execute("PRAGMA table_info(doc_tables)")}
+        for column, decl in (("column_types", "TEXT"), ("typed_cells", "BLOB")):
+            if column not in existing:
+                self._db.execute(f"ALTER TABLE doc_tables ADD COLUMN {column} {decl}")
+        if "ingest_stats" not in {r[1] for r in self._db.execute("PRAGMA table_info(documents)")}:
+            self._db.execute("ALTER TABLE documents ADD COLUMN ingest_stats TEXT")
+        self._db.commit()
+        self._migrate_json_files()
+
+    # --- Writes ---
+
+    def _touch(self, doc_id: str):
+        self._db.execute(
+            "INSERT INTO documents (doc_id, updated_at) VALUES (?, ?) "
+            "ON CONFLICT(doc_id) DO UPDATE SET updated_at = excluded.updated_at",
+            (doc_id, time.time())
+        )
+
+    def _write_tables(self, tables: List[Dict[str, Any]], doc_id: str):
+        self._db.execute("DELETE FROM doc_tables WHERE doc_id = ?", (doc_id,))
+        rows = []
+        for i, t in enumerate(tables):
+            data = t.get("data", [])
+            column_types, typed_columns = type_columns(data)
+            rows.append((
+                doc_id, i, t.get("page"), t.get("rows"), t.get("cols"),
+                json.dumps(t.get("headers", []), default=str), json.dumps(t.get("bbox")),
+                encode_cells(data), json.dumps(column_types),
+                zlib.compress(json.dumps(typed_columns, separators=(",", ":")).encode("utf-8"))
+            ))
+        self._db.executemany(
+            "INSERT INTO doc_tables (doc_id, idx, page, n_rows, n_cols, headers, bbox, cells, column_types, typed_cells) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+
+    def _write_images(self, images: List[Dict[str, Any]], doc_id: str):
+        self._db.execute("DELETE FROM doc_images WHERE doc_id = ?", (doc_id,))
+        rows = []
+        for i, img in enumerate(images):
+            extra = {k: v for k, v in img.items() if k not in ("page", "image_id", "caption")}
+            rows.append((doc_id, i, img.get("page"), img.get("image_id"), img.get("caption"), json.dumps(extra, default=str)))
+        self._db.executemany(
+            "INSERT INTO doc_images (doc_id, idx, page, image_id, caption, extra) VALUES (?, ?, ?, ?, ?, ?)",
+            rows
+        )
+
+    def save_artifacts(self, doc_id: str, tables: List[Dict[str, Any]], images: List[Dict[str, Any]]):
+        """Replaces a document's tables and images in a single transaction."""
+        with self._lock, self._db:
+            self._write_tables(tables, doc_id)
+            self._write_images(images, doc_id)
+            self._touch(doc_id)
+
+    def update_image_caption(self, doc_id: str, idx: int, caption: Optional[str] = None, **extra):
+        """Sets one figure's caption (None keeps it) and merges `extra` into its metadata."""
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT extra FROM doc_images WHERE doc_id = ? AND idx = ?", (doc_id, idx)
+            ).fetchone()
+            if not row:
+                return False
+            merged = dict(json.loads(row[0]) if row[0] else {}, **extra)
+            self._db.execute(
+                "UPDATE doc_images SET caption = COALESCE(?, caption), extra = ? WHERE doc_id = ? AND idx = ?",
+                (caption, json.dumps(merged, default=str), doc_id, idx)
+            )
+        return True
+
     def save_tables(self, tables: List[Dict[str, Any]], doc_id: str):
-        path = os.path.join(PROCESSED_DIR, f"{doc_id}_tables.json")
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(tables, f, indent=2)
+        with self._lock, self._db:
+            self._write_tables(tables, doc_id)
+            self._touch(doc_id)
 
     def save_images(self, images: List[Dict[str, Any]], doc_id: str):
-        path = os.path.join(PROCESSED_DIR, f"{doc_id}_images.json")
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(images, f, indent=2)
-
-    def load_tables(self, doc_id: str) -> List[Dict[str, Any]]:
-        path = os.path.join(PROCESSED_DIR, f"{doc_id}_tables.json")
-        if os.path.exists(path):
-            with open(path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        return []
-
-    def load_images(self, doc_id: str) -> List[Dict[str, Any]]:
-        path = os.path.join(PROCESSED_DIR, f"{doc_id}_images.json")
-        if os.path.exists(path):
-            with open(path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        return []
+        with self._lock, self._db:
+            self._write_images(images, doc_id)
+            self._touch(doc_id)
+
+    # --- Reads ---
+
+    @staticmethod
+    def _page_clause(doc_id: str, page: Optional[int], offset: int, limit: Optional[int]):
+        sql = " WHERE doc_id = ?"
+        params: List[Any] = [doc_id]
+        if page is not None:
+            sql += " AND page = ?"
+            params.append(page)
+        sql += " ORDER BY idx LIMIT ? OFFSET ?"
+        params.extend([limit if limit is not None else -1, offset or 0])
+        return sql, params
+
+    def load_tables(self, doc_id: str, page: Optional[int] = None,
+                    offset: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        clause, params = self._page_clause(doc_id, page, offset, limit)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT page, n_rows, n_cols, headers, bbox, cells FROM doc_tables" + clause, params
+            ).fetchall()
+        return [
+            {
+                "page": r[0],
+                "data": decode_cells(r[5]),
+                "headers": json.loads(r[3]) if r[3] else [],
+                "rows": r[1],
+                "cols": r[2],
+                "bbox": json.loads(r[4]) if r[4] else None
+            }
+            for r in rows
+        ]
+
+    def load_typed_tables(self, doc_id: str) -> List[Dict[str, Any]]:
+        """Tables as typed columns (for the structured query engine)."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT idx, page, headers, cells, column_types, typed_cells FROM doc_tables WHERE doc_id = ? ORDER BY idx",
+                (doc_id,)
+            ).fetchall()
+        tables = []
+        for idx, page, headers, cells, column_types, typed_cells in rows:
+            if column_types is None:
+                # Row written before typing existed: type it on the fly
+                types, columns = type_columns(decode_cells(cells))
+            else:
+                types = json.loads(column_types)
+                columns = json.loads(zlib.decompress(typed_cells).decode("utf-8"))
+            tables.append({
+                "idx": idx,
+                "page": page,
+                "headers": json.loads(headers) if headers else [],
+                "column_types": types,
+                "columns": columns
+            })
+        return tables
+
+    def updated_at(self, doc_id: str) -> Optional[float]:
+        with self._lock:
+            row = self._db.execute("SELECT updated_at FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        return row[0] if row else None
+
+    def load_images(self, doc_id: str, page: Optional[int] = None,
+                    offset: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        clause, params = self._page_clause(doc_id, page, offset, limit)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT page, image_id, caption, extra FROM doc_images" + clause, params
+            ).fetchall()
+        images = []
+        for page_num, image_id, caption, extra in rows:
+            img = json.loads(extra) if extra else {}
+            img.update({"image_id": image_id, "page": page_num, "caption": caption})
+            images.append(img)
+        return images
+
+    def count_artifacts(self, doc_id: str, page: Optional[int] = None) -> Dict[str, int]:
+        sql_filter = " WHERE doc_id = ?" + (" AND page = ?" if page is not None else "")
+        params = [doc_id] + ([page] if page is not None else [])
+        with self._lock:
+            tables = self._db.execute("SELECT COUNT(*) FROM doc_tables" + sql_filter, params).fetchone()[0]
+            images = self._db.execute("SELECT COUNT(*) FROM doc_images" + sql_filter, params).fetchone()[0]
+        return {"tables": tables, "images": images}
+
+    def list_documents(self) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self._db.execute("SELECT doc_id FROM documents ORDER BY doc_id")]
+
+    def register_document(self, doc_id: str):
+        """
+        Marks a document as live (called when ingestion starts, so GC leaves it alone).
+        Enrichment jobs queued for a previous version are dropped.
+        """
+        with self._lock, self._db:
+            self._touch(doc_id)
+            self._db.execute("DELETE FROM enrichment_jobs WHERE doc_id = ?", (doc_id,))
+
+    def save_ingest_stats(self, doc_id: str, stats: Dict[str, Any]):
+        """Stores how the last ingest of a document went (e.g. table pages skipped), for GET /documents."""
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE documents SET ingest_stats = ? WHERE doc_id = ?", (json.dumps(stats, default=str), doc_id)
+            )
+
+    def ingest_stats(self, doc_id: str) -> Dict[str, Any]:
+        with self._lock:
+            row = self._db.execute("SELECT ingest_stats FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else {}
+
+    def save_page_fingerprints(self, doc_id: str, fingerprints: List[str]):
+        """Replaces a document's per-page fingerprints (index 0 is page 1); "" never matches."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM page_fingerprints WHERE doc_id = ?", (doc_id,))
+            self._db.executemany(
+                "INSERT INTO page_fingerprints (doc_id, page, fingerprint) VALUES (?, ?, ?)",
+                [(doc_id, page, fp) for page, fp in enumerate(fingerprints, start=1)]
+            )
+
+    def page_fingerprints(self, doc_id: str) -> Dict[int, str]:
+        with self._lock:
+            return dict(self._db.execute(
+                "SELECT page, fingerprint FROM page_fingerprints WHERE doc_id = ?", (doc_id,)
+            ).fetchall())
+
+    def seed_documents(self, list_doc_ids) -> int:
+        """
+        One-time adoption of documents ingested before the registry existed.
+        `list_doc_ids` is only called on the first run. Returns the number registered.
+        """
+        with self._lock:
+            if self._db.execute("SELECT value FROM store_meta WHERE key = 'documents_seeded'").fetchone():
+                return 0
+        doc_ids = [d for d in list_doc_ids() if d and d != "unknown"]
+        with self._lock, self._db:
+            for doc_id in doc_ids:
+                self._db.execute("INSERT OR IGNORE INTO documents (doc_id, updated_at) VALUES (?, ?)", (doc_id, time.time()))
+            self._db.execute(
+                "INSERT OR REPLACE INTO store_meta (key, value) VALUES ('documents_seeded', ?)", (str(time.time()),)
+            )
+        return len(doc_ids)
+
+    def artifact_bytes(self) -> Dict[str, int]:
+        """Approximate bytes of stored table/image rows per doc_id."""
+        usage: Dict[str, int] = {}
+        with self._lock:
+            for doc_id, size in self._db.execute(
+                "SELECT doc_id, SUM(IFNULL(LENGTH(cells), 0) + IFNULL(LENGTH(typed_cells), 0) + IFNULL(LENGTH(headers), 0)) "
+                "FROM doc_tables GROUP BY doc_id"
+            ):
+                usage[doc_id] = usage.get(doc_id, 0) + (size or 0)
+            for doc_id, size in self._db.execute(
+                "SELECT doc_id, SUM(IFNULL(LENGTH(caption), 0) + IFNULL(LENGTH(extra), 0)) FROM doc_images GROUP BY doc_id"
+            ):
+                usage[doc_id] = usage.get(doc_id, 0) + (size or 0)
+        return usage
+
+    def delete_orphan_rows(self, dry_run: bool = False) -> List[str]:
+        """Removes table/image rows whose doc_id is no longer registered. Returns the affected doc_ids."""
+        with self._lock, self._db:
+            orphans = [r[0] for r in self._db.execute(
+                "SELECT DISTINCT doc_id FROM doc_tables WHERE doc_id NOT IN (SELECT doc_id FROM documents) "
+                "UNION SELECT DISTINCT doc_id FROM doc_images WHERE doc_id NOT IN (SELECT doc_id FROM documents)"
+            )]
+            if orphans and not dry_run:
+                for table in ("doc_tables", "doc_images", "enrichment_jobs", "page_fingerprints"):
+                    self._db.execute(f"DELETE FROM {table} WHERE doc_id NOT IN (SELECT doc_id FROM documents)")
+        return orphans
+
+    # --- Enrichment queue ---
+
+    def enqueue_enrichment(self, doc_id: str, jobs: List[Dict[str, Any]]) -> int:
+        """Replaces a document's enrichment jobs with `jobs` ({"kind": ..., "payload": {...}})."""
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM enrichment_jobs WHERE doc_id = ?", (doc_id,))
+            self._db.executemany(
+                "INSERT INTO enrichment_jobs (doc_id, kind, payload, updated_at) VALUES (?, ?, ?, ?)",
+                [(doc_id, job["kind"], json.dumps(job["payload"], default=str), now) for job in jobs]
+            )
+        return len(jobs)
+
+    def claim_enrichment(self, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        """
+        Atomically takes the oldest runnable job (pending, or running with an expired
+        lease after a crash) and marks it running. Safe across worker processes.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT id, doc_id, kind, payload, attempts FROM enrichment_jobs "
+                    "WHERE (status = 'pending' AND not_before <= ?) OR (status = 'running' AND updated_at < ?) "
+                    "ORDER BY id LIMIT 1",
+                    (now, now - lease_seconds)
+                ).fetchone()
+                if row:
+                    self._db.execute(
+                        "UPDATE enrichment_jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                        (now, row[0])
+                    )
+                self._db.commit()
+            except Exception:
+                self._db.rollback()
+                raise
+        if not row:
+            return None
+        return {"id": row[0], "doc_id": row[1], "kind": row[2], "payload": json.loads(row[3]), "attempts": row[4] + 1}
+
+    def outstanding_enrichment(self, doc_id: str) -> List[Dict[str, Any]]:
+        """Jobs of a document that have not finished yet (pending or running)."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT kind, payload FROM enrichment_jobs WHERE doc_id = ? AND status IN ('pending', 'running') ORDER BY id",
+                (doc_id,)
+            ).fetchall()
+        return [{"kind": kind, "payload": json.loads(payload)} for kind, payload in rows]
+
+    def enrichment_job_active(self, job_id: int) -> bool:
+        """False once the job was dropped (document re-ingested or deleted) while it ran."""
+        with self._lock:
+            row = self._db.execute("SELECT status FROM enrichment_jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row) and row[0] == "running"
+
+    def finish_enrichment(self, job_id: int, status: str, error: Optional[str] = None, retry_at: float = 0):
+        """status is 'done', 'failed', or 'pending' to retry no earlier than `retry_at`."""
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE enrichment_jobs SET status = ?, error = ?, not_before = ?, updated_at = ? WHERE id = ?",
+                (status, error, retry_at, time.time(), job_id)
+            )
+
+    def enrichment_status(self, doc_id: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+        """Job counts by kind and status, for one document or the whole queue."""
+        sql = "SELECT kind, status, COUNT(*) FROM enrichment_jobs"
+        params: tuple = ()
+        if doc_id is not None:
+            sql += " WHERE doc_id = ?"
+            params = (doc_id,)
+        counts: Dict[str, Dict[str, int]] = {}
+        with self._lock:
+            for kind, status, n in self._db.execute(sql + " GROUP BY kind, status", params):
+                counts.setdefault(kind, {"pending": 0, "running": 0, "done": 0, "failed": 0})[status] = n
+        return counts
+
+    def enrichment_errors(self, doc_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT kind, payload, error FROM enrichment_jobs WHERE doc_id = ? AND status = 'failed' ORDER BY id LIMIT ?",
+                (doc_id, limit)
+            ).fetchall()
+        return [{"kind": kind, "page": json.loads(payload).get("page"), "error": error} for kind, payload, error in rows]
+
+    # --- Migration ---
+
+    def _migrate_json_files(self):
+        """
+        One-time import of the legacy per-document *_tables.json / *_images.json files.
+        Imported files are moved to PROCESSED_DIR/json_backup. Runs in one write
+        transaction, so if several processes open the store at once only the first
+        imports; under gunicorn the master does it before forking (gunicorn.conf.py).
+        """
+        flag = "SELECT value FROM store_meta WHERE key = 'json_migrated'"
+        with self._lock:
+            if self._db.execute(flag).fetchone():
+                return
+
+            legacy = {}
+            for name in os.listdir(PROCESSED_DIR):
+                for suffix, kind in (("_tables.json", "tables"), ("_images.json", "images")):
+                    if name.endswith(suffix):
+                        legacy.setdefault(name[: -len(suffix)], {})[kind] = os.path.join(PROCESSED_DIR, name)
+
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                if self._db.execute(flag).fetchone():
+                    # Another process finished the import while this one waited for the lock
+                    self._db.rollback()
+                    return
+                for doc_id, files in legacy.items():
+                    for kind, path in files.items():
+                        with open(path, "r", encoding="utf-8") as f:
+                            artifacts = json.load(f)
+                        if kind == "tables":
+                            self._write_tables(artifacts, doc_id)
+                        else:
+                            self._write_images(artifacts, doc_id)
+                    self._touch(doc_id)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO store_meta (key, value) VALUES ('json_migrated', ?)", (str(time.time()),)
+                )
+                self._db.commit()
+            except Exception:
+                self._db.rollback()
+                raise
+
+            backup_dir = os.path.join(PROCESSED_DIR, "json_backup")
+            for files in legacy.values():
+                os.makedirs(backup_dir, exist_ok=True)
+                for path in files.values():
+                    shutil.move(path, os.path.join(backup_dir, os.path.basename(path)))
+            if legacy:
+                print(f"Migrated JSON metadata for {len(legacy)} documents into {METADATA_DB_PATH}")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    # --- Lifecycle ---
 
     def delete_document(self, doc_id: str):
-        """Deletes metadata files and associated static content for a document."""
-        # Delete JSONs
-        for suffix in ["_tables.json", "_images.json"]:
-            path = os.path.join(PROCESSED_DIR, f"{doc_id}{suffix}")
-            if os.path.exists(path):
-                os.remove(path)
-        
+        """Deletes metadata rows and associated static content for a document."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM doc_tables WHERE doc_id = ?", (doc_id,))
+            self._db.execute("DELETE FROM doc_images WHERE doc_id = ?", (doc_id,))
+            self._db.execute("DELETE FROM enrichment_jobs WHERE doc_id = ?", (doc_id,))
+            self._db.execute("DELETE FROM page_fingerprints WHERE doc_id = ?", (doc_id,))
+            self._db.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+
         # Delete Static Content
-        from config import STATIC_DIR, PDF_DIR
-        
+        from config import STATIC_DIR, PDF_DIR, IMAGE_DIR
+
         # Delete Scanned Pages Dir
         pages_dir = os.path.join(STATIC_DIR, "pages", doc_id)
         if os.path.exists(pages_dir):
-            import shutil
             shutil.rmtree(pages_dir)
-            
-        # Delete Original PDF
-        pdf_path = os.path.join(PDF_DIR, f"{doc_id}.pdf")
-        if os.path.exists(pdf_path):
-            os.remove(pdf_path)
+
+        # Delete Original PDF (stored under its upload filename, which may differ from the doc_id)
+        if os.path.exists(PDF_DIR):
+            for name in os.listdir(PDF_DIR):
+                if doc_id_from_filename(name) == doc_id:
+                    os.remove(os.path.join(PDF_DIR, name))
+
+        # Delete Extracted Figures
+        if os.path.exists(IMAGE_DIR):
+            for name in os.listdir(IMAGE_DIR):
+                if figure_doc_id(name) == doc_id:
+                    os.remove(os.path.join(IMAGE_DIR, name))
 
     def reset_database(self):
         """Clears all metadata and static files."""
-        # Clear PROCESSED_DIR (Metadata)
-        import shutil
+        with self._lock, self._db:
+            for table in ("doc_tables", "doc_images", "enrichment_jobs", "page_fingerprints", "documents"):
+                self._db.execute(f"DELETE FROM {table}")
+
+        # Clear PROCESSED_DIR (leftover processing files)
         if os.path.exists(PROCESSED_DIR):
             shutil.rmtree(PROCESSED_DIR)
             os.makedirs(PROCESSED_DIR)
-        
+
         # Clear Static Dirs
         from config import STATIC_DIR, PDF_DIR, IMAGE_DIR
-        
+
         # Pages
         pages_root = os.path.join(STATIC_DIR, "pages")
         if os.path.exists(pages_root):
             shutil.rmtree(pages_root)
             os.makedirs(pages_root)
-            
+
         # PDFs
         if os.path.exists(PDF_DIR):
             shutil.rmtree(PDF_DIR)
             os.makedirs(PDF_DIR)
-            
+
         # Extracted Images
         if os.path.exists(IMAGE_DIR):
              shutil.rmtree(IMAGE_DIR)
@@ -0,0 +1,104 @@
+import gzip
+import json
+import os
+import time
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+
+def dir_size(path: str) -> int:
+    """Total size in bytes of all files under `path`."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # File removed while walking
+    return total
+
+
+def export_collection(collection, dest_dir: str, name: str, batch_size: int = 1000,
+                      where: Optional[Dict[str, Any]] = None, dtype=np.float32) -> Dict[str, Any]:
+    """
+    Writes one collection as precomputed vectors plus rows:
+        <name>.vectors.npy   - (count, dim) `dtype`, row-aligned with the rows file
+        <name>.rows.jsonl.gz - one {"id", "document", "metadata"} object per line
+    `where` exports only the matching rows (e.g. some documents' chunks).
+    Callers must block writers for the duration so count() stays consistent.
+    """
+    count = len(collection.get(where=where, include=[])["ids"]) if where else collection.count()
+    vectors_path = os.path.join(dest_dir, f"{name}.vectors.npy")
+    rows_path = os.path.join(dest_dir, f"{name}.rows.jsonl.gz")
+
+    vectors = None
+    dim = None
+    written = 0
+    with gzip.open(rows_path, "wt", encoding="utf-8") as rows_file:
+        while written < count:
+            page = collection.get(where=where, limit=batch_size, offset=written,
+                                  include=["embeddings", "metadatas", "documents"])
+            if not page["ids"]:
+                break
+            block = np.asarray(page["embeddings"], dtype=np.float32)
+            if vectors is None:
+                dim = int(block.shape[1])
+                vectors = np.lib.format.open_memmap(vectors_path, mode="w+", dtype=dtype, shape=(count, block.shape[1]))
+            vectors[written : written + len(block)] = block
+            for i, chunk_id in enumerate(page["ids"]):
+                rows_file.write(json.dumps({
+                    "id": chunk_id,
+                    "document": page["documents"][i],
+                    "metadata": page["metadatas"][i] or {}
+                }) + "\n")
+            written += len(block)
+
+    if vectors is not None:
+        vectors.flush()
+        del vectors
+    return {"count": written, "dim": dim}
+
+
+def load_collection(collection, src_dir: str, name: str, batch_size: int = 1000) -> int:
+    """Bulk-loads an exported collection with its stored vectors (no re-embedding)."""
+    vectors_path = os.path.join(src_dir, f"{name}.vectors.npy")
+    rows_path = os.path.join(src_dir, f"{name}.rows.jsonl.gz")
+    if not os.path.exists(rows_path) or not os.path.exists(vectors_path):
+        return 0
+
+    vectors = np.load(vectors_path, mmap_mode="r")
+    loaded = 0
+    batch: List[Dict[str, Any]] = []
+
+    def flush():
+        nonlocal loaded
+        if not batch:
+            return
+        collection.add(
+            ids=[r["id"] for r in batch],
+            documents=[r["document"] for r in batch],
+            metadatas=[r["metadata"] for r in batch],
+            embeddings=np.asarray(vectors[loaded : loaded + len(batch)], dtype=np.float32).tolist()
+        )
+        loaded += len(batch)
+        batch.clear()
+
+    with gzip.open(rows_path, "rt", encoding="utf-8") as rows_file:
+        for line in rows_file:
+            batch.append(json.loads(line))
+            if len(batch) >= batch_size:
+                flush()
+    flush()
+    return loaded
+
+
+def write_manifest(dest_dir: str, manifest: Dict[str, Any]):
+    manifest = dict(manifest, created_at=time.strftime("%Y-%m-%dT%H:%M:%S"))
+    with open(os.path.join(dest_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def read_manifest(src_dir: str) -> Dict[str, Any]:
+    with open(os.path.join(src_dir, "manifest.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
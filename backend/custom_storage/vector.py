@@ -1,33 +1,253 @@
-import chromadb
-from chromadb.config import Settings
+import os
+import time
 import uuid
-from typing import List, Dict, Any
-from config import VECTOR_DB_DIR, EMBEDDING_MODEL
+import zlib
+import shutil
+import threading
+import numpy as np
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+from config import (
+    EMBEDDING_MODEL, VECTOR_BACKEND, SNAPSHOT_DIR,
+    VECTOR_SHARDS, VECTOR_SHARD_KEY, VECTOR_SHARD_WORKERS
+)
+from custom_storage.backends import (
+    create_backend, backend_root, new_generation_path, set_active_generation, remove_generation, uses_server
+)
+from custom_storage.snapshot import dir_size, export_collection, load_collection, write_manifest, read_manifest
+import resources
+
+def chunk_text(chunk: Dict[str, Any]) -> str:
+    """The text a chunk is embedded and stored under ('text' or 'content' key)."""
+    return chunk.get("text") or chunk.get("content") or ""
+
+class _ShardRouter:
+    """
+    Collection-like add() that sends loaded chunks to the shard owning them in this
+    store's layout. Given `collection`, it adds there instead (document centroids),
+    with the same partition tagging.
+    """
+
+    def __init__(self, store, partition: Optional[str] = None, collection=None):
+        self.store = store
+        self.partition = partition
+        self.collection = collection
+
+    def add(self, ids, documents, metadatas, embeddings):
+        if self.store.shard_key != "doc_id":
+            for meta in metadatas:
+                meta[self.store.shard_key] = self.partition or meta.get(self.store.shard_key) or "default"
+        if self.collection is not None:
+            self.collection.add(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+        else:
+            self.store._store_chunks(ids, documents, metadatas, embeddings)
+
+class _ReadWriteLock:
+    """
+    Many concurrent readers or one exclusive writer. A waiting writer blocks new
+    readers, so the time a swap holds queries up is bounded by in-flight queries.
+    Not reentrant: take it once, at the public entry point.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
 
 class VectorStore:
     def __init__(self):
-        self.client = chromadb.PersistentClient(path=VECTOR_DB_DIR)
         self.collection_name = "knowledge_base"
-        
-        # Using built-in default embedding function for simplicity (all-MiniLM-L6-v2)
-        # In production, might want to explicitly define it.
-        from chromadb.utils import embedding_functions
-        self.embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(model_name=EMBEDDING_MODEL)
-        
-        self.collection = self.client.get_or_create_collection(
-            name=self.collection_name,
-            embedding_function=self.embedding_fn
+        self.doc_index_name = "document_index"
+
+        # SentenceTransformer embedding function (EMBEDDING_MODEL), shared process-wide
+        self.embedding_fn = resources.embedding_function()
+
+        # Storage engine is chosen by config.VECTOR_BACKEND (Chroma or compact ANN).
+        # Both hand back collections with the same add/query/get/delete surface.
+        self.backend = create_backend(self.embedding_fn)
+
+        # Chunks are spread over VECTOR_SHARDS collections, routed by VECTOR_SHARD_KEY.
+        # A single shard keeps the original "knowledge_base" collection name.
+        self.num_shards = max(1, VECTOR_SHARDS)
+        self.shard_key = VECTOR_SHARD_KEY
+        self.shard_names = self._shard_names(self.num_shards)
+        self.shards = [self.backend.get_or_create_collection(name) for name in self.shard_names]
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, min(VECTOR_SHARD_WORKERS, self.num_shards)),
+            thread_name_prefix="shard-query"
         )
 
-    def add_chunks(self, chunks: List[Dict[str, Any]], doc_id: str):
+        # One centroid vector per document, used for two-stage (document -> chunk) retrieval
+        self.doc_index = self.backend.get_or_create_collection(self.doc_index_name)
+        self._index_rebuild: Optional[threading.Thread] = None
+        self._index_rebuild_lock = threading.Lock()
+
+        # _write_lock serializes mutations and snapshots; _swap_lock lets compaction /
+        # restore swap the underlying store while queries briefly wait.
+        self._write_lock = threading.RLock()
+        self._swap_lock = _ReadWriteLock()
+
+    # --- Sharding ---
+
+    def _shard_names(self, num_shards: int) -> List[str]:
+        if num_shards == 1:
+            return [self.collection_name]
+        return [f"{self.collection_name}_{i:02d}" for i in range(num_shards)]
+
+    def shard_for(self, key_value: Any) -> int:
+        """Stable shard index for a shard-key value (crc32, unlike hash(), is stable across processes)."""
+        return zlib.crc32(str(key_value).encode("utf-8")) % self.num_shards
+
+    def _shard_value(self, meta: Dict[str, Any]) -> Any:
+        if self.shard_key == "doc_id":
+            return meta.get("doc_id")
+        return meta.get(self.shard_key, "default")
+
+    def _relevant_shards(self, where: Optional[Dict[str, Any]]) -> List[int]:
+        """Shards that can hold matches for `where`; all shards unless the filter pins the shard key."""
+        if not where or self.num_shards == 1:
+            return list(range(self.num_shards))
+
+        clauses = where.get("$and", [where])
+        for clause in clauses:
+            if self.shard_key not in clause:
+                continue
+            cond = clause[self.shard_key]
+            if isinstance(cond, dict):
+                if "$eq" in cond:
+                    return [self.shard_for(cond["$eq"])]
+                if "$in" in cond:
+                    return sorted({self.shard_for(v) for v in cond["$in"]})
+            else:
+                return [self.shard_for(cond)]
+        return list(range(self.num_shards))
+
+    def _query(self, query_embeddings: List[List[float]], n_results: int,
+               where: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Fans the query out to the relevant shards concurrently and merges hits by distance."""
+        targets = [self.shards[i] for i in self._relevant_shards(where)]
+        kwargs = {"query_embeddings": query_embeddings, "n_results": n_results, "where": where or None}
+        if len(targets) == 1:
+            return targets[0].query(**kwargs)
+
+        partials = [f.result() for f in [self._executor.submit(shard.query, **kwargs) for shard in targets]]
+
+        merged = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for row in range(len(query_embeddings)):
+            hits = []
+            for part in partials:
+                if not part.get("ids"):
+                    continue
+                for j, chunk_id in enumerate(part["ids"][row]):
+                    hits.append((part["distances"][row][j], chunk_id, part["documents"][row][j], part["metadatas"][row][j]))
+            hits.sort(key=lambda h: h[0])
+            hits = hits[:n_results]
+            merged["distances"].append([h[0] for h in hits])
+            merged["ids"].append([h[1] for h in hits])
+            merged["documents"].append([h[2] for h in hits])
+            merged["metadatas"].append([h[3] for h in hits])
+        return merged
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        return [list(map(float, e)) for e in self.embedding_fn(list(texts))]
+
+    def count(self) -> int:
+        with self._swap_lock.read():
+            return self._count()
+
+    def _count(self) -> int:
+        return sum(shard.count() for shard in self.shards)
+
+    # --- Writes ---
+
+    def add_chunks(self, chunks: List[Dict[str, Any]], doc_id: str, partition: Optional[str] = None,
+                   embeddings: Optional[List[List[float]]] = None):
+        """
+        Stores chunks in the shard that owns them. `partition` is the tenant / document
+        group value used when VECTOR_SHARD_KEY is not "doc_id". `embeddings` are
+        precomputed vectors (one per chunk), e.g. from a bulk-ingest worker.
+        Returns the chunk ids, in input order.
+        """
         if not chunks:
-            return
-            
+            return []
+
+        ids, documents, metadatas = self._prepare_chunks(chunks, doc_id, partition)
+        # Embed once and reuse the vectors for the document centroid
+        if embeddings is None:
+            embeddings = self._embed(documents)
+
+        with self._write_lock, self._swap_lock.read():
+            self._store_chunks(ids, documents, metadatas, embeddings)
+            self._update_document_vector(doc_id, embeddings, documents, metadatas[0].get(self.shard_key))
+        return ids
+
+    def replace_pages(self, chunks: List[Dict[str, Any]], doc_id: str, pages: List[int],
+                      partition: Optional[str] = None, embeddings: Optional[List[List[float]]] = None) -> List[str]:
+        """
+        Incremental re-ingest: deletes the document's chunks on `pages`, stores `chunks`
+        in their place and recomputes the document centroid from every chunk the
+        document has left. Chunks of other pages keep their ids and vectors.
+        Returns the new chunk ids, in input order.
+        """
+        ids, documents, metadatas = self._prepare_chunks(chunks, doc_id, partition) if chunks else ([], [], [])
+        if embeddings is None:
+            embeddings = self._embed(documents) if documents else []
+        where = {"$and": [{"doc_id": doc_id}, {"page": {"$in": sorted(pages)}}]}
+        with self._write_lock, self._swap_lock.read():
+            targets = [self.shards[self.shard_for(doc_id)]] if self.shard_key == "doc_id" else self.shards
+            if pages:
+                for shard in targets:
+                    shard.delete(where=where)
+            if ids:
+                self._store_chunks(ids, documents, metadatas, embeddings)
+
+            kept = []
+            for shard in targets:
+                part = shard.get(where={"doc_id": doc_id}, include=["embeddings", "metadatas", "documents"])
+                kept.extend(zip(part["metadatas"], part["documents"], part["embeddings"]))
+            kept.sort(key=lambda k: (k[0] or {}).get("page", 0))
+            self.doc_index.delete(ids=[doc_id])
+            if kept:
+                self._update_document_vector(doc_id, [list(map(float, k[2])) for k in kept], [k[1] for k in kept],
+                                             (kept[0][0] or {}).get(self.shard_key))
+        return ids
+
+    def _prepare_chunks(self, chunks: List[Dict[str, Any]], doc_id: str, partition: Optional[str]):
         ids = [str(uuid.uuid4()) for _ in chunks]
-        # Handle 'text' or 'content' key from chunks
-        documents = [c.get("text") or c.get("content") or "" for c in chunks]
+        documents = [chunk_text(c) for c in chunks]
         metadatas = []
-        
+
         for c in chunks:
             # Serialize bbox if present (Chroma flat metadata requirement)
             bbox = c.get("bbox")
@@ -37,7 +257,7 @@ class VectorStore:
                  bbox_str = str(bbox)
             else:
                  bbox_str = ""
-                 
+
             meta = {
                 "doc_id": doc_id,
                 "page": c.get("page", 1),
@@ -47,23 +267,284 @@ class VectorStore:
                 # Phase 4: Decoupled Storage
                 "full_content": c.get("full_content", "") # Store raw table markdown here
             }
+            if self.shard_key != "doc_id":
+                meta[self.shard_key] = partition or c.get(self.shard_key) or "default"
             metadatas.append(meta)
-            
-        self.collection.add(
-            ids=ids,
-            documents=documents,
-            metadatas=metadatas
-        )
+        return ids, documents, metadatas
 
-    def search(self, query: str, n_results: int = 5):
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=n_results
+    def replace_chunk_text(self, chunk_id: str, doc_id: str, text: str) -> bool:
+        """
+        Re-embeds one stored chunk with new text, keeping its id and metadata (used
+        when a deferred table summary arrives). The document centroid is left as is:
+        one chunk's drift does not change which documents are shortlisted.
+        Returns False if the chunk no longer exists.
+        """
+        embedding = self._embed([text])[0]
+        with self._write_lock, self._swap_lock.read():
+            targets = [self.shards[self.shard_for(doc_id)]] if self.shard_key == "doc_id" else self.shards
+            for shard in targets:
+                if shard.get(ids=[chunk_id], include=[])["ids"]:
+                    shard.update(ids=[chunk_id], documents=[text], embeddings=[embedding])
+                    return True
+        return False
+
+    def _store_chunks(self, ids, documents, metadatas, embeddings):
+        by_shard: Dict[int, List[int]] = {}
+        for i, meta in enumerate(metadatas):
+            by_shard.setdefault(self.shard_for(self._shard_value(meta)), []).append(i)
+        for shard_idx, positions in by_shard.items():
+            self.shards[shard_idx].add(
+                ids=[ids[i] for i in positions],
+                documents=[documents[i] for i in positions],
+                metadatas=[metadatas[i] for i in positions],
+                embeddings=[embeddings[i] for i in positions]
+            )
+
+    def _update_document_vector(self, doc_id: str, embeddings: List[List[float]], documents: List[str],
+                                partition: Optional[str] = None):
+        """
+        Folds newly added chunk embeddings into the document's centroid.
+        The running chunk count and mean norm live in the entry's metadata so later
+        additions update the mean exactly without re-reading every chunk. The
+        document's partition is kept there too, so the shortlist honours the same
+        filter as the chunk query.
+        """
+        new = np.asarray(embeddings, dtype=np.float32)
+        total, count = new.sum(axis=0), len(new)
+        summary = " ".join(d for d in documents[:3] if d)[:1000]
+
+        existing = self.doc_index.get(ids=[doc_id], include=["embeddings", "metadatas", "documents"])
+        if existing["ids"]:
+            prev_meta = existing["metadatas"][0]
+            prev_count = int(prev_meta.get("chunks", 0))
+            prev_sum = np.asarray(existing["embeddings"][0], dtype=np.float32) * float(prev_meta.get("mean_norm", 1.0)) * prev_count
+            total = total + prev_sum
+            count += prev_count
+            summary = existing["documents"][0] or summary
+            partition = partition or prev_meta.get(self.shard_key)
+            self.doc_index.delete(ids=[doc_id])
+
+        centroid = total / max(count, 1)
+        norm = np.linalg.norm(centroid)
+        if norm > 0:
+            centroid = centroid / norm
+        meta = {"doc_id": doc_id, "chunks": count, "mean_norm": float(norm)}
+        if self.shard_key != "doc_id":
+            meta[self.shard_key] = partition or "default"
+        self.doc_index.add(
+            ids=[doc_id],
+            documents=[summary],
+            metadatas=[meta],
+            embeddings=[centroid.tolist()]
         )
+
+    def iter_chunks(self, batch_size: int = 1000, include: List[str] = None):
+        """Yields (shard_name, page) batches of stored chunks, one collection page at a time."""
+        include = include or ["embeddings", "metadatas", "documents"]
+        for name, shard in zip(self.shard_names, self.shards):
+            offset = 0
+            while True:
+                page = shard.get(limit=batch_size, offset=offset, include=include)
+                if not page["ids"]:
+                    break
+                offset += len(page["ids"])
+                yield name, page
+
+    def chunk_counts(self) -> Dict[str, int]:
+        """Number of stored chunks per doc_id (full scan; used by storage accounting and GC)."""
+        counts: Dict[str, int] = {}
+        with self._swap_lock.read():
+            for _, page in self.iter_chunks(include=["metadatas"]):
+                for meta in page["metadatas"]:
+                    doc_id = (meta or {}).get("doc_id", "unknown")
+                    counts[doc_id] = counts.get(doc_id, 0) + 1
+            for doc_id in self.doc_index.get(include=["metadatas"])["ids"]:
+                counts.setdefault(doc_id, 0)
+        return counts
+
+    def rebuild_document_index(self) -> Dict[str, Any]:
+        """Recomputes every document centroid from stored chunk vectors (backfill for older stores)."""
+        with self._write_lock, self._swap_lock.read():
+            return self._rebuild_document_index()
+
+    def rebuild_document_index_async(self) -> bool:
+        """Starts rebuild_document_index in a background thread unless one is running."""
+        with self._index_rebuild_lock:
+            if self._index_rebuild and self._index_rebuild.is_alive():
+                return False
+            self._index_rebuild = threading.Thread(target=self.rebuild_document_index, name="doc-index-rebuild", daemon=True)
+            self._index_rebuild.start()
+            return True
+
+    def _rebuild_document_index(self) -> Dict[str, Any]:
+        print("Rebuilding document index from chunk vectors...")
+        by_doc: Dict[str, Dict[str, Any]] = {}
+        for _, page in self.iter_chunks():
+            for emb, meta, doc in zip(page["embeddings"], page["metadatas"], page["documents"]):
+                meta = meta or {}
+                entry = by_doc.setdefault(meta.get("doc_id", "unknown"),
+                                          {"embeddings": [], "documents": [], "partition": meta.get(self.shard_key)})
+                entry["embeddings"].append(list(map(float, emb)))
+                entry["documents"].append(doc)
+
+        # Entries are replaced in place: the collection stays queryable while this runs
+        stale = self.doc_index.get(include=[])["ids"]
+        if stale:
+            self.doc_index.delete(ids=stale)
+        for doc_id, entry in by_doc.items():
+            self._update_document_vector(doc_id, entry["embeddings"], entry["documents"], entry["partition"])
+        print(f"Document index rebuilt: {len(by_doc)} documents")
+        return {"documents": len(by_doc)}
+
+    def rebalance_shards(self, batch_size: int = 1000) -> Dict[str, Any]:
+        """
+        Offline maintenance: moves every chunk into the shard that owns it under the
+        current VECTOR_SHARDS / VECTOR_SHARD_KEY settings, and drops collections that
+        are no longer part of the layout. Run with the API stopped.
+        """
+        with self._write_lock:
+            return self._rebalance_shards(batch_size)
+
+    def _rebalance_shards(self, batch_size: int) -> Dict[str, Any]:
+        prefix = self.collection_name + "_"
+        sources = [n for n in self.backend.list_collections() if n == self.collection_name or n.startswith(prefix)]
+        report = {"shards": self.shard_names, "moved": 0, "dropped": []}
+
+        for name in sources:
+            source = self.backend.get_or_create_collection(name)
+            stale_ids = []
+            offset = 0
+            while True:
+                page = source.get(limit=batch_size, offset=offset, include=["embeddings", "metadatas", "documents"])
+                if not page["ids"]:
+                    break
+                offset += len(page["ids"])
+
+                moves: Dict[int, Dict[str, list]] = {}
+                for i, chunk_id in enumerate(page["ids"]):
+                    meta = page["metadatas"][i] or {}
+                    target = self.shard_for(self._shard_value(meta))
+                    if self.shard_names[target] == name:
+                        continue
+                    bucket = moves.setdefault(target, {"ids": [], "documents": [], "metadatas": [], "embeddings": []})
+                    bucket["ids"].append(chunk_id)
+                    bucket["documents"].append(page["documents"][i])
+                    bucket["metadatas"].append(meta)
+                    bucket["embeddings"].append(list(map(float, page["embeddings"][i])))
+                    stale_ids.append(chunk_id)
+
+                for target, bucket in moves.items():
+                    self.shards[target].add(**bucket)
+
+            # Delete after the full pass so paging offsets stay valid
+            for start in range(0, len(stale_ids), batch_size):
+                source.delete(ids=stale_ids[start : start + batch_size])
+            report["moved"] += len(stale_ids)
+
+            if name not in self.shard_names:
+                self.backend.delete_collection(name)
+                report["dropped"].append(name)
+            print(f"[Rebalance] {name}: moved {len(stale_ids)} chunks.")
+
+        return report
+
+    # --- Reads ---
+
+    def embed_query(self, query: str) -> List[float]:
+        return self._embed([query])[0]
+
+    def search(self, query: str, n_results: int = 5, where: Dict[str, Any] = None,
+               query_embedding: Optional[List[float]] = None):
+        query_embeddings = [query_embedding] if query_embedding is not None else self._embed([query])
+        with self._swap_lock.read():
+            results = self._query(query_embeddings, n_results, where)
+        return self._swap_full_content(results)
+
+    def search_two_stage(self, query: str, n_results: int = 5, candidate_docs: int = 5,
+                         where: Dict[str, Any] = None, query_embedding: Optional[List[float]] = None):
+        """
+        Two-stage retrieval: pick the top-M documents by centroid similarity, then
+        run the chunk query restricted to those doc_ids. The document-level part of
+        `where` (doc_id, partition) narrows the shortlist too. Without a usable
+        shortlist (an empty document index is rebuilt in the background) this is a
+        flat search; "candidate_docs" is then None.
+        """
+        query_embeddings = [query_embedding] if query_embedding is not None else self._embed([query])
+        with self._swap_lock.read():
+            indexed = self.doc_index.count()
+            doc_ids = []
+            if indexed:
+                doc_hits = self.doc_index.query(
+                    query_embeddings=query_embeddings,
+                    n_results=max(1, min(candidate_docs, indexed)),
+                    where=self._document_where(where)
+                )
+                doc_ids = [m["doc_id"] for m in (doc_hits["metadatas"] or [[]])[0]]
+            elif self._count():
+                self.rebuild_document_index_async()
+            if not doc_ids:
+                # No centroid matched (or none are built yet): don't let the index hide chunks
+                results = self._query(query_embeddings, n_results, where)
+                doc_ids = None
+
+            else:
+                doc_filter = {"doc_id": {"$in": doc_ids}}
+                results = self._query(
+                    query_embeddings,
+                    n_results,
+                    {"$and": [where, doc_filter]} if where else doc_filter
+                )
+        results = self._swap_full_content(results)
+        results["candidate_docs"] = doc_ids
+        return results
+
+    def _document_where(self, where: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """The clauses of a chunk filter that a document centroid can answer (doc_id, partition)."""
+        if not where:
+            return None
+        fields = {"doc_id", self.shard_key}
+        clauses = [c for c in where.get("$and", [where]) if set(c) <= fields]
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    def search_batch(self, queries: List[str], n_results: int = 5,
+                     wheres: List[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Retrieves many queries at once. All queries are encoded in a single
+        embedding forward pass, then each group of queries sharing a filter is
+        sent to the index as one multi-query call.
+        Returns one /search-shaped result dict per query, in input order.
+        """
+        if not queries:
+            return []
+        wheres = wheres or [None] * len(queries)
+        embeddings = self._embed(queries)
+
+        # Group query positions by filter (dicts aren't hashable; key on a canonical repr)
+        groups: Dict[str, List[int]] = {}
+        for i, where in enumerate(wheres):
+            key = repr(sorted(where.items())) if where else ""
+            groups.setdefault(key, []).append(i)
+
+        per_query: List[Dict[str, Any]] = [None] * len(queries)
+        for positions in groups.values():
+            where = wheres[positions[0]]
+            with self._swap_lock.read():
+                results = self._query([embeddings[i] for i in positions], n_results, where)
+            results = self._swap_full_content(results)
+            for row, i in enumerate(positions):
+                per_query[i] = {
+                    key: [results[key][row]] if results.get(key) else results.get(key)
+                    for key in ("ids", "documents", "metadatas", "distances")
+                }
+        return per_query
+
+    def _swap_full_content(self, results: Dict[str, Any]) -> Dict[str, Any]:
         # Swizzle: If full_content exists, replace the 'document' snippet with it
         # The frontend expects 'documents' list.
         # Chroma results structure: {'ids': [[...]], 'documents': [[...]], 'metadatas': [[...]]}
-        
+
         if not results['documents']: return results
 
         for i, doc_list in enumerate(results['documents']):
@@ -73,7 +554,7 @@ class VectorStore:
                  if full and len(full) > 10:
                       # SWAP: Return the full real data, not the summary
                       results['documents'][i][j] = full
-                      
+
         return results
 
     def get_all_chunks(self) -> Dict[str, Any]:
@@ -81,20 +562,202 @@ class VectorStore:
         Retrieves all chunks from the DB to visualize stored knowledge.
         Limiting to first 1000 items to prevent UI crashes on large DBs.
         """
-        # Fetch metadata and documents
-        data = self.collection.get(limit=1000, include=["metadatas", "documents"])
+        # Fetch metadata and documents, shard by shard until the limit is reached
+        data = {"ids": [], "metadatas": [], "documents": []}
+        remaining = 1000
+        with self._swap_lock.read():
+            for shard in self.shards:
+                if remaining <= 0:
+                    break
+                part = shard.get(limit=remaining, include=["metadatas", "documents"])
+                for key in data:
+                    data[key].extend(part[key] or [])
+                remaining -= len(part["ids"])
         return data
 
     def delete_document(self, doc_id: str):
         """Deletes all chunks associated with a specific document ID."""
         print(f"Deleting chunks for {doc_id}...")
-        self.collection.delete(where={"doc_id": doc_id})
+        with self._write_lock, self._swap_lock.read():
+            self._delete_document(doc_id)
+
+    def _delete_document(self, doc_id: str):
+        targets = [self.shards[self.shard_for(doc_id)]] if self.shard_key == "doc_id" else self.shards
+        for shard in targets:
+            shard.delete(where={"doc_id": doc_id})
+        self.doc_index.delete(ids=[doc_id])
 
     def reset_database(self):
-        """Resets the entire vector database by re-creating the collection."""
+        """Resets the entire vector database by re-creating the collections."""
         print("Resetting Vector Database...")
-        self.client.delete_collection(self.collection_name)
-        self.collection = self.client.create_collection(
-            name=self.collection_name, 
-            embedding_function=self.embedding_fn
-        )
+        with self._write_lock, self._swap_lock.write():
+            for i, name in enumerate(self.shard_names):
+                self.backend.delete_collection(name)
+                self.shards[i] = self.backend.create_collection(name)
+            self.backend.delete_collection(self.doc_index_name)
+            self.doc_index = self.backend.create_collection(self.doc_index_name)
+
+    # --- Snapshot / Restore / Compaction ---
+
+    def _collections(self) -> Dict[str, Any]:
+        collections = dict(zip(self.shard_names, self.shards))
+        collections[self.doc_index_name] = self.doc_index
+        return collections
+
+    @staticmethod
+    def _snapshot_path(name: str) -> str:
+        # Names come from the admin API; keep them to a single entry under SNAPSHOT_DIR
+        if not name or os.path.basename(name) != name or name.startswith("."):
+            raise ValueError(f"Invalid snapshot name: {name!r}")
+        return os.path.join(SNAPSHOT_DIR, name)
+
+    def snapshot(self, name: str = None) -> Dict[str, Any]:
+        """
+        Consistent export of every collection as precomputed vectors + rows under
+        SNAPSHOT_DIR/<name>. Writers wait for the duration; queries keep running.
+        """
+        name = name or time.strftime("snap-%Y%m%d-%H%M%S")
+        dest = self._snapshot_path(name)
+        if os.path.exists(dest):
+            raise ValueError(f"Snapshot '{name}' already exists")
+        os.makedirs(dest)
+
+        start = time.perf_counter()
+        with self._write_lock:
+            collections = {cname: export_collection(coll, dest, cname) for cname, coll in self._collections().items()}
+        write_manifest(dest, {
+            "name": name,
+            "embedding_model": EMBEDDING_MODEL,
+            "backend": VECTOR_BACKEND,
+            "collections": collections
+        })
+        return {
+            "name": name,
+            "path": dest,
+            "collections": collections,
+            "size_bytes": dir_size(dest),
+            "duration_ms": round((time.perf_counter() - start) * 1000, 2)
+        }
+
+    def list_snapshots(self) -> List[Dict[str, Any]]:
+        if not os.path.exists(SNAPSHOT_DIR):
+            return []
+        snapshots = []
+        for name in sorted(os.listdir(SNAPSHOT_DIR)):
+            path = os.path.join(SNAPSHOT_DIR, name)
+            if os.path.exists(os.path.join(path, "manifest.json")):
+                manifest = read_manifest(path)
+                snapshots.append({
+                    "name": name,
+                    "created_at": manifest.get("created_at"),
+                    "embedding_model": manifest.get("embedding_model"),
+                    "chunks": sum(c["count"] for n, c in manifest["collections"].items() if n != self.doc_index_name),
+                    "size_bytes": dir_size(path)
+                })
+        return snapshots
+
+    def restore(self, name: str) -> Dict[str, Any]:
+        """Rebuilds the store from a snapshot's stored vectors (no re-embedding) and swaps it in."""
+        src = self._snapshot_path(name)
+        if not os.path.exists(os.path.join(src, "manifest.json")):
+            raise ValueError(f"Snapshot '{name}' not found")
+        manifest = read_manifest(src)
+        self._require_local_store("Restore")
+        if manifest.get("embedding_model") != EMBEDDING_MODEL:
+            raise ValueError(
+                f"Snapshot was built with '{manifest.get('embedding_model')}', current model is '{EMBEDDING_MODEL}'"
+            )
+        with self._write_lock:
+            return self._rebuild_from(src, manifest)
+
+    def compact(self, keep_snapshot: bool = False) -> Dict[str, Any]:
+        """
+        Online compaction: snapshot live rows (deleted entries and free pages are not
+        carried over), load them into a fresh generation, then swap it in.
+        Queries only pause for the final swap.
+        """
+        self._require_local_store("Compaction")
+        with self._write_lock:
+            snap = self.snapshot(name=time.strftime("compact-%Y%m%d-%H%M%S"))
+            report = self._rebuild_from(snap["path"], read_manifest(snap["path"]))
+        if not keep_snapshot:
+            shutil.rmtree(snap["path"], ignore_errors=True)
+        report["snapshot"] = snap["name"] if keep_snapshot else None
+        return report
+
+    def _require_local_store(self, operation: str):
+        # Generations are directories this process swaps; a Chroma server (and the other
+        # API workers using it) would never see the swap
+        if uses_server():
+            raise ValueError(f"{operation} swaps local store generations and is not available with CHROMA_SERVER_HOST")
+
+    # --- Knowledge packs (custom_storage/knowledge_pack.py) ---
+
+    def export_documents(self, dest_dir: str, doc_ids: List[str], dtype=np.float32) -> Dict[str, Any]:
+        """
+        Snapshot-format export of some documents' chunks (one file pair per shard
+        holding any) and their centroids ("documents"). Writers wait meanwhile.
+        """
+        where = {"doc_id": {"$in": list(doc_ids)}}
+        collections = {}
+        with self._write_lock, self._swap_lock.read():
+            for i in self._relevant_shards(where):
+                exported = export_collection(self.shards[i], dest_dir, self.shard_names[i], where=where, dtype=dtype)
+                if exported["count"]:
+                    collections[self.shard_names[i]] = exported
+            collections["documents"] = export_collection(self.doc_index, dest_dir, "documents", where=where, dtype=dtype)
+        return collections
+
+    def import_documents(self, src_dir: str, collections: Dict[str, Any], doc_ids: List[str],
+                         partition: Optional[str] = None) -> Dict[str, int]:
+        """
+        Loads chunks exported by export_documents (from any shard layout) with their
+        stored vectors, replacing whatever the store held for those documents.
+        """
+        with self._write_lock, self._swap_lock.read():
+            for doc_id in doc_ids:
+                self._delete_document(doc_id)
+            router = _ShardRouter(self, partition)
+            chunks = sum(load_collection(router, src_dir, name) for name in collections if name != "documents")
+            centroids = load_collection(_ShardRouter(self, partition, self.doc_index), src_dir, "documents")
+        return {"chunks": chunks, "documents": centroids}
+
+    def _rebuild_from(self, src: str, manifest: Dict[str, Any]) -> Dict[str, Any]:
+        """Builds a new generation from an exported snapshot and swaps it in. Caller holds _write_lock."""
+        root = backend_root()
+        old_backend = self.backend
+        size_before = dir_size(root)
+
+        start = time.perf_counter()
+        new_path = new_generation_path(root)
+        new_backend = create_backend(self.embedding_fn, path=new_path)
+        loaded = {
+            cname: load_collection(new_backend.get_or_create_collection(cname), src, cname)
+            for cname in manifest["collections"]
+        }
+        build_ms = (time.perf_counter() - start) * 1000
+
+        pause_start = time.perf_counter()
+        with self._swap_lock.write():
+            self.backend = new_backend
+            self.shards = [new_backend.get_or_create_collection(n) for n in self.shard_names]
+            self.doc_index = new_backend.get_or_create_collection(self.doc_index_name)
+            set_active_generation(root, new_path)
+        pause_ms = (time.perf_counter() - pause_start) * 1000
+
+        old_backend.close()
+        remove_generation(root, old_backend.path)
+
+        unmapped = [c for c in loaded if c not in self.shard_names and c != self.doc_index_name]
+        if unmapped:
+            print(f"Restored collections outside the current shard layout: {unmapped}. Run rebalance-shards.")
+        return {
+            "status": "success",
+            "generation": os.path.basename(new_path),
+            "collections": loaded,
+            "unmapped_collections": unmapped,
+            "size_before_bytes": size_before,
+            "size_after_bytes": dir_size(root),
+            "build_ms": round(build_ms, 2),
+            "query_pause_ms": round(pause_ms, 2)
+        }
@@ -0,0 +1,41 @@
+"""
+Multi-worker deployment: gunicorn -c gunicorn.conf.py main:app  (from backend/)
+
+The master loads the model weights once (resources.preload_models) and then forks
+the workers, which share those pages copy-on-write, so adding workers costs little
+extra RAM. The app itself is imported per worker (preload_app stays off) because the
+stores open SQLite connections and file locks that must not be shared across a fork.
+
+Each worker opens the vector store itself. The embedded stores (Chroma's
+PersistentClient, the compact ANN index) are not safe to share between processes:
+writes from one worker are invisible to the others' open collections, and compaction
+or restore swaps the store under them. So more than one worker (WEB_CONCURRENCY)
+is only started when CHROMA_SERVER_HOST points the workers at a Chroma server.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from custom_storage.backends import uses_server
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+requested_workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+workers = requested_workers if uses_server() else 1
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = False
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "3600"))  # uploads block until processing finishes
+graceful_timeout = 30
+
+def on_starting(server):
+    if requested_workers > workers:
+        server.log.warning(
+            f"WEB_CONCURRENCY={requested_workers} ignored: the embedded vector store supports one process. "
+            "Set CHROMA_SERVER_HOST to run several workers."
+        )
+    # One-time legacy JSON import, done here so workers never race over it
+    from custom_storage.metadata import MetadataStore
+    MetadataStore().close()
+
+    import resources
+    loaded = resources.preload_models()
+    server.log.info(f"Preloaded shared resources before fork: {', '.join(loaded)}")
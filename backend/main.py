@@ -1,13 +1,31 @@
-from fastapi import FastAPI, UploadFile, File, BackgroundTasks
+import time
+_BOOT = time.perf_counter()
+
+from fastapi import FastAPI, Request, UploadFile, File, BackgroundTasks, Header
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from pipeline import Pipeline
-from custom_storage.vector import VectorStore
-from custom_storage.metadata import MetadataStore
-from config import DATA_DIR
+from custom_storage.housekeeping import ArtifactCollector
+from custom_storage import knowledge_pack
+from modules.table_query import TableQueryEngine
+from modules import renditions
+from modules.context import pack_context, extract_answer
+import resources
+from admission import AdmissionController, AdmissionRejected
+from config import (
+    DATA_DIR, BATCH_SEARCH_MAX_QUERIES, BATCH_SYNTHESIS_CONCURRENCY, GC_INTERVAL_SECONDS,
+    SEARCH_WORKERS, SEARCH_RETRIEVAL_TIMEOUT, SEARCH_LLM_TIMEOUT,
+    CITATION_DPI, CITATION_MAX_DPI, CITATION_CACHE_DIR, ANSWER_CACHE_ENABLED
+)
 import os
-import fitz
-from fastapi.responses import Response
+import shutil
+import json
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+from pydantic import BaseModel
+from fastapi.responses import Response, JSONResponse, StreamingResponse, FileResponse
+from fastapi.encoders import jsonable_encoder
 import uvicorn
 
 app = FastAPI(title="PDF Knowledge System")
@@ -29,62 +47,647 @@ app.mount(
     name="static"
 )
 
-pipeline = Pipeline()
-vector_store = VectorStore()
-metadata_store = MetadataStore()
+# Heavy resources (embedding model, stores, Docling, Gemini) are built once per
+# process in resources.py; the pipeline and the endpoints share the same instances.
+# They are loaded by a background warm-up after the server starts accepting
+# connections, so nothing heavy happens at import. Until a component group is
+# ready, the endpoints that need it answer 503 with Retry-After (see /readyz).
+pipeline = None
+vector_store = None
+metadata_store = None
+table_engine = None
+artifact_collector = None
+citation_renderer = None
+answer_cache = None
+gemini = None
+enrichment = None
+
+readiness = {"core": False, "ingest": False}
+startup_report: Dict[str, Any] = {"import_ms": None, "stages": {}, "error": None}
+INGEST_PATHS = ("/upload",)
+OPEN_PATHS = ("/healthz", "/readyz", "/admin/admission", "/static", "/docs", "/redoc", "/openapi.json")
+
+def _elapsed_ms() -> float:
+    return round((time.perf_counter() - _BOOT) * 1000, 1)
+
+def _stage(name: str, fn):
+    start = time.perf_counter()
+    result = fn()
+    startup_report["stages"][name] = round((time.perf_counter() - start) * 1000, 1)
+    return result
+
+def _warm_up():
+    """Loads every heavy component in dependency order. Search is served once "core" is ready."""
+    global pipeline, vector_store, metadata_store, table_engine, artifact_collector, citation_renderer, answer_cache, gemini, enrichment
+    try:
+        metadata_store = _stage("metadata_store", resources.metadata_store)
+        vector_store = _stage("vector_store", resources.vector_store)
+        # First forward pass initialises the model's kernels; keep it off the first user query
+        _stage("embedding_warmup", lambda: vector_store.embedding_fn(["warm up"]))
+        citation_renderer = _stage("citation_renderer", resources.citation_renderer)
+        gemini = _stage("gemini", resources.gemini)
+        if ANSWER_CACHE_ENABLED:
+            answer_cache = _stage("answer_cache", resources.answer_cache)
+        table_engine = TableQueryEngine(metadata_store)
+        artifact_collector = ArtifactCollector(vector_store, metadata_store)
+        artifact_collector.add_rule(
+            "citations", CITATION_CACHE_DIR, lambda name: name if os.path.isdir(os.path.join(CITATION_CACHE_DIR, name)) else None
+        )
+        artifact_collector.start(GC_INTERVAL_SECONDS)
+        # Deferred captions / table summaries (also picks up jobs left over from a restart)
+        from modules.enrichment import EnrichmentWorker
+        enrichment = EnrichmentWorker(gemini, vector_store, metadata_store, answer_cache)
+        enrichment.start()
+        readiness["core"] = True
+        startup_report["core_ready_ms"] = _elapsed_ms()
+
+        # Docling (layout + table models) is the slowest load and only uploads need it
+        from pipeline import Pipeline
+        pipeline = _stage("pipeline", Pipeline)
+        readiness["ingest"] = True
+        startup_report["ingest_ready_ms"] = _elapsed_ms()
+        print(f"Cold start: {json.dumps(startup_report)}")
+    except Exception as e:
+        startup_report["error"] = str(e)
+        print(f"Warm-up failed: {e}")
+
+@app.on_event("startup")
+def start_warm_up():
+    startup_report["startup_event_ms"] = _elapsed_ms()
+    threading.Thread(target=_warm_up, name="warm-up", daemon=True).start()
+
+@app.on_event("shutdown")
+def stop_background_work():
+    if artifact_collector:
+        artifact_collector.stop()
+    if enrichment:
+        enrichment.stop()
+    search_executor.shutdown(wait=False)
+
+@app.middleware("http")
+async def require_ready(request: Request, call_next):
+    path = request.url.path
+    if not path.startswith(OPEN_PATHS):
+        needed = "ingest" if path.startswith(INGEST_PATHS) else "core"
+        if not readiness[needed]:
+            message = f"Warm-up failed: {startup_report['error']}" if startup_report["error"] else f"Service is warming up ({needed} not ready)."
+            return JSONResponse({"status": "error", "message": message}, status_code=503, headers={"Retry-After": "5"})
+    return await call_next(request)
+
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up and serving requests (models may still be loading)."""
+    return {"status": "ok", "uptime_ms": _elapsed_ms()}
+
+@app.get("/readyz")
+def readyz():
+    """Readiness per component group, with resource load status and the cold-start timing report."""
+    body = {
+        "ready": readiness["core"],
+        "components": dict(readiness),
+        "resources": resources.loaded()["resources"],
+        "startup": startup_report,
+    }
+    return JSONResponse(body, status_code=200 if readiness["core"] else 503)
+
+NO_RESULTS_ANSWER = "I couldn't find any relevant information in the documents to answer your question."
+LLM_TIMEOUT_ANSWER = "Answer generation timed out. The most relevant sources are listed below."
+NO_EXTRACT_ANSWER = "No sentence in the top sources matches the question. The most relevant sources are listed below."
+# auto: extractive answer when retrieval is decisive, else the LLM; llm / extractive force one tier
+ANSWER_MODES = ("auto", "llm", "extractive")
+# What the answer cache keeps of a /search response (timings are per request)
+CACHED_RESULT_KEYS = ("ids", "documents", "metadatas", "distances", "answer", "answer_source", "table_answer",
+                      "citation", "answer_decision", "candidate_docs")
+
+# Retrieval (embedding + index + SQLite) runs on its own sized pool so it never blocks
+# the event loop, and doesn't compete with uploads for Starlette's shared threadpool.
+search_executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="search")
+# Concurrency limits + bounded queues per workload class; excess requests get 429
+admission = AdmissionController()
+
+def too_busy(e: AdmissionRejected) -> JSONResponse:
+    return JSONResponse(
+        {"status": "error", "message": f"Too many {e.workload} requests ({e.reason}), retry later.", "retry_after": e.retry_after},
+        status_code=429,
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+def llm_unavailable(e: Exception, results: Optional[Dict[str, Any]] = None) -> JSONResponse:
+    """
+    A failed answer (GeminiError) as 503, or 429 when Gemini is throttling us, with
+    Retry-After. The retrieved sources are still included.
+    """
+    retry_after = getattr(e, "retry_after", 5)
+    body = dict(results or {}, status="error", answer=None, answer_error="llm_error",
+                message=f"Answer generation failed: {e}", retry_after=retry_after)
+    return JSONResponse(jsonable_encoder(body), status_code=429 if getattr(e, "throttled", False) else 503,
+                        headers={"Retry-After": str(retry_after)})
+
+async def run_search_stage(fn, *args, timeout: float = SEARCH_RETRIEVAL_TIMEOUT):
+    loop = asyncio.get_running_loop()
+    return await asyncio.wait_for(loop.run_in_executor(search_executor, fn, *args), timeout)
+
+class BatchQuery(BaseModel):
+    q: str
+    filters: Optional[Dict[str, Any]] = None  # Chroma-style where, e.g. {"doc_id": "report_2024"}
+
+class BatchSearchRequest(BaseModel):
+    queries: List[BatchQuery]
+    limit: int = 5
+    synthesize: bool = False
+    answer_mode: str = "auto"  # see ANSWER_MODES
+    concurrency: Optional[int] = None  # Lower the synthesis fan-out; capped at BATCH_SYNTHESIS_CONCURRENCY
+
+class TableFilter(BaseModel):
+    column: str
+    op: str = "="
+    value: Any
+
+class TableAggregate(BaseModel):
+    op: str                        # sum | avg | min | max | count
+    column: Optional[str] = None   # omit for count(*)
+
+class TableQueryRequest(BaseModel):
+    table: Optional[int] = None    # table index from /tables/schema; omit to run on every matching table
+    columns: Optional[List[str]] = None
+    filters: List[TableFilter] = []
+    aggregate: Optional[TableAggregate] = None
+    group_by: Optional[str] = None
+    order_by: Optional[str] = None
+    descending: bool = False
+    limit: int = 100
+
+class PackExportRequest(BaseModel):
+    name: Optional[str] = None
+    doc_ids: Optional[List[str]] = None  # omit to export every document
 
 @app.post("/upload")
 def upload_document(
     file: UploadFile = File(...),
     mode: str = "OCR",
+    partition: Optional[str] = None,
     background_tasks: BackgroundTasks = None # Kept for signature compatibility if needed, but unused
 ):
     """
     Upload and process a PDF document.
     Processing runs in FastAPI's threadpool (sync-safe).
     Blocking the request until done is intended for this UI flow.
+    Concurrent uploads are limited per mode (INGEST_OCR_* / INGEST_GEMINI_*); excess get 429.
     """
+    workload = admission["ingest_gemini" if mode == "GEMINI" else "ingest_ocr"]
     try:
         # Run pipeline synchronously (in threadpool) so we return ONLY when done
-        result = pipeline.run(file.file, file.filename, extraction_mode=mode)
+        with workload.slot():
+            result = pipeline.run(file.file, file.filename, extraction_mode=mode, partition=partition)
         return result
+    except AdmissionRejected as e:
+        return too_busy(e)
     except Exception as e:
         print(f"Pipeline Error: {e}")
         return {"status": "error", "message": str(e)}
 
 @app.get("/search")
-async def search(q: str, limit: int = 5):
-    results = vector_store.search(q, limit)
-    
-    # Synthesize Answer
-    if results and results.get("documents") and results["documents"][0]:
-        context_chunks = results["documents"][0]
-        context_str = "\n---\n".join(context_chunks)
-        
-        # Call Gemini for synthesis
-        answer = pipeline.gemini.generate_answer(q, context_str)
-        results["answer"] = answer
+async def search(q: str, limit: int = 5, mode: str = "flat", candidate_docs: int = 5, compare: bool = False,
+                 partition: Optional[str] = None, route_tables: bool = True, use_cache: bool = True,
+                 answer_mode: str = "auto"):
+    """
+    mode="flat" searches every chunk; mode="two_stage" first picks the top
+    `candidate_docs` documents by centroid, then searches only their chunks.
+    compare=true also runs flat search and reports its latency and recall@k.
+    partition restricts the search to one tenant / group (and its shard).
+    route_tables lets clearly tabular questions be answered from the table
+    engine over the retrieved documents, skipping the LLM.
+    use_cache returns a stored answer for the same or a paraphrased question
+    over the same scope (see /admin/answer-cache); compare=true bypasses it.
+    answer_mode="auto" answers with the best source sentence when retrieval is
+    decisive and calls the LLM otherwise; "llm" / "extractive" force one or the
+    other. `answer_decision` in the response says which was used and why.
+    Retrieval runs on the search thread pool and the answer is generated with the
+    async Gemini client, each under its own timeout (SEARCH_RETRIEVAL_TIMEOUT,
+    SEARCH_LLM_TIMEOUT). At most SEARCH_MAX_CONCURRENCY searches run at once and
+    SEARCH_MAX_QUEUE more may wait; beyond that the request gets 429.
+    """
+    if answer_mode not in ANSWER_MODES:
+        return JSONResponse({"status": "error", "message": f"answer_mode must be one of {', '.join(ANSWER_MODES)}."},
+                            status_code=400)
+    try:
+        admitted = await admission["search"].acquire_async()
+    except AdmissionRejected as e:
+        return too_busy(e)
+
+    try:
+        scope = _cache_scope(use_cache and not compare, partition, mode, limit, candidate_docs, route_tables, answer_mode)
+        query_embedding = None
+        if scope:
+            cached, query_embedding = await _lookup_answer(q, scope)
+            if cached:
+                return cached
+
+        try:
+            results = await run_search_stage(_retrieve, q, limit, mode, candidate_docs, compare, partition, query_embedding)
+        except asyncio.TimeoutError:
+            return JSONResponse({"status": "error", "message": "Retrieval timed out."}, status_code=504)
+
+        # Tabular fast path: answer numeric questions straight from the extracted tables
+        if route_tables and await _answer_from_tables(q, results):
+            _decide(results, answer_mode, "table_engine", reason="tabular_question")
+        elif not _answer_extractive(q, results, answer_mode):
+            from modules.gemini_gateway import GeminiError
+            try:
+                await _synthesize(q, results)
+            except GeminiError as e:
+                return llm_unavailable(e, results)
+
+        if scope:
+            await _remember_answer(q, scope, query_embedding, results)
+        return results
+    finally:
+        admission["search"].release(admitted)
+
+async def _synthesize(q: str, results: Dict[str, Any]):
+    """
+    Fills in the Gemini answer over the packed context of the retrieved chunks.
+    A timeout is reported in the results; a failed call raises GeminiError.
+    """
+    if not (results and results.get("documents") and results["documents"][0]):
+        results["answer"] = NO_RESULTS_ANSWER
+        return
+    context_str, results["retrieval"]["context"] = pack_context(
+        q, results["documents"][0], results["metadatas"][0] if results.get("metadatas") else None
+    )
+
+    # Call Gemini for synthesis
+    start = time.perf_counter()
+    try:
+        results["answer"] = await asyncio.wait_for(
+            gemini.generate_answer_async(q, context_str), SEARCH_LLM_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        results["answer"] = LLM_TIMEOUT_ANSWER
+        results["answer_error"] = "timeout"
+    finally:
+        results["retrieval"]["llm_ms"] = round((time.perf_counter() - start) * 1000, 2)
+
+def _cache_scope(enabled: bool, partition: Optional[str], mode: str, limit: int, candidate_docs: int,
+                 route_tables: bool, answer_mode: str = "auto") -> Optional[str]:
+    """Answer-cache key for everything besides the question that shapes an answer; None when not caching."""
+    if not (enabled and answer_cache):
+        return None
+    return answer_cache.scope_key(
+        partition=partition, mode=mode, limit=limit, route_tables=route_tables, answer_mode=answer_mode,
+        candidate_docs=candidate_docs if mode == "two_stage" else None
+    )
+
+def _decide(results: Dict[str, Any], answer_mode: str, source: str, **signals):
+    results["answer_decision"] = {"mode": answer_mode, "source": source, **signals}
+
+def _answer_extractive(q: str, results: Dict[str, Any], answer_mode: str) -> bool:
+    """
+    Answers with the best-matching source sentence (no LLM) when answer_mode allows
+    it and retrieval is decisive. Records the decision either way; returns True if
+    the answer was filled in.
+    """
+    if answer_mode == "llm":
+        _decide(results, answer_mode, "llm", reason="requested")
+        return False
+    if not (results.get("documents") and results["documents"][0]):
+        _decide(results, answer_mode, "none", reason="no_results")
+        return False
+    start = time.perf_counter()
+    extracted, decision = extract_answer(
+        q, results["documents"][0], results["metadatas"][0] if results.get("metadatas") else None,
+        results["distances"][0] if results.get("distances") else None, force=answer_mode == "extractive"
+    )
+    results.setdefault("retrieval", {})["extractive_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    if extracted:
+        results["answer"] = extracted["answer"]
+        results["citation"] = extracted["citation"]
+    elif answer_mode == "extractive":
+        results["answer"] = NO_EXTRACT_ANSWER
     else:
-        results["answer"] = "I couldn't find any relevant information in the documents to answer your question."
-        
+        _decide(results, answer_mode, "llm", **decision)
+        return False
+    results["answer_source"] = "extractive"
+    _decide(results, answer_mode, "extractive", **decision)
+    return True
+
+async def _lookup_answer(q: str, scope: str):
+    """
+    Embeds the query and checks the answer cache. Returns (cached results or None, query embedding).
+    A stage that times out counts as a miss; retrieval (and its own timeout) runs next.
+    """
+    start = time.perf_counter()
+    try:
+        embedding = await run_search_stage(vector_store.embed_query, q)
+    except asyncio.TimeoutError:
+        return None, None
+    try:
+        hit = await run_search_stage(answer_cache.lookup, scope, embedding)
+    except asyncio.TimeoutError:
+        hit = None
+    if not hit:
+        return None, embedding
+    results = hit["response"]
+    results["retrieval"] = {"cache_ms": round((time.perf_counter() - start) * 1000, 2)}
+    results["cache"] = {"hit": True, "similarity": hit["similarity"], "cached_query": hit["cached_query"], "age_s": hit["age_s"]}
+    return results, embedding
+
+async def _remember_answer(q: str, scope: str, embedding, results: Dict[str, Any]):
+    """Stores a successful answer with its sources; failures and empty results are never cached."""
+    if embedding is None or results.get("answer_error") or not (results.get("documents") and results["documents"][0]):
+        return
+    response = {key: results[key] for key in CACHED_RESULT_KEYS if key in results}
+    doc_ids = [m.get("doc_id") for m in (results.get("metadatas") or [[]])[0] if m]
+    try:
+        await run_search_stage(answer_cache.store, scope, q, embedding, response, doc_ids)
+    except Exception as e:
+        print(f"Answer cache store failed: {e}")
+
+async def _answer_from_tables(q: str, results: Dict[str, Any]) -> bool:
+    """Fills in the answer from the table engine when the question is tabular. Returns True if it did."""
+    if not (results.get("metadatas") and results["metadatas"][0]):
+        return False
+    doc_scope = list(dict.fromkeys(m.get("doc_id") for m in results["metadatas"][0] if m and m.get("doc_id")))
+    try:
+        table_answer = await run_search_stage(table_engine.answer_lookup, q, doc_scope)
+    except asyncio.TimeoutError:
+        return False
+    if not table_answer:
+        return False
+    results["answer"] = table_answer["answer"]
+    results["answer_source"] = "table_engine"
+    results["table_answer"] = table_answer
+    return True
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.get("/search/stream")
+async def search_stream(q: str, limit: int = 5, mode: str = "flat", candidate_docs: int = 5,
+                        partition: Optional[str] = None, route_tables: bool = True, use_cache: bool = True,
+                        answer_mode: str = "auto"):
+    """
+    Server-Sent Events version of /search. Emits a `sources` event as soon as
+    retrieval finishes, then `token` events while Gemini generates, then `done`
+    with the full answer and timings. Failures are sent as an `error` event.
+    A cached, table-engine or extractive answer arrives as `sources`, one `token`
+    and `done` right away.
+    """
+    if answer_mode not in ANSWER_MODES:
+        return JSONResponse({"status": "error", "message": f"answer_mode must be one of {', '.join(ANSWER_MODES)}."},
+                            status_code=400)
+
+    async def events():
+        # The slot is taken here, not before the response: a client that disconnects before
+        # the body is iterated never runs this generator, so nothing would release it
+        try:
+            admitted = await admission["search"].acquire_async()
+        except AdmissionRejected as e:
+            yield _sse("error", {"message": f"Too many {e.workload} requests ({e.reason}), retry later.",
+                                 "status_code": 429, "retry_after": e.retry_after})
+            return
+        started = time.perf_counter()
+        try:
+            scope = _cache_scope(use_cache, partition, mode, limit, candidate_docs, route_tables, answer_mode)
+            query_embedding = None
+            if scope:
+                cached, query_embedding = await _lookup_answer(q, scope)
+                if cached:
+                    yield _sse("sources", cached)
+                    yield _sse("token", {"text": cached["answer"]})
+                    yield _sse("done", {key: cached[key] for key in ("answer", "answer_source", "citation", "answer_decision", "cache", "retrieval")
+                                        if key in cached})
+                    return
+
+            try:
+                results = await run_search_stage(_retrieve, q, limit, mode, candidate_docs, False, partition, query_embedding)
+            except asyncio.TimeoutError:
+                yield _sse("error", {"message": "Retrieval timed out."})
+                return
+            timings = results["retrieval"]
+
+            answered = False
+            if route_tables and await _answer_from_tables(q, results):
+                _decide(results, answer_mode, "table_engine", reason="tabular_question")
+                answered = True
+            elif _answer_extractive(q, results, answer_mode):
+                answered = True
+            if answered:
+                yield _sse("sources", results)
+                yield _sse("token", {"text": results["answer"]})
+                done = {key: results[key] for key in ("answer", "answer_source", "citation", "answer_decision") if key in results}
+                yield _sse("done", dict(done, retrieval=timings))
+                if scope:
+                    await _remember_answer(q, scope, query_embedding, results)
+                return
+
+            yield _sse("sources", results)
+            context_chunks = results["documents"][0] if results.get("documents") else []
+            if not context_chunks:
+                yield _sse("token", {"text": NO_RESULTS_ANSWER})
+                yield _sse("done", {"answer": NO_RESULTS_ANSWER, "retrieval": timings})
+                return
+
+            # Stream tokens under one overall deadline for the generation stage
+            deadline = time.perf_counter() + SEARCH_LLM_TIMEOUT
+            context_str, timings["context"] = pack_context(
+                q, context_chunks, results["metadatas"][0] if results.get("metadatas") else None
+            )
+            stream = gemini.stream_answer_async(q, context_str)
+            parts: List[str] = []
+            done: Dict[str, Any] = {}
+            try:
+                while True:
+                    try:
+                        text = await asyncio.wait_for(stream.__anext__(), max(0.0, deadline - time.perf_counter()))
+                    except StopAsyncIteration:
+                        break
+                    if not parts:
+                        timings["first_token_ms"] = round((time.perf_counter() - started) * 1000, 2)
+                    parts.append(text)
+                    yield _sse("token", {"text": text})
+            except asyncio.TimeoutError:
+                await stream.aclose()
+                done["answer_error"] = "timeout"
+            except Exception as e:
+                done["answer_error"] = "llm_error"
+                done["message"] = str(e)
+            timings["total_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            yield _sse("done", dict(done, answer="".join(parts).strip(), answer_decision=results.get("answer_decision"),
+                                    retrieval=timings))
+            if scope and parts:
+                results.update(done, answer="".join(parts).strip())
+                await _remember_answer(q, scope, query_embedding, results)
+        except Exception as e:
+            yield _sse("error", {"message": str(e)})
+        finally:
+            admission["search"].release(admitted)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _retrieve(q: str, limit: int, mode: str, candidate_docs: int, compare: bool, partition: Optional[str],
+              query_embedding: Optional[List[float]] = None) -> Dict[str, Any]:
+    """Blocking retrieval stage of /search (runs on search_executor)."""
+    where = {vector_store.shard_key: partition} if partition and vector_store.shard_key != "doc_id" else None
+    start = time.perf_counter()
+    if mode == "two_stage":
+        results = vector_store.search_two_stage(q, limit, candidate_docs=candidate_docs, where=where,
+                                                query_embedding=query_embedding)
+    else:
+        results = vector_store.search(q, limit, where=where, query_embedding=query_embedding)
+    retrieval = {"mode": mode, "latency_ms": round((time.perf_counter() - start) * 1000, 2)}
+
+    if compare and mode == "two_stage":
+        start = time.perf_counter()
+        flat = vector_store.search(q, limit, where=where)
+        retrieval["flat_latency_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        flat_ids = set(flat["ids"][0]) if flat.get("ids") else set()
+        staged_ids = set(results["ids"][0]) if results.get("ids") else set()
+        # Recall of the two-stage top-k against flat top-k (flat is treated as ground truth)
+        retrieval["recall_at_k"] = round(len(flat_ids & staged_ids) / len(flat_ids), 3) if flat_ids else 1.0
+    results["retrieval"] = retrieval
     return results
 
+@app.post("/search/batch")
+async def search_batch(request: BatchSearchRequest):
+    """
+    Retrieves many queries in one pass: a single embedding forward pass and one
+    multi-query index call per distinct filter. Answer synthesis is optional and
+    runs with bounded concurrency so a large batch can't flood the Gemini quota.
+    """
+    if request.answer_mode not in ANSWER_MODES:
+        return JSONResponse({"status": "error", "message": f"answer_mode must be one of {', '.join(ANSWER_MODES)}."},
+                            status_code=400)
+    if len(request.queries) > BATCH_SEARCH_MAX_QUERIES:
+        return JSONResponse(
+            {"status": "error", "message": f"Batch too large (max {BATCH_SEARCH_MAX_QUERIES} queries)."},
+            status_code=413
+        )
+
+    # The whole batch holds one search slot
+    try:
+        admitted = await admission["search"].acquire_async()
+    except AdmissionRejected as e:
+        return too_busy(e)
+
+    try:
+        start = time.perf_counter()
+        batch_results = await asyncio.get_running_loop().run_in_executor(
+            search_executor,
+            vector_store.search_batch,
+            [item.q for item in request.queries],
+            request.limit,
+            [item.filters for item in request.queries]
+        )
+        retrieval_ms = (time.perf_counter() - start) * 1000
+
+        synthesis_ms = 0.0
+        if request.synthesize:
+            limit = max(1, min(request.concurrency or BATCH_SYNTHESIS_CONCURRENCY, BATCH_SYNTHESIS_CONCURRENCY))
+            semaphore = asyncio.Semaphore(limit)
+
+            async def synthesize(query: str, result: Dict[str, Any]):
+                context_chunks = result["documents"][0] if result.get("documents") else []
+                if not context_chunks:
+                    result["answer"] = NO_RESULTS_ANSWER
+                    return
+                if _answer_extractive(query, result, request.answer_mode):
+                    return
+                context_str, result["context"] = pack_context(
+                    query, context_chunks, result["metadatas"][0] if result.get("metadatas") else None
+                )
+                async with semaphore:
+                    try:
+                        result["answer"] = await asyncio.wait_for(
+                            gemini.generate_answer_async(query, context_str),
+                            SEARCH_LLM_TIMEOUT
+                        )
+                    except asyncio.TimeoutError:
+                        result["answer"] = LLM_TIMEOUT_ANSWER
+                        result["answer_error"] = "timeout"
+                    except Exception as e:
+                        result["answer"] = None
+                        result["answer_error"] = "llm_error"
+                        result["message"] = f"Answer generation failed: {e}"
+
+            start = time.perf_counter()
+            await asyncio.gather(*(
+                synthesize(item.q, result) for item, result in zip(request.queries, batch_results)
+            ))
+            synthesis_ms = (time.perf_counter() - start) * 1000
+
+        return {
+            "count": len(batch_results),
+            "results": [{"q": item.q, **result} for item, result in zip(request.queries, batch_results)],
+            "timings": {"retrieval_ms": round(retrieval_ms, 2), "synthesis_ms": round(synthesis_ms, 2)}
+        }
+    finally:
+        admission["search"].release(admitted)
+
 @app.get("/documents/{doc_id}")
-async def get_document_artifacts(doc_id: str):
+def get_document_artifacts(doc_id: str, page: Optional[int] = None, offset: int = 0, limit: Optional[int] = None):
     """
-    Returns all extracted artifacts for a specific document
-    to populate the Knowledge Explorer.
+    Returns extracted artifacts for a specific document
+    to populate the Knowledge Explorer. Optionally filtered to one
+    page and paginated with offset/limit.
     """
-    tables = metadata_store.load_tables(doc_id)
-    images = metadata_store.load_images(doc_id)
+    tables = metadata_store.load_tables(doc_id, page=page, offset=offset, limit=limit)
+    images = metadata_store.load_images(doc_id, page=page, offset=offset, limit=limit)
+    totals = metadata_store.count_artifacts(doc_id, page=page)
 
     return {
         "doc_id": doc_id,
         "tables": tables,
         "images": images,
+        "total_tables": totals["tables"],
+        "total_images": totals["images"],
+        "enrichment": metadata_store.enrichment_status(doc_id),
+        "ingest_stats": metadata_store.ingest_stats(doc_id),
         "pdf_url": f"http://127.0.0.1:8000/static/pdfs/{doc_id}.pdf"
     }
 
+@app.get("/documents/{doc_id}/enrichment")
+def get_enrichment_status(doc_id: str):
+    """Progress of a document's deferred figure captions and table summaries."""
+    counts = metadata_store.enrichment_status(doc_id)
+    outstanding = sum(c["pending"] + c["running"] for c in counts.values())
+    return {
+        "doc_id": doc_id,
+        "status": "none" if not counts else ("pending" if outstanding else "complete"),
+        "jobs": counts,
+        "errors": metadata_store.enrichment_errors(doc_id),
+    }
+
+@app.get("/documents/{doc_id}/tables/schema")
+def get_table_schema(doc_id: str):
+    """Lists a document's extracted tables with typed columns, for building table queries."""
+    return {"doc_id": doc_id, "tables": table_engine.schema(doc_id)}
+
+@app.post("/documents/{doc_id}/tables/query")
+def query_tables(doc_id: str, request: TableQueryRequest):
+    """
+    Runs filters and aggregations over a document's extracted tables in an
+    in-process SQL engine (no LLM involved).
+    """
+    try:
+        return table_engine.query(
+            doc_id,
+            table=request.table,
+            columns=request.columns,
+            filters=[f.dict() for f in request.filters],
+            aggregate=request.aggregate.dict() if request.aggregate else None,
+            group_by=request.group_by,
+            order_by=request.order_by,
+            descending=request.descending,
+            limit=request.limit
+        )
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+
 @app.get("/database/inspect")
 async def inspect_database():
     """
@@ -127,6 +730,10 @@ async def delete_document(doc_id: str):
     try:
         vector_store.delete_document(doc_id)
         metadata_store.delete_document(doc_id)
+        table_engine.invalidate(doc_id)
+        citation_renderer.invalidate(doc_id)
+        if answer_cache:
+            answer_cache.invalidate(doc_id)
         return {"status": "success", "message": f"Deleted document: {doc_id}"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -139,55 +746,200 @@ async def reset_database():
     try:
         vector_store.reset_database()
         metadata_store.reset_database()
+        citation_renderer.invalidate()
+        if answer_cache:
+            answer_cache.invalidate()
         return {"status": "success", "message": "Database successfully reset."}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+@app.get("/admin/admission")
+def admission_stats():
+    """Concurrency limit, in-flight count, queue depth and rejection counters per workload class."""
+    return admission.stats()
+
+@app.get("/admin/answer-cache")
+def answer_cache_stats():
+    """Entries, hit/miss counters and settings of the semantic answer cache."""
+    if not answer_cache:
+        return {"status": "disabled"}
+    return answer_cache.stats()
+
+@app.delete("/admin/answer-cache")
+def clear_answer_cache(doc_id: Optional[str] = None):
+    """Drops cached answers that cite `doc_id`, or every cached answer."""
+    if not answer_cache:
+        return {"status": "disabled"}
+    return {"status": "success", "removed": answer_cache.invalidate(doc_id)}
+
+@app.get("/admin/enrichment")
+def enrichment_stats():
+    """Enrichment queue depth by kind/status and this worker's job counters."""
+    return enrichment.stats()
+
+@app.get("/admin/llm")
+def llm_stats():
+    """Gemini gateway state: circuit breaker, concurrency, limits and per-operation latency/errors."""
+    if not gemini.gateway:
+        return {"status": "error", "message": "No GOOGLE_API_KEY configured."}
+    return gemini.gateway.stats()
+
+@app.get("/admin/vector/snapshots")
+def list_vector_snapshots():
+    return {"snapshots": vector_store.list_snapshots()}
+
+@app.post("/admin/vector/snapshot")
+def snapshot_vector_store(name: Optional[str] = None):
+    """
+    Consistent export of the vector store (vectors + chunks) to data/snapshots/<name>.
+    Ingest writes wait while it runs; queries are not paused.
+    """
+    try:
+        return {"status": "success", **vector_store.snapshot(name)}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+@app.post("/admin/vector/compact")
+def compact_vector_store(keep_snapshot: bool = False):
+    """
+    Reclaims space left by deletes and re-ingests by rebuilding the store from its
+    live rows in a new generation. Reports disk size before/after and the query pause.
+    """
+    try:
+        return vector_store.compact(keep_snapshot=keep_snapshot)
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+@app.post("/admin/vector/restore")
+def restore_vector_store(name: str):
+    """Rebuilds the vector store from a snapshot's precomputed vectors (no re-embedding)."""
+    try:
+        return vector_store.restore(name)
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+@app.get("/admin/packs")
+def list_knowledge_packs():
+    return {"packs": knowledge_pack.list_packs()}
+
+@app.post("/admin/packs/export")
+def export_knowledge_pack(request: PackExportRequest):
+    """
+    Writes documents (chunks with vectors, tables, figures, static files) to a
+    portable pack under data/packs/<name>.pack. Ingest writes wait while vectors are read.
+    """
+    try:
+        return {"status": "success", **knowledge_pack.export_pack(vector_store, metadata_store, request.name, request.doc_ids)}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+@app.get("/admin/packs/{name}")
+def download_knowledge_pack(name: str):
+    try:
+        path = knowledge_pack.pack_path(name)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"status": "error", "message": str(e)})
+    if not os.path.exists(path):
+        return JSONResponse(status_code=404, content={"status": "error", "message": f"Pack '{name}' not found"})
+    return FileResponse(path, media_type="application/zip", filename=os.path.basename(path))
+
+@app.post("/admin/packs/import")
+def import_knowledge_pack(name: Optional[str] = None, partition: Optional[str] = None, file: UploadFile = File(None)):
+    """
+    Loads a pack (uploaded, or already in data/packs) without re-running OCR, Gemini or
+    the embedding model. Documents already present are replaced. Refused when the pack
+    was built with a different embedding model.
+    """
+    try:
+        if file is not None:
+            path = knowledge_pack.pack_path(file.filename)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                shutil.copyfileobj(file.file, f)
+        elif name:
+            path = knowledge_pack.pack_path(name)
+        else:
+            return JSONResponse(status_code=400, content={"status": "error", "message": "Pass a pack file or name."})
+        result = knowledge_pack.import_pack(vector_store, metadata_store, path, partition=partition)
+        for doc_id in result["doc_ids"]:
+            table_engine.invalidate(doc_id)
+            citation_renderer.invalidate(doc_id)
+            if answer_cache:
+                answer_cache.invalidate(doc_id)
+        return result
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+@app.post("/admin/gc")
+def collect_garbage(dry_run: bool = True):
+    """
+    Removes static/processed files, vector chunks and metadata rows that belong to no
+    registered document. Defaults to a dry run that only reports what would be removed.
+    """
+    try:
+        return artifact_collector.collect(dry_run=dry_run)
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+@app.get("/admin/storage")
+def storage_usage():
+    """Disk usage per document and per storage area, plus the last GC report."""
+    try:
+        return artifact_collector.usage()
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+@app.get("/pages/{doc_id}/{page}")
+def get_page_image(doc_id: str, page: int, size: Optional[str] = None, width: Optional[int] = None):
+    """
+    Serves a page image at the rendition that fits the request: size=thumb|screen|full,
+    or the smallest rendition at least `width` px wide. Full resolution is rendered
+    from the PDF on demand when it wasn't kept at ingest.
+    """
+    headers = {"Cache-Control": "public, max-age=86400"}
+    try:
+        path, kind = renditions.resolve(doc_id, page, size=size, width=width)
+        if path:
+            return FileResponse(path, media_type=renditions.media_type(path), headers=dict(headers, **{"X-Rendition": kind}))
+        pdf_path = citation_renderer.pdf_path(doc_id)
+        if not pdf_path:
+            return Response(content=b"PDF not found", status_code=404)
+        content = renditions.render_full_on_demand(pdf_path, page, width)
+        return Response(content=content, media_type="image/png", headers=dict(headers, **{"X-Rendition": "full-on-demand"}))
+    except ValueError as e:
+        return Response(content=str(e).encode(), status_code=400)
+    except (FileNotFoundError, IndexError) as e:
+        return Response(content=str(e).encode(), status_code=404)
+
 @app.get("/citation/{doc_id}/{page}/{bbox_str}")
-async def get_visual_citation(doc_id: str, page: int, bbox_str: str):
+def get_visual_citation(doc_id: str, page: int, bbox_str: str, dpi: int = CITATION_DPI,
+                        if_none_match: Optional[str] = Header(None)):
     """
     Returns a cropped image of the PDF based on bbox coordinates.
+    Crops are cached (memory + disk); the ETag lets browsers revalidate with a 304.
     """
+    dpi = max(36, min(dpi, CITATION_MAX_DPI))
     try:
-        # Construct path using correct structure
-        # config.py: PDF_DIR = STATIC_DIR/pdfs = DATA_DIR/static/pdfs
-        pdf_path = os.path.join(DATA_DIR, "static", "pdfs", f"{doc_id}.pdf") 
-        if not os.path.exists(pdf_path):
-             return Response(content=b"PDF not found", status_code=404)
-             
-        doc = fitz.open(pdf_path)
-        
-        # Validate page (1-based input -> 0-based index)
-        page_idx = page - 1
-        if page_idx < 0 or page_idx >= len(doc):
-             return Response(content=b"Page out of range", status_code=404)
-        
-        pdf_page = doc[page_idx]
-        
-        # Parse bbox
         try:
-            coords = [float(x) for x in bbox_str.split(",")]
-            if len(coords) != 4: raise ValueError
-        except:
-             # If bad format, return full page or error? Error is safer.
-             return Response(content=b"Invalid BBox format", status_code=400)
+            _, etag, _ = citation_renderer.lookup(doc_id, page, bbox_str, dpi)
+        except ValueError:
+            return Response(content=b"Invalid BBox format", status_code=400)
+        headers = {"ETag": f'"{etag}"', "Cache-Control": "public, max-age=86400"}
+        if if_none_match and etag in if_none_match:
+            return Response(status_code=304, headers=headers)
 
-        rect = fitz.Rect(coords)
-        
-        # Add visual padding (optional, e.g. 10px) to give context
-        # Check bounds to avoid crashing? get_pixmap usually handles out-of-bounds via clipping
-        rect.x0 -= 10
-        rect.y0 -= 10
-        rect.x1 += 10
-        rect.y1 += 10
-        
-        pix = pdf_page.get_pixmap(clip=rect, dpi=200) # 200 DPI for good quality
-        img_bytes = pix.tobytes("png")
-        
-        return Response(content=img_bytes, media_type="image/png")
+        img_bytes, _ = citation_renderer.render(doc_id, page, bbox_str, dpi)
+        return Response(content=img_bytes, media_type="image/png", headers=headers)
+    except FileNotFoundError:
+        return Response(content=b"PDF not found", status_code=404)
+    except IndexError:
+        return Response(content=b"Page out of range", status_code=404)
     except Exception as e:
         print(f"Citation Generation Error: {e}")
         return Response(content=str(e), status_code=500)
 
+# Time from the first line of this module to the app being importable (no models loaded yet)
+startup_report["import_ms"] = _elapsed_ms()
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
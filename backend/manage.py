@@ -0,0 +1,194 @@
+"""
+Offline maintenance commands. Run from the backend directory, with the API stopped:
+
+    python manage.py rebalance-shards
+    python manage.py snapshot --name nightly
+    python manage.py restore nightly
+    python manage.py compact
+    python manage.py rebuild-doc-index
+    python manage.py backfill-renditions
+    python manage.py ocr-ab scan.pdf --pages 1-3 --reference truth.txt
+    python manage.py bulk-ingest /archive/pdfs --workers 4 --report bulk_report.json
+    python manage.py export-pack --name tenant_a report_2024 report_2023
+    python manage.py import-pack data/packs/tenant_a.pack
+"""
+import argparse
+import json
+
+def cmd_rebalance_shards(args):
+    from custom_storage.vector import VectorStore
+    report = VectorStore().rebalance_shards(batch_size=args.batch_size)
+    print(json.dumps(report, indent=2))
+
+def cmd_snapshot(args):
+    from custom_storage.vector import VectorStore
+    print(json.dumps(VectorStore().snapshot(args.name), indent=2))
+
+def cmd_restore(args):
+    from custom_storage.vector import VectorStore
+    print(json.dumps(VectorStore().restore(args.name), indent=2))
+
+def cmd_compact(args):
+    from custom_storage.vector import VectorStore
+    print(json.dumps(VectorStore().compact(keep_snapshot=args.keep_snapshot), indent=2))
+
+def cmd_rebuild_doc_index(args):
+    from custom_storage.vector import VectorStore
+    print(json.dumps(VectorStore().rebuild_document_index(), indent=2))
+
+def cmd_backfill_renditions(args):
+    from modules.renditions import backfill_document, backfill_all
+    reports = [backfill_document(args.doc_id, keep_full=args.keep_full)] if args.doc_id else backfill_all(keep_full=args.keep_full)
+    summary = {
+        "documents": len(reports),
+        "pages": sum(r["pages"] for r in reports),
+        "bytes_before": sum(r["bytes_before"] for r in reports),
+        "bytes_after": sum(r["bytes_after"] for r in reports),
+    }
+    print(json.dumps({"summary": summary, "documents": [r for r in reports if r["pages"]]}, indent=2))
+
+def _page_numbers(spec: str, count: int):
+    if not spec:
+        return list(range(1, count + 1))
+    pages = []
+    for part in spec.split(","):
+        first, _, last = part.partition("-")
+        pages.extend(range(int(first), int(last or first) + 1))
+    return [p for p in pages if 1 <= p <= count]
+
+def cmd_ocr_ab(args):
+    """Runs Gemini OCR on the same pages with inline (preprocessed) and upload (original) images."""
+    import difflib
+    import os
+    import tempfile
+    import time
+    import fitz
+    from config import PAGE_FULL_DPI
+    from resources import gemini
+
+    processor = gemini()
+    reference = open(args.reference, encoding="utf-8").read() if args.reference else None
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.path.lower().endswith(".pdf"):
+            doc = fitz.open(args.path)
+            images = []
+            for page_num in _page_numbers(args.pages, len(doc)):
+                path = os.path.join(tmp, f"page_{page_num:03d}.png")
+                doc[page_num - 1].get_pixmap(dpi=PAGE_FULL_DPI).save(path)
+                images.append((page_num, path))
+            doc.close()
+        else:
+            images = [(1, args.path)]
+
+        rows = []
+        texts = {"inline": [], "upload": []}
+        for page_num, path in images:
+            row = {"page": page_num}
+            for mode in ("inline", "upload"):
+                start = time.perf_counter()
+                text = processor.extract_text_from_image(path, mode=mode)["text"]
+                row[f"{mode}_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                texts[mode].append(text)
+            row["agreement"] = round(difflib.SequenceMatcher(None, texts["inline"][-1], texts["upload"][-1]).ratio(), 4)
+            rows.append(row)
+
+    summary = {mode: {"avg_ms": round(sum(r[f"{mode}_ms"] for r in rows) / max(1, len(rows)), 1)} for mode in texts}
+    summary["agreement"] = round(sum(r["agreement"] for r in rows) / max(1, len(rows)), 4)
+    if reference is not None:
+        # Character-level similarity of the concatenated output against the ground truth
+        for mode, pages in texts.items():
+            summary[mode]["accuracy"] = round(difflib.SequenceMatcher(None, "\n".join(pages), reference).ratio(), 4)
+    operations = processor.gateway.stats()["operations"]
+    for mode, op_name in (("inline", "ocr_page"), ("upload", "ocr_page_upload")):
+        summary[mode]["avg_payload_kb"] = operations.get(op_name, {}).get("avg_payload_kb")
+    print(json.dumps({"summary": summary, "pages": rows}, indent=2))
+
+def cmd_bulk_ingest(args):
+    from bulk_ingest import BulkIngestor, iter_sources
+    kwargs = {"max_attempts": args.max_attempts}
+    if args.workers:
+        kwargs["workers"] = args.workers
+    if args.state:
+        kwargs["state_path"] = args.state
+    ingestor = BulkIngestor(**kwargs)
+    report = ingestor.run(iter_sources(args.source, args.mode, args.partition))
+    report["state"] = ingestor.status()
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    failures = report.pop("failures")
+    print(json.dumps(dict(report, failures=failures[:20], failures_total=len(failures)), indent=2))
+
+def cmd_export_pack(args):
+    from custom_storage.knowledge_pack import export_pack
+    from custom_storage.metadata import MetadataStore
+    from custom_storage.vector import VectorStore
+    print(json.dumps(export_pack(VectorStore(), MetadataStore(), args.name, args.doc_ids or None), indent=2))
+
+def cmd_import_pack(args):
+    import os
+    from custom_storage.knowledge_pack import import_pack, pack_path
+    from custom_storage.metadata import MetadataStore
+    from custom_storage.vector import VectorStore
+    path = args.pack if os.path.exists(args.pack) else pack_path(args.pack)
+    print(json.dumps(import_pack(VectorStore(), MetadataStore(), path, partition=args.partition), indent=2))
+
+def main():
+    parser = argparse.ArgumentParser(description="Intel Nexus maintenance commands")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("rebalance-shards", help="Move chunks to their owning shard after changing VECTOR_SHARDS / VECTOR_SHARD_KEY")
+    p.add_argument("--batch-size", type=int, default=1000)
+    p.set_defaults(func=cmd_rebalance_shards)
+
+    p = sub.add_parser("snapshot", help="Export the vector store (vectors + chunks) to data/snapshots")
+    p.add_argument("--name", default=None)
+    p.set_defaults(func=cmd_snapshot)
+
+    p = sub.add_parser("restore", help="Rebuild the vector store from a snapshot without re-embedding")
+    p.add_argument("name")
+    p.set_defaults(func=cmd_restore)
+
+    p = sub.add_parser("compact", help="Rebuild the vector store from its live rows to reclaim disk space")
+    p.add_argument("--keep-snapshot", action="store_true")
+    p.set_defaults(func=cmd_compact)
+
+    p = sub.add_parser("rebuild-doc-index", help="Recompute the document centroids used by two-stage search")
+    p.set_defaults(func=cmd_rebuild_doc_index)
+
+    p = sub.add_parser("backfill-renditions", help="Convert legacy 300 DPI page PNGs into thumb/screen renditions")
+    p.add_argument("--doc-id", default=None, help="Only this document (default: all)")
+    p.add_argument("--keep-full", action="store_true", help="Keep the original PNG as the full rendition")
+    p.set_defaults(func=cmd_backfill_renditions)
+
+    p = sub.add_parser("ocr-ab", help="Compare Gemini OCR with inline preprocessed images vs uploaded originals")
+    p.add_argument("path", help="A PDF (pages are rendered at PAGE_FULL_DPI) or a single page image")
+    p.add_argument("--pages", default=None, help="e.g. 1-3,7 (default: all)")
+    p.add_argument("--reference", default=None, help="Ground-truth text file to score both variants against")
+    p.set_defaults(func=cmd_ocr_ab)
+
+    p = sub.add_parser("bulk-ingest", help="Ingest a directory or manifest of PDFs in parallel, resumable after a crash")
+    p.add_argument("source", help="Directory (searched recursively) or manifest: one path or JSON object per line")
+    p.add_argument("--mode", default="OCR", choices=["OCR", "GEMINI"])
+    p.add_argument("--partition", default=None)
+    p.add_argument("--workers", type=int, default=None, help="Pipeline processes (default: BULK_INGEST_WORKERS)")
+    p.add_argument("--state", default=None, help="Checkpoint file (default: BULK_INGEST_STATE_PATH)")
+    p.add_argument("--max-attempts", type=int, default=3, help="Give up on a file after this many failed runs")
+    p.add_argument("--report", default=None, help="Also write the full JSON report (every failure) here")
+    p.set_defaults(func=cmd_bulk_ingest)
+
+    p = sub.add_parser("export-pack", help="Write documents with their vectors and artifacts to a portable pack")
+    p.add_argument("doc_ids", nargs="*", help="Documents to export (default: all)")
+    p.add_argument("--name", default=None)
+    p.set_defaults(func=cmd_export_pack)
+
+    p = sub.add_parser("import-pack", help="Load a pack without re-running OCR, Gemini or embeddings")
+    p.add_argument("pack", help="Path to a .pack file, or the name of one in data/packs")
+    p.add_argument("--partition", default=None, help="Store the documents under this partition instead")
+    p.set_defaults(func=cmd_import_pack)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -5,15 +5,26 @@ class Chunker:
         self.chunk_size = chunk_size
         self.overlap = overlap
 
-    def chunk_by_structure(self, structure: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def chunk_by_structure(self, structure: List[Dict[str, Any]], by_page: bool = False) -> List[Dict[str, Any]]:
         """
         Groups content by the most recent heading and chunks large sections.
         If 'bbox' is present (Docling), it preserves semantic layout units.
+        `by_page` keeps plain-text chunks from spanning pages (page-level re-ingest).
         """
         # Check for Docling-style Layout-Aware structure
         if structure and "bbox" in structure[0]:
              return self._chunk_docling(structure)
 
+        if by_page:
+            pages: Dict[int, List[Dict[str, Any]]] = {}
+            for item in structure:
+                pages.setdefault(item["page"], []).append(item)
+            chunks = []
+            for page in sorted(pages):
+                # The plain chunker only tracks pages at headings
+                chunks.extend(dict(c, page=page) for c in self.chunk_by_structure(pages[page]))
+            return chunks
+
         chunks = []
         current_heading = "Introduction"
         current_buffer = ""
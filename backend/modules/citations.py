@@ -0,0 +1,192 @@
+import fitz
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+from config import (
+    PDF_DIR, CITATION_CACHE_DIR, CITATION_DPI, CITATION_MEMORY_CACHE_MB, CITATION_PDF_POOL
+)
+from custom_storage.metadata import doc_id_from_filename
+
+# Visual padding (in PDF points) around the bbox to give the crop some context
+CROP_PADDING = 10
+
+
+def parse_bbox(bbox: Any) -> List[float]:
+    """Accepts "x0,y0,x1,y1" or a 4-item sequence; raises ValueError otherwise."""
+    coords = [float(x) for x in (bbox.split(",") if isinstance(bbox, str) else bbox)]
+    if len(coords) != 4:
+        raise ValueError("bbox must have 4 coordinates")
+    return coords
+
+
+class CitationRenderer:
+    """
+    Renders bbox crops of source PDFs for visual citations.
+
+    Crops are cached in a memory LRU and on disk under CITATION_CACHE_DIR/<doc_id>/,
+    keyed by (doc_id, page, bbox, dpi) plus the PDF's mtime/size, so a re-uploaded
+    document never serves stale crops. The key hash doubles as the HTTP ETag.
+    Open PDF handles are pooled; PyMuPDF documents are not thread-safe, so each
+    handle is used under its own lock.
+    """
+
+    def __init__(self, cache_dir: str = CITATION_CACHE_DIR, memory_mb: int = CITATION_MEMORY_CACHE_MB,
+                 pool_size: int = CITATION_PDF_POOL):
+        self.cache_dir = cache_dir
+        self.memory_budget = memory_mb * 1024 * 1024
+        self.pool_size = pool_size
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (doc_id, png bytes)
+        self._memory_bytes = 0
+        self._pool: "OrderedDict[str, tuple]" = OrderedDict()  # path -> (fingerprint, fitz.Document, lock)
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    # --- PDFs ---
+
+    @staticmethod
+    def pdf_path(doc_id: str) -> Optional[str]:
+        path = os.path.join(PDF_DIR, f"{doc_id}.pdf")
+        if os.path.exists(path):
+            return path
+        # Uploads keep their original filename, which may differ from the doc_id
+        if os.path.exists(PDF_DIR):
+            for name in os.listdir(PDF_DIR):
+                if name.lower().endswith(".pdf") and doc_id_from_filename(name) == doc_id:
+                    return os.path.join(PDF_DIR, name)
+        return None
+
+    @staticmethod
+    def _fingerprint(path: str) -> str:
+        stat = os.stat(path)
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+    def _document(self, path: str, fingerprint: str):
+        with self._lock:
+            pooled = self._pool.get(path)
+            if pooled and pooled[0] == fingerprint:
+                self._pool.move_to_end(path)
+                return pooled[1], pooled[2]
+            if pooled:
+                pooled[1].close()
+            doc = fitz.open(path)
+            self._pool[path] = (fingerprint, doc, threading.Lock())
+            self._pool.move_to_end(path)
+            while len(self._pool) > self.pool_size:
+                _, (_, old_doc, old_lock) = self._pool.popitem(last=False)
+                with old_lock:
+                    old_doc.close()
+            return doc, self._pool[path][2]
+
+    # --- Cache ---
+
+    @staticmethod
+    def cache_key(doc_id: str, page: int, coords: List[float], dpi: int, fingerprint: str) -> str:
+        bbox = ",".join(f"{c:.2f}" for c in coords)
+        return hashlib.sha1(f"{doc_id}|{page}|{bbox}|{dpi}|{fingerprint}".encode("utf-8")).hexdigest()[:24]
+
+    def _disk_path(self, doc_id: str, key: str) -> str:
+        return os.path.join(self.cache_dir, doc_id, f"{key}.png")
+
+    def _remember(self, doc_id: str, key: str, data: bytes):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return
+            self._memory[key] = (doc_id, data)
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.memory_budget and self._memory:
+                _, (_, old) = self._memory.popitem(last=False)
+                self._memory_bytes -= len(old)
+
+    def lookup(self, doc_id: str, page: int, bbox: Any, dpi: int = CITATION_DPI,
+               path: Optional[str] = None) -> Tuple[str, str, List[float]]:
+        """Resolves (pdf_path, etag, coords) without rendering. Raises FileNotFoundError / ValueError."""
+        coords = parse_bbox(bbox)
+        path = path or self.pdf_path(doc_id)
+        if not path:
+            raise FileNotFoundError("PDF not found")
+        return path, self.cache_key(doc_id, page, coords, dpi, self._fingerprint(path)), coords
+
+    def render(self, doc_id: str, page: int, bbox: Any, dpi: int = CITATION_DPI,
+               path: Optional[str] = None) -> Tuple[bytes, str]:
+        """
+        Returns (png_bytes, etag) for a crop, rendering it only on a cache miss.
+        `path` overrides the stored PDF (an upload not yet committed).
+        Raises FileNotFoundError (no PDF), IndexError (bad page) or ValueError (bad bbox).
+        """
+        path, key, coords = self.lookup(doc_id, page, bbox, dpi, path)
+
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                self._memory.move_to_end(key)
+                return cached[1], key
+
+        disk_path = self._disk_path(doc_id, key)
+        if os.path.exists(disk_path):
+            with open(disk_path, "rb") as f:
+                data = f.read()
+            self._remember(doc_id, key, data)
+            return data, key
+
+        doc, doc_lock = self._document(path, self._fingerprint(path))
+        with doc_lock:
+            if doc.is_closed:  # Evicted from the pool between checkout and lock
+                doc = fitz.open(path)
+            # Validate page (1-based input -> 0-based index)
+            if page < 1 or page > len(doc):
+                raise IndexError("Page out of range")
+            rect = fitz.Rect(coords)
+            rect.x0 -= CROP_PADDING
+            rect.y0 -= CROP_PADDING
+            rect.x1 += CROP_PADDING
+            rect.y1 += CROP_PADDING
+            data = doc[page - 1].get_pixmap(clip=rect, dpi=dpi).tobytes("png")
+
+        os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+        tmp_path = f"{disk_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, disk_path)
+        self._remember(doc_id, key, data)
+        return data, key
+
+    def prerender(self, doc_id: str, chunks: List[Dict[str, Any]], dpi: int = CITATION_DPI,
+                  path: Optional[str] = None) -> int:
+        """
+        Renders crops for table chunks at ingest so their first citation view is a cache
+        hit. The cache key follows the file's mtime and size, which survive the move
+        of a staged upload (`path`) into place.
+        """
+        rendered = 0
+        for chunk in chunks:
+            if chunk.get("type") != "table" or not chunk.get("bbox") or not chunk.get("page"):
+                continue
+            try:
+                self.render(doc_id, int(chunk["page"]), chunk["bbox"], dpi, path)
+                rendered += 1
+            except Exception as e:
+                print(f"Citation pre-render skipped for {doc_id} p{chunk.get('page')}: {e}")
+        return rendered
+
+    def invalidate(self, doc_id: Optional[str] = None):
+        """Drops cached crops and pooled handles for one document (or everything)."""
+        with self._lock:
+            for key in [k for k, (owner, _) in self._memory.items() if doc_id is None or owner == doc_id]:
+                self._memory_bytes -= len(self._memory.pop(key)[1])
+            for path in list(self._pool):
+                if doc_id is None or doc_id_from_filename(os.path.basename(path)) == doc_id:
+                    _, doc, doc_lock = self._pool.pop(path)
+                    with doc_lock:
+                        doc.close()
+        target = self.cache_dir if doc_id is None else os.path.join(self.cache_dir, doc_id)
+        if os.path.exists(target):
+            shutil.rmtree(target, ignore_errors=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"memory_entries": len(self._memory), "memory_bytes": self._memory_bytes, "open_pdfs": len(self._pool)}
@@ -0,0 +1,253 @@
+import math
+import re
+from typing import List, Dict, Any, Optional, Tuple
+from config import (
+    CONTEXT_TOKEN_BUDGET, CONTEXT_TABLE_MAX_ROWS, EXTRACTIVE_MIN_COVERAGE, EXTRACTIVE_MAX_DISTANCE_RATIO,
+    EXTRACTIVE_TOP_CHUNKS
+)
+
+SEPARATOR = "\n---\n"
+# Gemini bills an image of at most IMAGE_SMALL_SIDE px a side at a flat rate, a larger
+# one at that rate per IMAGE_TILE_SIDE x IMAGE_TILE_SIDE tile
+IMAGE_TOKENS = 258
+IMAGE_SMALL_SIDE = 384
+IMAGE_TILE_SIDE = 768
+# Word overlap that counts as the chunker's sliding-window overlap between two chunks
+MIN_STITCH_WORDS = 8
+MAX_STITCH_WORDS = 128
+# Near-duplicate threshold on word-shingle Jaccard similarity
+DUPLICATE_SIMILARITY = 0.8
+# Don't bother appending a truncated passage shorter than this
+MIN_TAIL_TOKENS = 60
+# Questions that ask for reasoning over the sources rather than a fact stated in one place
+SYNTHESIS_CUE = re.compile(
+    r"\b(why|explain|compare|comparison|differen(ce|t)|summar(y|ize|ise)|overview|pros|cons|advantages?|"
+    r"disadvantages?|implications?|how (does|do|did|can|could|would|should))\b"
+)
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])")
+# A best sentence shorter than this gets the following sentence as context
+MIN_ANSWER_WORDS = 8
+MAX_ANSWER_CHARS = 500
+STOPWORDS = {
+    "the", "a", "an", "of", "in", "on", "for", "to", "and", "or", "is", "are", "was", "were",
+    "what", "which", "who", "when", "where", "how", "many", "much", "does", "did", "do", "with", "by", "from",
+    "at", "as", "be", "it", "its", "this", "that", "there", "their", "me", "show", "tell",
+}
+
+
+def estimate_tokens(contents: Any) -> int:
+    """Rough prompt size (4 characters per token), for context budgets and rate limits."""
+    if isinstance(contents, str):
+        return max(1, len(contents) // 4)
+    if isinstance(contents, (list, tuple)):
+        return sum(estimate_tokens(part) for part in contents)
+    return IMAGE_TOKENS
+
+def image_tokens(width: int, height: int) -> int:
+    """Tokens Gemini bills for an image of this size, for rate limits."""
+    if max(width, height) <= IMAGE_SMALL_SIDE:
+        return IMAGE_TOKENS
+    return IMAGE_TOKENS * math.ceil(width / IMAGE_TILE_SIDE) * math.ceil(height / IMAGE_TILE_SIDE)
+
+def _words(text: str) -> List[str]:
+    return text.split()
+
+def _term_list(text: str) -> List[str]:
+    return [t.rstrip(".") for t in re.findall(r"[a-z0-9][a-z0-9.%-]*", text.lower()) if t not in STOPWORDS]
+
+def _terms(text: str) -> set:
+    return set(_term_list(text))
+
+def _contains_run(terms: List[str], run: List[str]) -> bool:
+    return any(terms[i:i + len(run)] == run for i in range(len(terms) - len(run) + 1))
+
+def _shingles(text: str, size: int = 5) -> set:
+    words = [w.lower() for w in _words(text)]
+    if len(words) < size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _stitch(first: str, second: str) -> Optional[str]:
+    """Joins two chunks if the tail of `first` repeats as the head of `second`; None otherwise."""
+    a, b = _words(first), _words(second)
+    for size in range(min(len(a), len(b), MAX_STITCH_WORDS), MIN_STITCH_WORDS - 1, -1):
+        if a[-size:] == b[:size]:
+            return " ".join(a + b[size:])
+    return None
+
+def _is_table(text: str, meta: Dict[str, Any]) -> bool:
+    lines = [l for l in text.splitlines() if l.strip()]
+    return bool(meta.get("full_content")) and sum(l.lstrip().startswith("|") for l in lines) >= 3
+
+def trim_table(markdown: str, query: str, max_rows: int = CONTEXT_TABLE_MAX_ROWS) -> Tuple[str, int]:
+    """
+    Keeps the header, separator and the `max_rows` data rows that share the most
+    terms with the query (in their original order). Returns (markdown, rows dropped).
+    """
+    lines = [l for l in markdown.splitlines() if l.strip()]
+    header_end = next((i + 1 for i, l in enumerate(lines) if re.match(r"^\s*\|?\s*:?-{3,}", l)), min(1, len(lines)))
+    header, rows = lines[:header_end], lines[header_end:]
+    if len(rows) <= max_rows:
+        return markdown, 0
+
+    terms = _terms(query)
+    scored = [(len(terms & _terms(row)), i) for i, row in enumerate(rows)]
+    # Best-matching rows first; ties keep table order (top of the table usually carries totals/headers)
+    keep = sorted(i for _, i in sorted(scored, key=lambda s: (-s[0], s[1]))[:max_rows])
+    dropped = len(rows) - len(keep)
+    trimmed = header + [rows[i] for i in keep] + [f"({dropped} of {len(rows)} rows omitted)"]
+    return "\n".join(trimmed), dropped
+
+def _truncate(text: str, tokens: int) -> str:
+    # estimate_tokens counts ~4 characters per token
+    cut = text[: tokens * 4]
+    return cut[: cut.rfind(" ")] + " ..." if " " in cut else cut
+
+
+def pack_context(query: str, documents: List[str], metadatas: Optional[List[Dict[str, Any]]] = None,
+                 budget_tokens: int = CONTEXT_TOKEN_BUDGET) -> Tuple[str, Dict[str, Any]]:
+    """
+    Builds the Gemini context from ranked search hits within `budget_tokens`:
+      1. tables are trimmed to the rows most relevant to the query,
+      2. repeated and near-duplicate chunks are dropped,
+      3. chunks from the same page are merged into one passage (stitching
+         the chunker's sliding-window overlap),
+      4. passages are added in rank order until the budget is spent.
+    Returns (context, report); the report gives the packed size for tuning.
+    A budget of 0 disables packing (plain join of the hits, as before).
+    """
+    metadatas = metadatas or [{} for _ in documents]
+    if budget_tokens <= 0:
+        context = SEPARATOR.join(d for d in documents if d)
+        return context, {"budget_tokens": 0, "chunks_in": len(documents), "packed_tokens": estimate_tokens(context)}
+    report = {
+        "budget_tokens": budget_tokens, "chunks_in": len(documents),
+        "input_tokens": sum(estimate_tokens(d or "") for d in documents),
+        "duplicates_dropped": 0, "chunks_merged": 0, "table_rows_dropped": 0,
+        "passages": 0, "passages_truncated": 0, "chunks_over_budget": 0,
+    }
+
+    # Passages keyed by (doc_id, page), in order of their best-ranked chunk
+    passages: Dict[Tuple[str, Any], List[str]] = {}
+    seen: List[set] = []
+    for text, meta in zip(documents, metadatas):
+        text = (text or "").strip()
+        meta = meta or {}
+        if not text:
+            continue
+        is_table = _is_table(text, meta)
+        if is_table:
+            text, dropped = trim_table(text, query)
+            report["table_rows_dropped"] += dropped
+
+        shingles = _shingles(text)
+        if any(len(shingles & other) / max(1, len(shingles | other)) >= DUPLICATE_SIMILARITY or shingles <= other
+               for other in seen):
+            report["duplicates_dropped"] += 1
+            continue
+        seen.append(shingles)
+
+        key = (meta.get("doc_id", ""), meta.get("page"))
+        parts = passages.setdefault(key, [])
+        for i, part in enumerate(parts):
+            # Tables keep their line layout; only prose chunks are stitched
+            stitched = None if is_table else (_stitch(part, text) or _stitch(text, part))
+            if stitched:
+                parts[i] = stitched
+                report["chunks_merged"] += 1
+                break
+        else:
+            parts.append(text)
+    report["chunks_merged"] += sum(len(parts) - 1 for parts in passages.values())
+
+    packed: List[str] = []
+    used = 0
+    for (doc_id, page), parts in passages.items():
+        label = f"[{doc_id} p.{page}]" if doc_id else ""
+        passage = "\n".join(filter(None, [label, "\n\n".join(parts)]))
+        cost = estimate_tokens(passage) + estimate_tokens(SEPARATOR)
+        remaining = budget_tokens - used
+        if cost > remaining:
+            if remaining >= MIN_TAIL_TOKENS:
+                passage = _truncate(passage, remaining - estimate_tokens(SEPARATOR))
+                cost = estimate_tokens(passage) + estimate_tokens(SEPARATOR)
+                report["passages_truncated"] += 1
+            else:
+                report["chunks_over_budget"] += len(parts)
+                continue
+        packed.append(passage)
+        used += cost
+
+    context = SEPARATOR.join(packed)
+    report["passages"] = len(packed)
+    report["packed_tokens"] = estimate_tokens(context) if context else 0
+    report["packed_chars"] = len(context)
+    return context, report
+
+
+def extract_answer(query: str, documents: List[str], metadatas: Optional[List[Dict[str, Any]]] = None,
+                   distances: Optional[List[float]] = None, force: bool = False
+                   ) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Extractive answer from ranked search hits: the sentence of the top
+    EXTRACTIVE_TOP_CHUNKS prose chunks that covers the most query terms.
+    It is only returned when retrieval is decisive: the sentence covers at
+    least EXTRACTIVE_MIN_COVERAGE of the query terms and comes from the top hit,
+    which leads the runner-up by a clear distance margin; or it is in the top hit
+    and contains every query term in the question's order (an exact keyword
+    match). A phrase found further down the ranking is not decisive. Questions that
+    ask for reasoning ("why", "compare", ...) never qualify. `force` returns the
+    best sentence regardless.
+    Returns (answer or None, decision); the decision records the signals.
+    """
+    metadatas = metadatas or [{} for _ in documents]
+    terms = list(dict.fromkeys(_term_list(query)))
+    ratio = None
+    if distances and len(distances) >= 2 and distances[1] > 0:
+        ratio = round(distances[0] / distances[1], 3)
+    decision: Dict[str, Any] = {"coverage": 0.0, "phrase_match": False, "distance_ratio": ratio, "rank": None}
+    if not terms:
+        return None, dict(decision, reason="no_query_terms")
+    if SYNTHESIS_CUE.search(query.lower()) and not force:
+        return None, dict(decision, reason="needs_synthesis")
+
+    best = None  # (coverage, phrase, -rank), rank, sentences, index
+    for rank, (text, meta) in enumerate(zip(documents[:EXTRACTIVE_TOP_CHUNKS], metadatas)):
+        if not text or _is_table(text, meta or {}):
+            continue
+        sentences = [s.strip() for s in SENTENCE_SPLIT.split(" ".join(text.split())) if s.strip()]
+        for i, sentence in enumerate(sentences):
+            sentence_terms = _term_list(sentence)
+            coverage = len(set(terms) & set(sentence_terms)) / len(terms)
+            # Only the top hit can skip the margin check: a short run deeper in the ranking says
+            # little about whether retrieval found the answer
+            phrase = rank == 0 and len(terms) >= 2 and _contains_run(sentence_terms, terms)
+            key = (round(coverage, 3), phrase, -rank)
+            if coverage and (best is None or key > best[0]):
+                best = (key, rank, sentences, i)
+    if best is None:
+        return None, dict(decision, reason="no_matching_sentence")
+
+    (coverage, phrase, _), rank, sentences, i = best
+    decision.update(coverage=coverage, phrase_match=phrase, rank=rank)
+    margin = rank == 0 and (ratio is None or ratio <= EXTRACTIVE_MAX_DISTANCE_RATIO)
+    if phrase:
+        decision["reason"] = "exact_keyword_match"
+    elif coverage >= EXTRACTIVE_MIN_COVERAGE and margin:
+        decision["reason"] = "score_margin"
+    elif force:
+        decision["reason"] = "forced"
+    else:
+        decision["reason"] = "low_coverage" if coverage < EXTRACTIVE_MIN_COVERAGE else "no_clear_margin"
+        return None, decision
+
+    answer = sentences[i]
+    if len(answer.split()) < MIN_ANSWER_WORDS and i + 1 < len(sentences):
+        answer = f"{answer} {sentences[i + 1]}"
+    if len(answer) > MAX_ANSWER_CHARS:
+        answer = _truncate(answer, MAX_ANSWER_CHARS // 4)
+    meta = metadatas[rank] or {}
+    return {
+        "answer": answer,
+        "citation": {"doc_id": meta.get("doc_id"), "page": meta.get("page"), "bbox": meta.get("bbox") or None, "rank": rank},
+    }, decision
@@ -0,0 +1,127 @@
+"""
+Background enrichment: Gemini work that improves a document after it is searchable.
+
+Pipeline.run commits text chunks first and queues the slow Gemini calls as jobs in
+the metadata store (one per figure caption / table summary). EnrichmentWorker
+threads claim jobs from that queue, so the work survives restarts and is shared
+by every API worker on the same store:
+  - caption: writes the caption into the figure's stored metadata,
+  - table_summary: re-embeds the table's chunk with "LLM Summary: ...".
+Transient Gemini failures (throttling, breaker open) put the job back with a
+delay; anything else, or too many attempts, marks it failed and the document
+keeps its placeholder caption / heuristic summary.
+"""
+import threading
+import time
+from typing import Any, Dict, Optional
+from modules.gemini_gateway import GeminiUnavailable
+from modules.vision import CAPTION_PROMPT
+from config import ENRICHMENT_WORKERS, ENRICHMENT_POLL_SECONDS, ENRICHMENT_MAX_ATTEMPTS, ENRICHMENT_LEASE_SECONDS
+
+
+class EnrichmentWorker:
+    def __init__(self, gemini, vector_store, metadata_store, answer_cache=None, workers: int = ENRICHMENT_WORKERS):
+        self.gemini = gemini
+        self.vector_store = vector_store
+        self.metadata_store = metadata_store
+        self.answer_cache = answer_cache
+        self.workers = workers
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        self.counters = {"done": 0, "failed": 0, "retried": 0, "dropped": 0}
+        self.last_error: Optional[str] = None
+
+    def start(self):
+        if self._threads or self.workers <= 0:
+            return
+        self._stop.clear()
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._loop, name=f"enrichment-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"Enrichment worker started ({self.workers} threads).")
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                job = self.metadata_store.claim_enrichment(ENRICHMENT_LEASE_SECONDS)
+            except Exception as e:
+                print(f"Enrichment queue unavailable: {e}")
+                job = None
+            if job is None:
+                self._stop.wait(ENRICHMENT_POLL_SECONDS)
+                continue
+            self.run_job(job)
+
+    def run_job(self, job: Dict[str, Any]):
+        """Runs one claimed job and records its outcome in the queue."""
+        try:
+            result = self._run(job)
+        except GeminiUnavailable as e:
+            if job["attempts"] < ENRICHMENT_MAX_ATTEMPTS:
+                self._count("retried", e)
+                self.metadata_store.finish_enrichment(job["id"], "pending", str(e)[:300], time.time() + e.retry_after)
+            else:
+                self._give_up(job, e)
+            return
+        except Exception as e:
+            print(f"Enrichment {job['kind']} failed for {job['doc_id']}: {e}")
+            self._give_up(job, e)
+            return
+        if result is None:
+            # The document was re-ingested or deleted while Gemini was working
+            self._count("dropped")
+            return
+        self._count("done")
+        self.metadata_store.finish_enrichment(job["id"], "done")
+
+    def _give_up(self, job: Dict[str, Any], error: Exception):
+        self._count("failed", error)
+        if job["kind"] == "caption" and self.metadata_store.enrichment_job_active(job["id"]):
+            # The placeholder caption stays; mark it as final
+            self.metadata_store.update_image_caption(job["doc_id"], job["payload"]["idx"], caption_status="failed")
+        self.metadata_store.finish_enrichment(job["id"], "failed", f"{type(error).__name__}: {error}"[:300])
+
+    def _run(self, job: Dict[str, Any]) -> Optional[bool]:
+        doc_id, payload = job["doc_id"], job["payload"]
+        if job["kind"] == "caption":
+            caption = self.gemini.describe_image(payload["path"], CAPTION_PROMPT, op="caption").strip()
+            if not self.metadata_store.enrichment_job_active(job["id"]):
+                return None
+            return self.metadata_store.update_image_caption(doc_id, payload["idx"], caption, caption_status="done")
+
+        if job["kind"] == "table_summary":
+            summary = self.gemini.summarize_text(payload["full_content"])
+            if not self.metadata_store.enrichment_job_active(job["id"]):
+                return None
+            replaced = self.vector_store.replace_chunk_text(payload["chunk_id"], doc_id, f"LLM Summary: {summary}")
+            if replaced and self.answer_cache:
+                # Retrieval over this document changed
+                self.answer_cache.invalidate(doc_id)
+            return replaced
+
+        raise ValueError(f"Unknown enrichment job kind: {job['kind']}")
+
+    def _count(self, counter: str, error: Optional[Exception] = None):
+        with self._lock:
+            self.counters[counter] += 1
+            if error is not None:
+                self.last_error = f"{type(error).__name__}: {error}"[:300]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            "threads": len(self._threads),
+            "running": bool(self._threads) and not self._stop.is_set(),
+            "queue": self.metadata_store.enrichment_status(),
+            **counters,
+            "last_error": self.last_error,
+        }
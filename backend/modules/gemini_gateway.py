@@ -0,0 +1,340 @@
+"""
+Single gateway for every Gemini call (OCR, captions, table summaries, answers).
+
+One pooled genai.Client per process, with:
+  - a concurrency cap and bounded queue (admission.WorkloadClass),
+  - requests-per-minute and tokens-per-minute token buckets,
+  - retries with jittered exponential backoff on throttling / transient errors,
+  - a circuit breaker that fails fast while the API keeps erroring,
+  - per-operation latency and error metrics (stats()).
+
+Failures surface as GeminiError / GeminiUnavailable instead of text, so callers
+never index an error message as document content. GEMINI_BASE_URL points the
+client at a local stub server for testing.
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+import httpx
+from google import genai
+from google.genai import errors, types
+from admission import WorkloadClass, AdmissionRejected
+from config import (
+    GEMINI_BASE_URL, GEMINI_TIMEOUT, GEMINI_MAX_CONCURRENCY, GEMINI_QUEUE, GEMINI_QUEUE_TIMEOUT,
+    GEMINI_RPM, GEMINI_TPM, GEMINI_MAX_RETRIES, GEMINI_BACKOFF_BASE, GEMINI_BACKOFF_MAX,
+    GEMINI_BREAKER_THRESHOLD, GEMINI_BREAKER_COOLDOWN
+)
+
+RETRYABLE_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class GeminiError(Exception):
+    """A Gemini call failed and should not be retried as-is (bad request, no key, ...)."""
+
+
+class GeminiUnavailable(GeminiError):
+    """
+    Gemini is throttling, erroring or the breaker is open; try again later.
+    `throttled` means a rate limit (ours or the API's 429) rather than an outage.
+    """
+    def __init__(self, message: str, retry_after: int = 1, throttled: bool = False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.throttled = throttled
+
+
+def _is_retryable(e: Exception) -> bool:
+    if isinstance(e, errors.APIError):
+        return e.code in RETRYABLE_CODES
+    return isinstance(e, (httpx.TransportError, asyncio.TimeoutError, TimeoutError, ConnectionError))
+
+
+class TokenBucket:
+    """Refills `per_minute` units a minute. reserve() books units and returns how long to wait."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, units: float = 1) -> float:
+        if self.capacity <= 0:
+            return 0.0  # Limit disabled
+        with self._lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+            # A request bigger than the bucket still goes through, it just waits for a full bucket
+            self.level -= min(units, self.capacity)
+            return 0.0 if self.level >= 0 else -self.level / self.rate
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `threshold` consecutive failures; open rejects calls for
+    `cooldown` seconds, then half_open lets one probe through to decide.
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "open":
+                remaining = self.opened_at + self.cooldown - time.monotonic()
+                if remaining > 0:
+                    raise GeminiUnavailable("Gemini circuit breaker is open", retry_after=max(1, round(remaining)))
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "half_open":
+                if self._probing:
+                    raise GeminiUnavailable("Gemini circuit breaker is probing", retry_after=1)
+                self._probing = True
+
+    def success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == "half_open" or self.failures >= self.threshold:
+                if self.state != "open":
+                    self.trips += 1
+                    print(f"Gemini circuit breaker opened after {self.failures} failures")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        """A call got an answer that says nothing bad about API health (e.g. a 400)."""
+        with self._lock:
+            self._probing = False
+            if self.state == "half_open":
+                self.state = "closed"
+
+    def abandon(self):
+        """A call let through by before_call() never reached the API; the next one may probe."""
+        with self._lock:
+            self._probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures, "trips": self.trips}
+
+
+class _OpMetrics:
+    def __init__(self):
+        self.calls = 0
+        self.ok = 0
+        self.errors = 0
+        self.retries = 0
+        self.rejected = 0
+        self.payload_bytes = 0
+        self.latencies = deque(maxlen=512)
+        self.last_error: Optional[str] = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        ordered = sorted(self.latencies)
+        def pct(p):
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 1) if ordered else None
+        return {
+            "calls": self.calls, "ok": self.ok, "errors": self.errors, "retries": self.retries,
+            "rejected": self.rejected, "avg_payload_kb": round(self.payload_bytes / 1024 / self.calls, 1) if self.calls else 0,
+            "p50_ms": pct(0.5), "p95_ms": pct(0.95),
+            "max_ms": round(ordered[-1] * 1000, 1) if ordered else None, "last_error": self.last_error,
+        }
+
+
+class GeminiGateway:
+    def __init__(self, api_key: str, base_url: str = GEMINI_BASE_URL):
+        http_options = types.HttpOptions(timeout=int(GEMINI_TIMEOUT * 1000))
+        if base_url:
+            http_options.base_url = base_url
+        # One client (and its httpx connection pools, sync and async) for the whole process
+        self.client = genai.Client(api_key=api_key, http_options=http_options)
+        self.base_url = base_url or "default"
+        self.slots = WorkloadClass("gemini", GEMINI_MAX_CONCURRENCY, GEMINI_QUEUE, GEMINI_QUEUE_TIMEOUT)
+        self.requests = TokenBucket(GEMINI_RPM)
+        self.tokens = TokenBucket(GEMINI_TPM)
+        self.breaker = CircuitBreaker(GEMINI_BREAKER_THRESHOLD, GEMINI_BREAKER_COOLDOWN)
+        self._metrics: Dict[str, _OpMetrics] = {}
+        self._lock = threading.Lock()
+
+    def _begin(self, name: str, payload_bytes: int = 0) -> _OpMetrics:
+        with self._lock:
+            op = self._metrics.setdefault(name, _OpMetrics())
+            op.calls += 1
+            op.payload_bytes += payload_bytes
+            return op
+
+    @staticmethod
+    def _backoff(attempt: int, retry_after: Optional[float] = None) -> float:
+        # Full jitter: spreads out retries from many workers hitting the same quota
+        delay = random.uniform(0, min(GEMINI_BACKOFF_MAX, GEMINI_BACKOFF_BASE * (2 ** attempt)))
+        return max(delay, retry_after or 0)
+
+    def _throttle_delay(self, tokens: int) -> float:
+        return max(self.requests.reserve(1), self.tokens.reserve(tokens))
+
+    def _record(self, op: _OpMetrics, e: Optional[Exception], started: float):
+        with self._lock:
+            op.latencies.append(time.perf_counter() - started)
+            if e is None:
+                op.ok += 1
+            else:
+                op.errors += 1
+                op.last_error = f"{type(e).__name__}: {e}"[:300]
+
+    def _fail(self, op: _OpMetrics, e: Exception, started: float, attempt: int) -> Optional[float]:
+        """Books a failed attempt. Returns the backoff before the next try, or raises."""
+        self._record(op, e, started)
+        if not _is_retryable(e):
+            self.breaker.release()
+            raise GeminiError(str(e)) from e
+        self.breaker.failure()
+        if attempt >= GEMINI_MAX_RETRIES:
+            raise GeminiUnavailable(f"Gemini failed after {attempt + 1} attempts: {e}",
+                                    retry_after=max(1, round(self._backoff(attempt))),
+                                    throttled=isinstance(e, errors.APIError) and e.code == 429) from e
+        with self._lock:
+            op.retries += 1
+        return self._backoff(attempt)
+
+    def _reject(self, op: _OpMetrics, e: Exception):
+        with self._lock:
+            op.rejected += 1
+        if isinstance(e, AdmissionRejected):
+            raise GeminiUnavailable(f"Gemini queue: {e.reason}", retry_after=e.retry_after, throttled=True) from e
+        raise e
+
+    # --- Calls ---
+
+    def call(self, name: str, fn: Callable[[genai.Client], Any], tokens: int = 1, payload_bytes: int = 0) -> Any:
+        """Runs fn(client) under the limits, retrying transient failures. Blocking."""
+        op = self._begin(name, payload_bytes)
+        for attempt in range(GEMINI_MAX_RETRIES + 1):
+            try:
+                self.breaker.before_call()
+            except GeminiUnavailable as e:
+                self._reject(op, e)
+            try:
+                slot = self.slots.acquire()
+            except AdmissionRejected as e:
+                # before_call() may have made this call the half-open probe
+                self.breaker.abandon()
+                self._reject(op, e)
+            try:
+                time.sleep(self._throttle_delay(tokens))
+                started = time.perf_counter()
+                try:
+                    result = fn(self.client)
+                except Exception as e:
+                    delay = self._fail(op, e, started, attempt)
+                else:
+                    self._record(op, None, started)
+                    self.breaker.success()
+                    return result
+            finally:
+                self.slots.release(slot)
+            time.sleep(delay)
+
+    async def call_async(self, name: str, fn: Callable[[genai.Client], Any], tokens: int = 1) -> Any:
+        """Async variant of call(); fn(client) returns an awaitable (client.aio...)."""
+        op = self._begin(name)
+        for attempt in range(GEMINI_MAX_RETRIES + 1):
+            try:
+                self.breaker.before_call()
+            except GeminiUnavailable as e:
+                self._reject(op, e)
+            try:
+                slot = await self.slots.acquire_async()
+            except (AdmissionRejected, asyncio.CancelledError) as e:
+                # before_call() may have made this call the half-open probe
+                self.breaker.abandon()
+                self._reject(op, e)
+            try:
+                await asyncio.sleep(self._throttle_delay(tokens))
+                started = time.perf_counter()
+                try:
+                    result = await fn(self.client)
+                except asyncio.CancelledError:
+                    self.breaker.abandon()
+                    raise
+                except Exception as e:
+                    delay = self._fail(op, e, started, attempt)
+                else:
+                    self._record(op, None, started)
+                    self.breaker.success()
+                    return result
+            finally:
+                self.slots.release(slot)
+            await asyncio.sleep(delay)
+
+    async def stream_async(self, name: str, fn: Callable[[genai.Client], Any], tokens: int = 1) -> AsyncIterator[Any]:
+        """
+        Streams chunks from fn(client) (an awaitable returning an async iterator).
+        Retries only until the first chunk arrives; after that an error is final,
+        since the caller has already seen part of the output.
+        """
+        op = self._begin(name)
+        for attempt in range(GEMINI_MAX_RETRIES + 1):
+            try:
+                self.breaker.before_call()
+            except GeminiUnavailable as e:
+                self._reject(op, e)
+            try:
+                slot = await self.slots.acquire_async()
+            except (AdmissionRejected, asyncio.CancelledError) as e:
+                # before_call() may have made this call the half-open probe
+                self.breaker.abandon()
+                self._reject(op, e)
+            yielded = False
+            try:
+                await asyncio.sleep(self._throttle_delay(tokens))
+                started = time.perf_counter()
+                try:
+                    async for chunk in await fn(self.client):
+                        yielded = True
+                        yield chunk
+                except (asyncio.CancelledError, GeneratorExit):
+                    self.breaker.abandon()
+                    raise
+                except Exception as e:
+                    if yielded:
+                        self._record(op, e, started)
+                        self.breaker.failure()
+                        raise GeminiUnavailable(f"Gemini stream interrupted: {e}") from e
+                    delay = self._fail(op, e, started, attempt)
+                else:
+                    self._record(op, None, started)
+                    self.breaker.success()
+                    return
+            finally:
+                self.slots.release(slot)
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            operations = {name: op.snapshot() for name, op in self._metrics.items()}
+        return {
+            "base_url": self.base_url,
+            "breaker": self.breaker.stats(),
+            "concurrency": self.slots.stats(),
+            "limits": {"rpm": GEMINI_RPM, "tpm": GEMINI_TPM, "max_retries": GEMINI_MAX_RETRIES},
+            "operations": operations,
+        }
@@ -1,33 +1,109 @@
-import google.genai
+import io
 import os
 import time
-from typing import Dict, Any, List
-from config import GOOGLE_API_KEY, GEMINI_MODEL
+from typing import Dict, Any, List, AsyncIterator
+from google.genai import types
+from PIL import Image
+from config import (
+    GOOGLE_API_KEY, GEMINI_MODEL, GEMINI_IMAGE_MODE, GEMINI_IMAGE_FORMAT, GEMINI_IMAGE_QUALITY,
+    GEMINI_OCR_MAX_SIDE, GEMINI_OCR_GRAYSCALE, GEMINI_CAPTION_MAX_SIDE
+)
+from modules.gemini_gateway import GeminiGateway, GeminiError
+from modules.context import estimate_tokens, image_tokens
+from modules.renditions import encode_for_model
+
+ANSWER_PROMPT = """
+             You are a helpful AI assistant. Use the following document extracts (context) to answer the user's question.
+             Keep your answer concise (2-4 sentences) and professional.
+             If the answer is not in the context, say that you don't have enough information.
+             
+             Context:
+             {context}
+             
+             User Question: {query}
+             
+             Answer:
+             """
 
 class GeminiProcessor:
     def __init__(self, api_key: str = None, model_name: str = None):
         self.api_key = api_key or GOOGLE_API_KEY
         self.model_name = model_name or GEMINI_MODEL
         
+        self.gateway = None
         if not self.api_key:
              print("WARNING: GOOGLE_API_KEY not found. Gemini Vision will fail.")
         else:
-             genai.configure(api_key=self.api_key)
-             self.model = genai.GenerativeModel(self.model_name)
+             # All calls go through the gateway (limits, retries, breaker, metrics)
+             self.gateway = GeminiGateway(api_key=self.api_key)
+
+    def _require_gateway(self) -> GeminiGateway:
+        if not self.gateway:
+             raise GeminiError("No GOOGLE_API_KEY configured")
+        return self.gateway
+
+    def _generate(self, contents, op: str = "generate") -> str:
+        response = self._require_gateway().call(
+            op,
+            lambda client: client.models.generate_content(model=self.model_name, contents=contents),
+            tokens=estimate_tokens(contents)
+        )
+        return response.text or ""
 
-    def extract_text_from_image(self, image_path: str) -> Dict[str, Any]:
+    def describe_image(self, image_path: str, prompt: str, op: str = "describe_image",
+                       max_side: int = GEMINI_CAPTION_MAX_SIDE, grayscale: bool = False, mode: str = None) -> str:
         """
-        Uses Gemini Vision to read text from an image.
+        Returns Gemini's response to `prompt` about an image. Raises GeminiError.
+        mode "inline" (default) sends the image in the request, downscaled to
+        `max_side` and re-encoded; "upload" sends the original file through the
+        Files API (the A/B baseline, see manage.py ocr-ab).
         """
-        if not self.api_key:
-             return {"text": "ERR: NO API KEY", "confidence": 0}
+        gateway = self._require_gateway()
+        mode = mode or GEMINI_IMAGE_MODE
+        source_bytes = os.path.getsize(image_path)
+        start = time.perf_counter()
 
-        try:
-             # Load image for Gemini
-             sample_file = genai.upload_file(path=image_path, display_name=os.path.basename(image_path))
-             
-             # Prompt
-             prompt = """
+        if mode == "upload":
+             payload_bytes = source_bytes
+             with Image.open(image_path) as image:
+                 size = image.size
+             prepared = start
+             def generate(client):
+                 sample_file = client.files.upload(file=image_path)
+                 try:
+                     return client.models.generate_content(model=self.model_name, contents=[sample_file, prompt])
+                 finally:
+                     # Uploaded files otherwise linger in the project for 48 hours
+                     try:
+                         client.files.delete(name=sample_file.name)
+                     except Exception as e:
+                         print(f"Gemini file cleanup failed for {sample_file.name}: {e}")
+        else:
+             data, mime_type = encode_for_model(image_path, max_side, grayscale, GEMINI_IMAGE_FORMAT, GEMINI_IMAGE_QUALITY)
+             payload_bytes = len(data)
+             with Image.open(io.BytesIO(data)) as image:
+                 size = image.size
+             image_part = types.Part.from_bytes(data=data, mime_type=mime_type)
+             prepared = time.perf_counter()
+             def generate(client):
+                 return client.models.generate_content(model=self.model_name, contents=[image_part, prompt])
+
+        # Separate metrics per variant so the A/B comparison shows in /admin/llm
+        op = op if mode == "inline" else f"{op}_{mode}"
+        # Charge the limiter what Gemini bills: the image by its tiles, plus the prompt
+        tokens = image_tokens(*size) + estimate_tokens(prompt)
+        text = gateway.call(op, generate, tokens=tokens, payload_bytes=payload_bytes).text or ""
+        print(f"Gemini {op}: {payload_bytes / 1024:.0f} KB sent (source {source_bytes / 1024:.0f} KB), "
+              f"prepare {(prepared - start) * 1000:.0f} ms, call {(time.perf_counter() - prepared) * 1000:.0f} ms")
+        return text
+
+    def extract_text_from_image(self, image_path: str, mode: str = None) -> Dict[str, Any]:
+        """
+        Uses Gemini Vision to read text from an image. Raises GeminiError on
+        failure, so the caller can't mistake an error for page text.
+        """
+        # Prompt
+        prompt = """
              You are an expert document reader. Carefully read the provided scanned or handwritten document image.
              Extract all readable text accurately.
              Preserve paragraph breaks and logical order.
@@ -35,52 +111,58 @@ class GeminiProcessor:
              If text is unclear, mark it as [UNREADABLE].
              Return only the extracted text.
              """
-             
-             response = self.model.generate_content([sample_file, prompt])
-             
-             # Cleanup uploaded file if possible (though genai auto-expire usually)
-             # genai.delete_file(sample_file.name)
-             
-             return {
-                 "text": response.text,
-                 "confidence": 1.0, # Synthetic confidence for LLM
-                 "source": "gemini_vision"
-             }
-             
-        except Exception as e:
-             return {"text": f"ERR: GEMINI FAILED {str(e)}", "confidence": 0}
+
+        text = self.describe_image(
+             image_path, prompt, op="ocr_page", max_side=GEMINI_OCR_MAX_SIDE, grayscale=GEMINI_OCR_GRAYSCALE, mode=mode
+        )
+
+        return {
+             "text": text,
+             "confidence": 1.0, # Synthetic confidence for LLM
+             "source": "gemini_vision",
+             "image_mode": mode or GEMINI_IMAGE_MODE
+        }
 
     def summarize_text(self, text: str) -> str:
         """
-        Summarize a text block using Gemini Pro.
+        Summarize a text block using Gemini Pro. Raises GeminiError on failure.
         """
-        if not self.api_key: return "Summary Unavail (No Key)"
-        try:
-             prompt = f"Summarize the following table data in 2 concise sentences, focusing on key trends and numbers:\n\n{text}"
-             response = self.model.generate_content(prompt)
-             return response.text.replace("\n", " ").strip()
-        except Exception as e:
-             return f"Summary Failed: {str(e)}"
+        prompt = f"Summarize the following table data in 2 concise sentences, focusing on key trends and numbers:\n\n{text}"
+        return self._generate(prompt, op="summarize_table").replace("\n", " ").strip()
 
     def generate_answer(self, query: str, context: str) -> str:
         """
-        Generates a concise answer based on provided context chunks.
+        Generates a concise answer based on provided context chunks. Raises
+        GeminiError on failure, like the async variants.
+        """
+        return self._generate(ANSWER_PROMPT.format(context=context, query=query), op="answer").strip()
+
+    async def generate_answer_async(self, query: str, context: str) -> str:
         """
-        if not self.api_key: return "Answer generation unavailable (No API Key)."
+        Same as generate_answer, but awaits the HTTP call on the event loop
+        instead of blocking a worker thread. Raises GeminiError on failure so the
+        caller can tell a failed answer apart from a real one.
+        """
+        prompt = ANSWER_PROMPT.format(context=context, query=query)
+        response = await self._require_gateway().call_async(
+             "answer",
+             lambda client: client.aio.models.generate_content(model=self.model_name, contents=prompt),
+             tokens=estimate_tokens(prompt)
+        )
+        return (response.text or "").strip()
+
+    async def stream_answer_async(self, query: str, context: str) -> AsyncIterator[str]:
+        """Yields the answer as text fragments as Gemini produces them. Raises GeminiError on failure."""
+        prompt = ANSWER_PROMPT.format(context=context, query=query)
+        stream = self._require_gateway().stream_async(
+             "answer_stream",
+             lambda client: client.aio.models.generate_content_stream(model=self.model_name, contents=prompt),
+             tokens=estimate_tokens(prompt)
+        )
         try:
-             prompt = f"""
-             You are a helpful AI assistant. Use the following document extracts (context) to answer the user's question.
-             Keep your answer concise (2-4 sentences) and professional.
-             If the answer is not in the context, say that you don't have enough information.
-             
-             Context:
-             {context}
-             
-             User Question: {query}
-             
-             Answer:
-             """
-             response = self.model.generate_content(prompt)
-             return response.text.strip()
-        except Exception as e:
-             return f"Error Generating Answer: {str(e)}"
+             async for chunk in stream:
+                 if chunk.text:
+                     yield chunk.text
+        finally:
+             # Frees the gateway slot right away if our caller stops reading early
+             await stream.aclose()
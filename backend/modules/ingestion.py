@@ -1,31 +1,65 @@
 import fitz  # PyMuPDF
+import hashlib
 import os
-from typing import Dict, Any, List
-from config import DATA_DIR
+import time
+from typing import Dict, Any, List, Optional, Set, Tuple
+from modules.renditions import pages_dir, render_page, rendition_name
+
+# Resolution of the grayscale render hashed into a page fingerprint: coarse enough
+# to be fast, fine enough to catch a changed figure or scanned text
+FINGERPRINT_DPI = 24
+
+# Borderless-table heuristic: this many text lines whose word columns start at
+# the same x positions (at least TABLE_MIN_COLUMNS of them) make a table candidate
+TABLE_MIN_ALIGNED_LINES = 4
+TABLE_MIN_COLUMNS = 3
+COLUMN_GAP_PT = 12  # horizontal gap between words that starts a new column
+# find_tables is the costly check; only run it on pages with at least this many ruling lines
+TABLE_MIN_RULINGS = 4
 
 class PDFIngestor:
     def __init__(self, file_path: str):
         self.file_path = file_path
         self.doc = fitz.open(file_path)
 
-    def extract_page_images(self, doc_id: str) -> List[str]:
+    def extract_page_images(self, doc_id: str, keep_full: bool = False, pages: Optional[Set[int]] = None,
+                            output_dir: Optional[str] = None) -> List[str]:
         """
-        Converts all PDF pages to images and saves them for inspection/OCR.
+        Saves every page as thumbnail + screen renditions for inspection, plus a
+        full-resolution PNG when `keep_full` (needed for OCR / Gemini input).
+        Returns the full paths when kept, else the screen paths. With `pages`
+        (1-based) only those are rendered; the others keep their stored renditions.
+        `output_dir` (default: the document's pages directory) receives the new renditions.
         """
-        output_dir = os.path.join(DATA_DIR, "static", "pages", doc_id)
+        stored_dir = pages_dir(doc_id)
+        output_dir = output_dir or stored_dir
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
             
         image_paths = []
+        kind = "full" if keep_full else "screen"
         for i, page in enumerate(self.doc):
-            pix = page.get_pixmap(dpi=300) # High DPI for OCR
-            filename = f"page_{i+1:03d}.png"
-            path = os.path.join(output_dir, filename)
-            pix.save(path)
-            image_paths.append(path)
+            if pages is not None and i + 1 not in pages:
+                image_paths.append(os.path.join(stored_dir, rendition_name(i + 1, kind)))
+                continue
+            paths = render_page(page, output_dir, i + 1, keep_full=keep_full)
+            image_paths.append(paths[kind])
             
         return image_paths
 
+    def page_fingerprints(self) -> List[str]:
+        """
+        One fingerprint per page: a hash of its text layer plus a hash of a coarse
+        grayscale render (catches scanned pages and changed figures, which have no text).
+        """
+        fingerprints = []
+        for page in self.doc:
+            text = hashlib.sha1(page.get_text().encode("utf-8")).hexdigest()[:16]
+            pix = page.get_pixmap(dpi=FINGERPRINT_DPI, colorspace=fitz.csGRAY)
+            raster = hashlib.sha1(pix.samples).hexdigest()[:16]
+            fingerprints.append(f"{text}:{raster}")
+        return fingerprints
+
     def classify_pdf(self) -> str:
         """
         Classifies the PDF as DIGITAL, SCANNED, or MIXED based on text content.
@@ -45,6 +79,68 @@ class PDFIngestor:
         else:
             return "MIXED"
 
+    def detect_table_pages(self, pages: Optional[Set[int]] = None) -> Tuple[Set[int], Dict[str, Any]]:
+        """
+        Cheap pre-pass that marks pages which may hold a table, so Docling's table
+        structure model only runs there. A page is a candidate if it has no text
+        layer (scanned: only OCR can tell), if PyMuPDF finds a ruled table, or if
+        several lines share the same column layout (borderless tables).
+        `pages` limits the scan to those pages. Returns (1-based page numbers, stats).
+        """
+        start = time.perf_counter()
+        candidates: Set[int] = set()
+        reasons = {"scanned": 0, "ruled": 0, "aligned": 0}
+        for i, page in enumerate(self.doc):
+            if pages is not None and i + 1 not in pages:
+                continue
+            if len(page.get_text().strip()) <= 50:
+                reason = "scanned"
+            elif self._count_rulings(page) >= TABLE_MIN_RULINGS and page.find_tables().tables:
+                reason = "ruled"
+            elif self._has_aligned_columns(page):
+                reason = "aligned"
+            else:
+                continue
+            candidates.add(i + 1)
+            reasons[reason] += 1
+        return candidates, {
+            "pages": len(self.doc),
+            "table_pages": sorted(candidates),
+            "reasons": reasons,
+            "detect_ms": round((time.perf_counter() - start) * 1000, 1),
+        }
+
+    @staticmethod
+    def _count_rulings(page) -> int:
+        """Horizontal/vertical line segments and rectangles drawn on the page."""
+        count = 0
+        for drawing in page.get_drawings():
+            for item in drawing["items"]:
+                if item[0] == "re":
+                    count += 1
+                elif item[0] == "l" and (abs(item[1].x - item[2].x) < 1 or abs(item[1].y - item[2].y) < 1):
+                    count += 1
+        return count
+
+    @staticmethod
+    def _has_aligned_columns(page) -> bool:
+        lines: Dict[Tuple[int, int], List[tuple]] = {}
+        for word in page.get_text("words"):
+            lines.setdefault((word[5], word[6]), []).append(word)
+
+        layouts: Dict[tuple, int] = {}
+        for words in lines.values():
+            words.sort(key=lambda w: w[0])
+            starts = [words[0][0]]
+            for prev, word in zip(words, words[1:]):
+                if word[0] - prev[2] >= COLUMN_GAP_PT:
+                    starts.append(word[0])
+            if len(starts) >= TABLE_MIN_COLUMNS:
+                # Snap to a 5pt grid so small kerning differences still line up
+                layout = tuple(round(x / 5) for x in starts)
+                layouts[layout] = layouts.get(layout, 0) + 1
+        return any(n >= TABLE_MIN_ALIGNED_LINES for n in layouts.values())
+
     def get_metadata(self) -> Dict[str, Any]:
         return {
             "filename": os.path.basename(self.file_path),
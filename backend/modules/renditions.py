@@ -0,0 +1,176 @@
+import fitz
+import io
+import os
+import re
+from typing import Dict, Any, List, Optional, Tuple
+from PIL import Image
+from config import (
+    STATIC_DIR, PAGE_THUMB_WIDTH, PAGE_SCREEN_WIDTH, PAGE_SCREEN_FORMAT,
+    PAGE_IMAGE_QUALITY, PAGE_FULL_DPI
+)
+
+PAGES_DIR = os.path.join(STATIC_DIR, "pages")
+# Legacy layout: one 300 DPI PNG per page
+LEGACY_PAGE_RE = re.compile(r"^page_(\d+)\.png$")
+FORMATS = {"jpeg": ("jpg", "image/jpeg"), "webp": ("webp", "image/webp"), "png": ("png", "image/png")}
+
+
+def pages_dir(doc_id: str) -> str:
+    return os.path.join(PAGES_DIR, doc_id)
+
+def rendition_name(page_num: int, kind: str) -> str:
+    """page_001.thumb.jpg, page_001.screen.webp, page_001.full.png"""
+    fmt = {"thumb": "jpeg", "screen": PAGE_SCREEN_FORMAT, "full": "png"}[kind]
+    return f"page_{page_num:03d}.{kind}.{FORMATS[fmt][0]}"
+
+def media_type(path: str) -> str:
+    ext = os.path.splitext(path)[1].lstrip(".")
+    return next((m for e, m in FORMATS.values() if e == ext), "application/octet-stream")
+
+def _save(image: Image.Image, path: str):
+    fmt = {"jpg": "JPEG", "webp": "WEBP", "png": "PNG"}[os.path.splitext(path)[1].lstrip(".")]
+    if fmt == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    options = {"optimize": True} if fmt == "PNG" else {"quality": PAGE_IMAGE_QUALITY}
+    image.save(path, fmt, **options)
+
+def _scaled(image: Image.Image, width: int) -> Image.Image:
+    if image.width <= width:
+        return image
+    return image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+
+def save_image_renditions(image: Image.Image, output_dir: str, page_num: int) -> Dict[str, str]:
+    """Writes the thumb and screen renditions of one page image."""
+    paths = {}
+    screen = _scaled(image, PAGE_SCREEN_WIDTH)
+    for kind, source, width in (("screen", screen, PAGE_SCREEN_WIDTH), ("thumb", screen, PAGE_THUMB_WIDTH)):
+        paths[kind] = os.path.join(output_dir, rendition_name(page_num, kind))
+        _save(_scaled(source, width), paths[kind])
+    return paths
+
+def render_page(page, output_dir: str, page_num: int, keep_full: bool = False) -> Dict[str, str]:
+    """
+    Renders one PDF page as a thumbnail and a screen-size image, plus the full
+    PAGE_FULL_DPI PNG when `keep_full` (OCR / Gemini input).
+    """
+    # Render once at screen scale instead of downscaling a 300 DPI bitmap
+    zoom = min(PAGE_SCREEN_WIDTH / page.rect.width, PAGE_FULL_DPI / 72) if page.rect.width else 1
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+    paths = save_image_renditions(Image.open(io.BytesIO(pix.tobytes("png"))), output_dir, page_num)
+    if keep_full:
+        paths["full"] = os.path.join(output_dir, rendition_name(page_num, "full"))
+        page.get_pixmap(dpi=PAGE_FULL_DPI).save(paths["full"])
+    return paths
+
+def resolve(doc_id: str, page_num: int, size: Optional[str] = None, width: Optional[int] = None) -> Tuple[Optional[str], str]:
+    """
+    Picks the stored rendition for a request: an explicit `size` (thumb|screen|full)
+    or the smallest rendition at least `width` pixels wide. Returns (path, kind);
+    path is None when the full rendition was asked for but not kept.
+    """
+    if not size:
+        if width and width <= PAGE_THUMB_WIDTH:
+            size = "thumb"
+        elif not width or width <= PAGE_SCREEN_WIDTH:
+            size = "screen"
+        else:
+            size = "full"
+    if size not in ("thumb", "screen", "full"):
+        raise ValueError(f"Unknown rendition size: {size}")
+
+    directory = pages_dir(doc_id)
+    path = os.path.join(directory, rendition_name(page_num, size))
+    if os.path.exists(path):
+        return path, size
+    # Not backfilled yet: serve the legacy PNG for any size
+    legacy = os.path.join(directory, f"page_{page_num:03d}.png")
+    if os.path.exists(legacy):
+        return legacy, "legacy"
+    if size == "full":
+        return None, size
+    raise FileNotFoundError(f"No page {page_num} rendition for {doc_id}")
+
+def encode_for_model(image_path: str, max_side: int, grayscale: bool, fmt: str = "webp",
+                     quality: int = PAGE_IMAGE_QUALITY) -> Tuple[bytes, str]:
+    """
+    Prepares an image to send inline to a vision model: optional grayscale,
+    downscale so the longer side is at most `max_side`, then JPEG/WebP encoding.
+    If the source file is already smaller than the re-encoded result and needs
+    no resizing, its own bytes are sent. Returns (bytes, mime type).
+    """
+    with open(image_path, "rb") as f:
+        original = f.read()
+    with Image.open(io.BytesIO(original)) as image:
+        image.load()
+        source_format = (image.format or "").lower()
+        # Convert first: resampling one channel is about 3x cheaper than three
+        if grayscale:
+            image = image.convert("L")
+        elif image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        needs_resize = max(image.size) > max_side
+        if needs_resize:
+            scale = max_side / max(image.size)
+            image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.LANCZOS)
+        buffer = io.BytesIO()
+        if fmt == "webp":
+            # method=2 encodes about twice as fast as the default for a few percent more bytes
+            image.save(buffer, "WEBP", quality=quality, method=2)
+        else:
+            image.save(buffer, "JPEG", quality=quality)
+    encoded = buffer.getvalue()
+    original_mime = {"jpeg": "image/jpeg", "png": "image/png", "webp": "image/webp"}.get(source_format)
+    if not needs_resize and not grayscale and original_mime and len(original) <= len(encoded):
+        return original, original_mime
+    return encoded, FORMATS["webp" if fmt == "webp" else "jpeg"][1]
+
+def render_full_on_demand(pdf_path: str, page_num: int, width: Optional[int] = None) -> bytes:
+    """Renders a page as PNG straight from the PDF (used when no full rendition was kept)."""
+    doc = fitz.open(pdf_path)
+    try:
+        if page_num < 1 or page_num > len(doc):
+            raise IndexError("Page out of range")
+        page = doc[page_num - 1]
+        dpi = PAGE_FULL_DPI
+        if width and page.rect.width:
+            dpi = min(PAGE_FULL_DPI, max(72, round(width / page.rect.width * 72)))
+        return page.get_pixmap(dpi=dpi).tobytes("png")
+    finally:
+        doc.close()
+
+def backfill_document(doc_id: str, keep_full: bool = False) -> Dict[str, Any]:
+    """
+    Converts a document's legacy page_NNN.png files into renditions. The PNG is
+    kept as the full rendition when `keep_full`, otherwise deleted.
+    """
+    directory = pages_dir(doc_id)
+    report = {"doc_id": doc_id, "pages": 0, "bytes_before": 0, "bytes_after": 0}
+    if not os.path.isdir(directory):
+        return report
+    for name in sorted(os.listdir(directory)):
+        match = LEGACY_PAGE_RE.match(name)
+        if not match:
+            continue
+        page_num = int(match.group(1))
+        legacy = os.path.join(directory, name)
+        report["bytes_before"] += os.path.getsize(legacy)
+        with Image.open(legacy) as image:
+            image.load()
+            paths = save_image_renditions(image, directory, page_num)
+        if keep_full:
+            paths["full"] = os.path.join(directory, rendition_name(page_num, "full"))
+            os.replace(legacy, paths["full"])
+        else:
+            os.remove(legacy)
+        report["bytes_after"] += sum(os.path.getsize(p) for p in paths.values())
+        report["pages"] += 1
+    return report
+
+def backfill_all(keep_full: bool = False) -> List[Dict[str, Any]]:
+    if not os.path.isdir(PAGES_DIR):
+        return []
+    return [
+        backfill_document(doc_id, keep_full=keep_full)
+        for doc_id in sorted(os.listdir(PAGES_DIR))
+        if os.path.isdir(pages_dir(doc_id))
+    ]
@@ -0,0 +1,281 @@
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+SQL_TYPES = {"integer": "INTEGER", "real": "REAL", "text": "TEXT"}
+AGGREGATES = {"sum": "SUM", "avg": "AVG", "min": "MIN", "max": "MAX", "count": "COUNT"}
+FILTER_OPS = {"=": "=", "!=": "!=", ">": ">", ">=": ">=", "<": "<", "<=": "<=", "contains": "LIKE"}
+
+# Words that map a question onto an aggregation over a column
+AGG_WORDS = {
+    "total": "sum", "sum": "sum",
+    "average": "avg", "mean": "avg",
+    "highest": "max", "maximum": "max", "largest": "max", "most": "max", "max": "max",
+    "lowest": "min", "minimum": "min", "smallest": "min", "least": "min", "min": "min",
+}
+# A question has to look numeric before it is routed away from the LLM: a quantity or
+# aggregate word, a unit, or a figure such as a year or quarter ("Q3", "2024")
+TABULAR_CUE = re.compile(
+    r"\b(how much|how many|value of|number of|amount|"
+    + "|".join(w for w in AGG_WORDS if w not in ("most", "least")) + r")\b|%|\$|\b[a-z]*\d+[a-z0-9]*\b"
+)
+# Question tokens a cell lookup must match across its row label and column header
+MIN_LOOKUP_TOKENS = 2
+# Row labels left out of column aggregates, so a table's own totals aren't counted again
+TOTAL_LABELS = ("total%", "subtotal%", "sub-total%", "sub total%", "grand total%")
+STOPWORDS = {
+    "the", "a", "an", "of", "in", "for", "to", "on", "and", "or", "by", "at", "is", "was", "were", "are",
+    "what", "which", "how", "much", "many", "did", "does", "do", "value", "number", "amount", "table",
+} | (set(AGG_WORDS) - {"total", "sum"})  # keep these so a "Total" row label can match
+
+
+def _tokens(text: Any) -> set:
+    return {t for t in re.findall(r"[a-z0-9]+", str(text).lower()) if t not in STOPWORDS}
+
+def _sql_name(header: Any, position: int, used: set) -> str:
+    base = re.sub(r"\W+", "_", str(header)).strip("_").lower() or f"col{position}"
+    if base[0].isdigit():
+        base = f"c_{base}"
+    name, n = base, 2
+    while name in used:
+        name, n = f"{base}_{n}", n + 1
+    used.add(name)
+    return name
+
+def _fmt(value: Any) -> str:
+    if isinstance(value, float):
+        return f"{value:,.4f}".rstrip("0").rstrip(".")
+    if isinstance(value, int):
+        return f"{value:,}"
+    return str(value)
+
+
+class TableQueryEngine:
+    """
+    Structured queries over a document's extracted tables. Each document's typed
+    tables are loaded into an in-memory SQLite database (one SQL table per extracted
+    table) and cached until the document is re-saved.
+    """
+
+    def __init__(self, metadata_store, cache_size: int = 32):
+        self.metadata_store = metadata_store
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _load(self, doc_id: str):
+        updated_at = self.metadata_store.updated_at(doc_id)
+        with self._lock:
+            cached = self._cache.get(doc_id)
+            if cached and cached[0] == updated_at:
+                self._cache.move_to_end(doc_id)
+                return cached[1], cached[2]
+
+            conn = sqlite3.connect(":memory:", check_same_thread=False)
+            catalog = []
+            for t in self.metadata_store.load_typed_tables(doc_id):
+                used = set()
+                columns = []
+                for j, column_type in enumerate(t["column_types"]):
+                    header = t["headers"][j] if j < len(t["headers"]) else f"col{j}"
+                    columns.append({"name": str(header), "sql": _sql_name(header, j, used), "type": column_type})
+                if not columns:
+                    continue
+
+                table_name = f"t{t['idx']}"
+                decl = ", ".join(f'"{c["sql"]}" {SQL_TYPES[c["type"]]}' for c in columns)
+                conn.execute(f'CREATE TABLE "{table_name}" ({decl})')
+                rows = list(zip(*t["columns"]))
+                if rows:
+                    conn.executemany(f'INSERT INTO "{table_name}" VALUES ({",".join("?" * len(columns))})', rows)
+                catalog.append({"table": table_name, "idx": t["idx"], "page": t["page"], "columns": columns, "rows": len(rows)})
+            conn.commit()
+
+            if cached:
+                cached[1].close()
+            self._cache[doc_id] = (updated_at, conn, catalog)
+            self._cache.move_to_end(doc_id)
+            while len(self._cache) > self.cache_size:
+                _, (_, old_conn, _) = self._cache.popitem(last=False)
+                old_conn.close()
+            return conn, catalog
+
+    def invalidate(self, doc_id: str):
+        with self._lock:
+            cached = self._cache.pop(doc_id, None)
+            if cached:
+                cached[1].close()
+
+    def schema(self, doc_id: str) -> List[Dict[str, Any]]:
+        _, catalog = self._load(doc_id)
+        return [
+            {
+                "table": t["idx"],
+                "page": t["page"],
+                "rows": t["rows"],
+                "columns": [{"name": c["name"], "type": c["type"]} for c in t["columns"]]
+            }
+            for t in catalog
+        ]
+
+    @staticmethod
+    def _resolve(table: Dict[str, Any], name: str) -> Optional[Dict[str, Any]]:
+        wanted = str(name).strip().lower()
+        for c in table["columns"]:
+            if c["name"].strip().lower() == wanted or c["sql"] == wanted:
+                return c
+        return None
+
+    def query(self, doc_id: str, table: Optional[int] = None, columns: Optional[List[str]] = None,
+              filters: Optional[List[Dict[str, Any]]] = None, aggregate: Optional[Dict[str, str]] = None,
+              group_by: Optional[str] = None, order_by: Optional[str] = None,
+              descending: bool = False, limit: int = 100) -> Dict[str, Any]:
+        """
+        Runs a filter / aggregation against one table (by index) or every table of the
+        document that has all referenced columns. Column names are the table headers.
+
+        filters:   [{"column": "Region", "op": "=", "value": "EMEA"}]  (ops: = != > >= < <= contains)
+        aggregate: {"op": "sum", "column": "Revenue"}                   (ops: sum avg min max count)
+        """
+        conn, catalog = self._load(doc_id)
+        filters = filters or []
+        if aggregate and aggregate.get("op") not in AGGREGATES:
+            raise ValueError(f"Unsupported aggregate: {aggregate.get('op')}")
+        for f in filters:
+            if f.get("op", "=") not in FILTER_OPS:
+                raise ValueError(f"Unsupported filter operator: {f.get('op')}")
+
+        results = []
+        for t in catalog:
+            if table is not None and t["idx"] != table:
+                continue
+
+            referenced = list(columns or []) + [f["column"] for f in filters]
+            referenced += [c for c in (group_by, order_by) if c]
+            if aggregate and aggregate.get("column"):
+                referenced.append(aggregate["column"])
+            resolved = {name: self._resolve(t, name) for name in referenced}
+            if any(c is None for c in resolved.values()):
+                if table is not None:
+                    missing = [n for n, c in resolved.items() if c is None]
+                    raise ValueError(f"Unknown column(s) in table {table}: {missing}")
+                continue
+
+            select, out_columns = [], []
+            if group_by:
+                select.append(f'"{resolved[group_by]["sql"]}"')
+                out_columns.append(resolved[group_by]["name"])
+            if aggregate:
+                target = f'"{resolved[aggregate["column"]]["sql"]}"' if aggregate.get("column") else "*"
+                select.append(f'{AGGREGATES[aggregate["op"]]}({target})')
+                out_columns.append(f'{aggregate["op"]}({aggregate.get("column", "*")})')
+            elif not group_by:
+                picked = [resolved[n] for n in columns] if columns else t["columns"]
+                select.extend(f'"{c["sql"]}"' for c in picked)
+                out_columns.extend(c["name"] for c in picked)
+
+            sql = f'SELECT {", ".join(select)} FROM "{t["table"]}"'
+            params: List[Any] = []
+            if filters:
+                clauses = []
+                for f in filters:
+                    op = f.get("op", "=")
+                    clauses.append(f'"{resolved[f["column"]]["sql"]}" {FILTER_OPS[op]} ?')
+                    params.append(f"%{f['value']}%" if op == "contains" else f["value"])
+                sql += " WHERE " + " AND ".join(clauses)
+            if group_by:
+                sql += f' GROUP BY "{resolved[group_by]["sql"]}"'
+            if order_by:
+                sql += f' ORDER BY "{resolved[order_by]["sql"]}" {"DESC" if descending else "ASC"}'
+            sql += " LIMIT ?"
+            params.append(limit)
+
+            with self._lock:
+                rows = conn.execute(sql, params).fetchall()
+            results.append({"table": t["idx"], "page": t["page"], "columns": out_columns, "rows": [list(r) for r in rows]})
+
+        return {"doc_id": doc_id, "results": results}
+
+    def answer_lookup(self, question: str, doc_ids: List[str]) -> Optional[Dict[str, Any]]:
+        """
+        Answers clearly tabular questions ("what was Q3 revenue?") straight from the
+        tables of `doc_ids`, without the LLM. Matches question terms against row labels
+        (first text column) and numeric column headers, and needs MIN_LOOKUP_TOKENS of
+        them; falls back to a column aggregate (total rows excluded) for "total /
+        average / highest ..." questions. Returns None when the question isn't
+        tabular or nothing matches confidently, so the LLM answers instead.
+        """
+        if not TABULAR_CUE.search(question.lower()):
+            return None
+        q_tokens = _tokens(question)
+        if not q_tokens:
+            return None
+        agg = next((AGG_WORDS[w] for w in re.findall(r"[a-z]+", question.lower()) if w in AGG_WORDS), None)
+
+        best, best_score = None, 0.0
+        for doc_id in doc_ids:
+            conn, catalog = self._load(doc_id)
+            for t in catalog:
+                numeric = [c for c in t["columns"] if c["type"] != "text"]
+                if not numeric:
+                    continue
+                label_col = next((c for c in t["columns"] if c["type"] == "text"), None)
+                col = max(numeric, key=lambda c: len(q_tokens & _tokens(c["name"])))
+                col_score = len(q_tokens & _tokens(col["name"]))
+
+                row_label, value, row_score = None, None, 0
+                if label_col:
+                    with self._lock:
+                        rows = conn.execute(f'SELECT "{label_col["sql"]}", "{col["sql"]}" FROM "{t["table"]}"').fetchall()
+                    for label, cell in rows:
+                        score = len(q_tokens & _tokens(label))
+                        if score > row_score and cell is not None:
+                            row_label, value, row_score = label, cell, score
+
+                base = {"doc_id": doc_id, "page": t["page"], "table": t["idx"], "column": col["name"]}
+                # Cell lookup: row label and column header both match (or the table has one numeric column),
+                # on enough tokens between them that a passing word can't route a prose question here
+                if row_score and (col_score or len(numeric) == 1) and row_score + col_score >= MIN_LOOKUP_TOKENS:
+                    score = row_score + col_score
+                    if score > best_score:
+                        best_score = score
+                        best = dict(base, operation="lookup", row_label=row_label, value=value,
+                                    answer=f"{row_label} — {col['name']}: {_fmt(value)}")
+                # Column aggregate: "total revenue", "highest margin", ...
+                elif agg and col_score:
+                    score = col_score + 0.5
+                    if score <= best_score:
+                        continue
+                    sql_col = f'"{col["sql"]}"'
+                    where = f"{sql_col} IS NOT NULL"
+                    if label_col:
+                        label = f'LOWER(TRIM("{label_col["sql"]}"))'
+                        where += f' AND ("{label_col["sql"]}" IS NULL OR NOT ('
+                        where += " OR ".join(f"{label} LIKE '{pattern}'" for pattern in TOTAL_LABELS) + "))"
+                    with self._lock:
+                        if agg in ("max", "min") and label_col:
+                            order = "DESC" if agg == "max" else "ASC"
+                            row = conn.execute(
+                                f'SELECT "{label_col["sql"]}", {sql_col} FROM "{t["table"]}" '
+                                f'WHERE {where} ORDER BY {sql_col} {order} LIMIT 1'
+                            ).fetchone()
+                            if not row:
+                                continue
+                            row_label, value = row
+                            answer = f"{row_label} has the {'highest' if agg == 'max' else 'lowest'} {col['name']}: {_fmt(value)}"
+                        else:
+                            value = conn.execute(
+                                f'SELECT {AGGREGATES[agg]}({sql_col}) FROM "{t["table"]}" WHERE {where}'
+                            ).fetchone()[0]
+                            if value is None:
+                                continue
+                            row_label = None
+                            answer = f"{'Total' if agg == 'sum' else agg.upper()} {col['name']}: {_fmt(value)}"
+                    best_score = score
+                    best = dict(base, operation=agg, row_label=row_label, value=value, answer=answer)
+
+        if best:
+            best["answer"] += f" (table on page {best['page']} of {best['doc_id']})"
+        return best
@@ -4,6 +4,10 @@ from PIL import Image
 import io
 from config import IMAGE_DIR, GOOGLE_API_KEY
 
+CAPTION_PROMPT = """Analyze this image extracted from a document.
+Summarize its context and content in 1-2 concise sentences.
+Identify if it's a chart, diagram, photograph, or logo and what it represents."""
+
 class VisionProcessor:
     def __init__(self, gemini_processor=None):
         self.images_dir = IMAGE_DIR
@@ -11,11 +15,19 @@ class VisionProcessor:
             os.makedirs(self.images_dir)
         self.gemini = gemini_processor
 
-    def extract_images(self, file_path: str, doc_id: str):
+    def extract_images(self, file_path: str, doc_id: str, caption: bool = True, pages=None, output_dir=None):
+        """
+        Saves every embedded image and captions it. With caption=False the images get a
+        placeholder caption and "caption_status": "pending", for the enrichment worker.
+        `pages` (1-based) limits extraction to those pages. `output_dir` writes the files
+        elsewhere (a staging directory); "path" is still where they end up in images_dir.
+        """
         doc = fitz.open(file_path)
         image_metadata = []
         
         for i, page in enumerate(doc):
+            if pages is not None and i + 1 not in pages:
+                continue
             image_list = page.get_images()
             
             for img_index, img in enumerate(image_list):
@@ -25,20 +37,23 @@ class VisionProcessor:
                 ext = base_image["ext"]
                 
                 image_filename = f"{doc_id}_page{i+1}_img{img_index}.{ext}"
-                image_path = os.path.join(self.images_dir, image_filename)
+                image_path = os.path.join(output_dir or self.images_dir, image_filename)
                 
                 with open(image_path, "wb") as f:
                     f.write(image_bytes)
                 
-                # Generate AI Caption using Gemini Vision
-                caption = self._generate_caption(image_path, i+1)
-                
-                image_metadata.append({
+                entry = {
                     "image_id": image_filename,
-                    "path": image_path,
+                    "path": os.path.join(self.images_dir, image_filename),
                     "page": i+1,
-                    "caption": caption
-                })
+                }
+                if caption:
+                    # Generate AI Caption using Gemini Vision
+                    entry["caption"] = self._generate_caption(image_path, i+1)
+                else:
+                    entry["caption"] = f"Image extracted from page {i+1}"
+                    entry["caption_status"] = "pending"
+                image_metadata.append(entry)
                 
         return image_metadata
     
@@ -46,17 +61,9 @@ class VisionProcessor:
         """Generate descriptive caption for image using Gemini Vision"""
         if self.gemini and self.gemini.api_key:
             try:
-                import google.generativeai as genai
                 # Note: self.gemini should be an instance of GeminiProcessor
-                # which already has self.model configured with the right model name from config.py
-                
-                sample_file = genai.upload_file(path=image_path)
-                prompt = """Analyze this image extracted from a document. 
-                Summarize its context and content in 1-2 concise sentences. 
-                Identify if it's a chart, diagram, photograph, or logo and what it represents."""
-                
-                response = self.gemini.model.generate_content([sample_file, prompt])
-                return response.text.strip()
+                # which already has its client configured with the model name from config.py
+                return self.gemini.describe_image(image_path, CAPTION_PROMPT, op="caption").strip()
             except Exception as e:
                 print(f"Caption generation failed: {e}")
                 return f"Image extracted from page {page_num}"
@@ -1,8 +1,15 @@
 from docling.document_converter import DocumentConverter, PdfFormatOption
 from docling.datamodel.base_models import InputFormat
 from docling.datamodel.pipeline_options import PdfPipelineOptions
+import fitz
+import time
 import pandas as pd
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Set, Tuple
+from config import DOCLING_TABLE_FULL_FRACTION
+
+# A run of table-free pages shorter than this is converted with its neighbours
+# instead of in a pass of its own (each pass re-opens the PDF)
+MIN_SKIP_RUN = 2
 
 class DoclingParser:
     def __init__(self):
@@ -18,19 +25,129 @@ class DoclingParser:
             }
         )
 
-    def process(self, file_path: str) -> Dict[str, Any]:
+        # Same pipeline without the table-structure model, for pages without table candidates
+        self.text_options = PdfPipelineOptions()
+        self.text_options.do_ocr = True
+        self.text_options.do_table_structure = False
+        self.text_converter = DocumentConverter(
+            allowed_formats=[InputFormat.PDF],
+            format_options={
+                InputFormat.PDF: PdfFormatOption(pipeline_options=self.text_options)
+            }
+        )
+
+        # Moving average of wall time per page for passes with / without the table model;
+        # their difference estimates what skipping the table model saves
+        self.ms_per_page: Dict[bool, Optional[float]] = {True: None, False: None}
+
+    @staticmethod
+    def _plan(page_count: int, table_pages: Optional[Set[int]],
+              pages: Optional[Set[int]] = None) -> List[Tuple[int, int, bool]]:
+        """Splits the selected pages (default 1..page_count) into contiguous (first, last, with_tables) passes."""
+        selected = sorted(pages) if pages is not None else list(range(1, page_count + 1))
+        full = table_pages is None or len(table_pages & set(selected)) > DOCLING_TABLE_FULL_FRACTION * len(selected)
+        runs: List[List[Any]] = []
+        for page in selected:
+            flag = full or page in table_pages
+            if runs and runs[-1][2] == flag and runs[-1][1] == page - 1:
+                runs[-1][1] = page
+            else:
+                runs.append([page, page, flag])
+        # Fold short table-free gaps into the table passes around them
+        for run in runs:
+            if not run[2] and run[1] - run[0] + 1 < MIN_SKIP_RUN:
+                run[2] = True
+        merged: List[Tuple[int, int, bool]] = []
+        for first, last, flag in runs:
+            if merged and merged[-1][2] == flag and merged[-1][1] == first - 1:
+                merged[-1] = (merged[-1][0], last, flag)
+            else:
+                merged.append((first, last, flag))
+        return merged
+
+    def _record_pass(self, with_tables: bool, elapsed_ms: float, page_count: int):
+        per_page = elapsed_ms / page_count
+        last = self.ms_per_page[with_tables]
+        self.ms_per_page[with_tables] = per_page if last is None else 0.8 * last + 0.2 * per_page
+
+    def _table_ms_per_page(self) -> Optional[float]:
+        if self.ms_per_page[True] is None or self.ms_per_page[False] is None:
+            return None
+        return max(0.0, self.ms_per_page[True] - self.ms_per_page[False])
+
+    def process(self, file_path: str, table_pages: Optional[Set[int]] = None,
+                pages: Optional[Set[int]] = None) -> Dict[str, Any]:
         """
-        Parses the PDF once and returns both structured chunks and table metadata.
+        Parses the PDF and returns both structured chunks and table metadata.
+        `table_pages` (1-based) limits the table-structure model to those pages;
+        None runs it everywhere. `pages` limits parsing to those pages (incremental
+        re-ingest). "stats" reports the pages skipped, an estimate of the
+        table-model time saved, and "failed_pages": pages no pass could convert,
+        even after a retry without the table model.
         """
-        try:
-            doc = self.converter.convert(file_path).document
-        except Exception as e:
-            print(f"Docling conversion failed: {e}")
-            return {"chunks": [], "tables": []}
+        with fitz.open(file_path) as pdf:
+            page_count = len(pdf)
+        plan = self._plan(page_count, table_pages, pages)
+        whole = plan == [(1, page_count, plan[0][2])] if plan else False
 
         chunks = []
         tables_data = []
+        failed_pages: List[int] = []
+        table_pass_ms = 0.0
+        table_pass_pages = 0
+        start = time.perf_counter()
+        for first, last, with_tables in plan:
+            result, elapsed_ms = self._convert(file_path, None if whole else (first, last), with_tables)
+            if result is None and with_tables:
+                # The table model is the usual culprit; keep the range's text at least
+                print(f"Retrying pages {first}-{last} without table structure")
+                result, elapsed_ms = self._convert(file_path, None if whole else (first, last), False)
+                with_tables = False
+            if result is None:
+                failed_pages.extend(range(first, last + 1))
+                continue
+            self._record_pass(with_tables, elapsed_ms, last - first + 1)
+            if with_tables:
+                table_pass_ms += elapsed_ms
+                table_pass_pages += last - first + 1
+            self._collect(result.document, chunks, tables_data)
 
+        parsed = sum(last - first + 1 for first, last, _ in plan)
+        skipped = sum(last - first + 1 for first, last, with_tables in plan if not with_tables)
+        table_ms_per_page = self._table_ms_per_page()
+        stats = {
+            "pages": parsed,
+            "table_structure_pages": table_pass_pages,
+            "pages_skipped": skipped,
+            "passes": len(plan),
+            "convert_ms": round((time.perf_counter() - start) * 1000, 1),
+            "table_pass_ms": round(table_pass_ms, 1),
+            "est_saved_ms": round(skipped * table_ms_per_page, 1) if table_ms_per_page is not None else None,
+            "failed_pages": failed_pages,
+        }
+        return {
+            "chunks": chunks,
+            "tables": tables_data,
+            "stats": stats
+        }
+
+    def _convert(self, file_path: str, page_range: Optional[Tuple[int, int]], with_tables: bool):
+        """One conversion pass over `page_range` (None: the whole file). Returns (result or None if it fails, ms)."""
+        converter = self.converter if with_tables else self.text_converter
+        start = time.perf_counter()
+        try:
+            if page_range is None:
+                result = converter.convert(file_path)
+            else:
+                result = converter.convert(file_path, page_range=page_range)
+        except Exception as e:
+            pages = f"pages {page_range[0]}-{page_range[1]}" if page_range else "all pages"
+            print(f"Docling conversion failed ({pages}): {e}")
+            result = None
+        return result, (time.perf_counter() - start) * 1000
+
+    def _collect(self, doc, chunks: List[Dict[str, Any]], tables_data: List[Dict[str, Any]]):
+        """Appends the text/table chunks and table metadata of one converted document."""
         # Iterate through pages
         for page_num, page in doc.pages.items():
             
@@ -97,8 +214,3 @@ class DoclingParser:
                     "cols": len(df.columns),
                     "bbox": bbox
                 })
-
-        return {
-            "chunks": chunks,
-            "tables": tables_data
-        }
@@ -1,47 +1,112 @@
 import os
+import uuid
 import fitz
 import shutil
-from config import UPLOAD_DIR, PDF_DIR, GOOGLE_API_KEY, GEMINI_MODEL
+from config import (
+    UPLOAD_DIR, PDF_DIR, GEMINI_MODEL, CITATION_PRERENDER_TABLES, PAGE_KEEP_FULL, ANSWER_CACHE_ENABLED,
+    ENRICHMENT_DEFER_CAPTIONS, ENRICHMENT_DEFER_TABLE_SUMMARIES, DOCLING_TABLE_PREDETECT, INCREMENTAL_REINGEST
+)
 from modules.ingestion import PDFIngestor
-from parsers.docling_parser import DoclingParser
 from modules.chunking import Chunker
-from custom_storage.vector import VectorStore
-from custom_storage.metadata import MetadataStore
+from custom_storage.metadata import doc_id_from_filename, figure_doc_id
+from custom_storage.vector import chunk_text
 from modules.vision import VisionProcessor
-from modules.gemini_vision import GeminiProcessor
+from modules.renditions import pages_dir, rendition_name
+from modules.gemini_gateway import GeminiError
+import resources
 
 class Pipeline:
-    def __init__(self):
-        try:
-             self.docling = DoclingParser()
-             print("Docling Parser initialized successfully.")
-        except Exception as e:
-             print(f"Warning: Docling failed to init: {e}")
-             self.docling = None
-            
-        self.vector_store = VectorStore()
-        self.metadata_store = MetadataStore()
+    def __init__(self, parse: bool = True, store: bool = True):
+        """
+        run() = prepare() (parse, OCR, chunk, embed; writes only static files) followed
+        by commit() (vector store, metadata, enrichment queue). Bulk ingestion splits
+        them: workers build Pipeline(store=False) and never open the vector store, the
+        parent builds Pipeline(parse=False) and is the only writer.
+        """
+        self.docling = None
+        if parse:
+            try:
+                 self.docling = resources.docling_parser()
+                 print("Docling Parser initialized successfully.")
+            except Exception as e:
+                 print(f"Warning: Docling failed to init: {e}")
+
+        self.vector_store = resources.vector_store() if store else None
+        self.embedding_fn = resources.embedding_function()
+        self.metadata_store = resources.metadata_store()
         self.chunker = Chunker()
-        self.gemini = GeminiProcessor(api_key=GOOGLE_API_KEY)
+        self.gemini = resources.gemini()
         self.vision = VisionProcessor(gemini_processor=self.gemini)
+        self.citations = resources.citation_renderer()
+        self.answers = resources.answer_cache() if store and ANSWER_CACHE_ENABLED else None
         
         if not os.path.exists(PDF_DIR):
             os.makedirs(PDF_DIR)
 
-    def run(self, file_object, filename: str, extraction_mode: str = "OCR"):
+    def run(self, file_object, filename: str, extraction_mode: str = "OCR", partition: str = None):
+        return self.commit(self.prepare(file_object, filename, extraction_mode, partition))
+
+    def prepare(self, file_object, filename: str, extraction_mode: str = "OCR", partition: str = None):
+        """
+        Everything up to storage: saves the PDF, renders pages, extracts text, tables and
+        figures, chunks and embeds. Returns the state commit() needs (picklable), or
+        {"result": ...} when there is nothing to store.
+        The upload, its page renditions and figures stay in a staging directory under
+        UPLOAD_DIR until commit(), so a failed re-upload leaves the previous version's
+        files in place.
+        """
         print(f"--- Processing {filename} with Mode: {extraction_mode} ---")
-        # 1. Save File to PERSISTENT Static Directory
-        file_path = os.path.join(PDF_DIR, filename)
-        with open(file_path, "wb") as f:
+        # 1. Stage the upload; commit() moves it and its renditions to the persistent static directories
+        stage_dir = os.path.join(UPLOAD_DIR, uuid.uuid4().hex)
+        os.makedirs(os.path.join(stage_dir, "images"))
+        with open(os.path.join(stage_dir, filename), "wb") as f:
             shutil.copyfileobj(file_object, f)
-            
-        doc_id = filename.replace(".pdf", "").strip().replace(" ", "_")
-        doc_id = "".join(c for c in doc_id if c.isalnum() or c in ("_", "-")).strip()
+
+        try:
+            ingest = self._prepare(stage_dir, filename, extraction_mode, partition)
+        except BaseException:
+            shutil.rmtree(stage_dir, ignore_errors=True)
+            raise
+        if "result" in ingest:
+            shutil.rmtree(stage_dir, ignore_errors=True)
+        return ingest
+
+    def _prepare(self, stage_dir: str, filename: str, extraction_mode: str, partition: str):
+        file_path = os.path.join(stage_dir, filename)
+        doc_id = doc_id_from_filename(filename)
+        known = self.metadata_store.updated_at(doc_id) is not None
+        ingestor = PDFIngestor(file_path)
+
+        # Re-upload of a known document: only pages whose fingerprint changed are re-parsed
+        fingerprints = ingestor.page_fingerprints()
+        previous = self.metadata_store.page_fingerprints(doc_id) if INCREMENTAL_REINGEST and known else {}
+        last_stats = self.metadata_store.ingest_stats(doc_id)
+        incremental = (bool(previous) and last_stats.get("page_aligned", False)
+                       and last_stats.get("mode") == extraction_mode and last_stats.get("partition") == partition)
+        if incremental:
+            changed = {p for p, fp in enumerate(fingerprints, start=1) if previous.get(p) != fp}
+            removed = {p for p in previous if p > len(fingerprints)}
+        else:
+            changed, removed = set(range(1, len(fingerprints) + 1)), set()
+        delta = {
+            "mode": "incremental" if incremental else "full",
+            "pages": len(fingerprints),
+            "unchanged": len(fingerprints) - len(changed),
+            "changed": len([p for p in changed if p in previous]) if incremental else len(changed),
+            "added": len([p for p in changed if p not in previous]) if incremental else 0,
+            "removed": len(removed),
+        }
+        if incremental and not changed and not removed:
+            print(f"[{filename}] No page changed since the last ingest; nothing to do.")
+            return {"result": {"status": "success", "doc_id": doc_id, "mode": extraction_mode, "incremental": delta}}
+        pages = changed if incremental else None
+        # Jobs still queued for unchanged pages are carried over (register_document drops them)
+        carried_jobs = self.metadata_store.outstanding_enrichment(doc_id) if incremental else []
         
         # 2. Ingest
-        ingestor = PDFIngestor(file_path)
-        # Always extract raw pages for transparency
-        raw_pages = ingestor.extract_page_images(doc_id)
+        # Always extract raw pages for transparency (full resolution only when Gemini reads them)
+        raw_pages = ingestor.extract_page_images(doc_id, keep_full=PAGE_KEEP_FULL or extraction_mode == "GEMINI",
+                                                 pages=pages, output_dir=os.path.join(stage_dir, "pages"))
         
         # 3. Classify
         classification = ingestor.classify_pdf()
@@ -50,6 +115,8 @@ class Pipeline:
         structure = []
         tables = []
         images = []
+        failed_pages = []
+        table_stats = {}
 
         # 4. Extraction Logic
         
@@ -58,8 +125,16 @@ class Pipeline:
              print(f"[{filename}] Using Gemini Vision for content extraction...")
              full_text_accum = ""
              for i, page_img_path in enumerate(raw_pages):
+                if i + 1 not in changed:
+                    continue
                 print(f"[{filename}] Gemini Vision Page {i+1}/{len(raw_pages)}")
-                gemini_result = self.gemini.extract_text_from_image(page_img_path)
+                try:
+                    gemini_result = self.gemini.extract_text_from_image(page_img_path)
+                except GeminiError as e:
+                    # Leave the page out rather than index the error as its text
+                    print(f"[{filename}] Gemini failed on page {i+1}: {e}")
+                    failed_pages.append(i + 1)
+                    continue
                 page_text = gemini_result["text"]
                 
                 # Gemini doesn't give bboxes in this straightforward mode
@@ -81,32 +156,57 @@ class Pipeline:
                      "type": "scanned_page"
                  })
              tables = [] 
+             if changed and len(failed_pages) == len(changed):
+                 return {"result": {
+                     "status": "error",
+                     "doc_id": doc_id,
+                     "message": "Gemini could not read any page; nothing was indexed. Retry later.",
+                     "failed_pages": failed_pages,
+                     "mode": extraction_mode
+                 }}
 
         # Mode 2: UNIFIED DOCLING (Digital + Scanned/OCR)
         else:
             print(f"[{filename}] Running Unified Docling Extraction (OCR enabled)...")
             
-            if self.docling:
+            if not changed:
+                print(f"[{filename}] Pages were only removed; nothing to parse.")
+            elif self.docling:
                 try:
                     # Docling handles both Digital text and OCR (if configured in init)
-                    # It also handles Table Structure automatically.
-                    docling_result = self.docling.process(file_path)
+                    # It also handles Table Structure, limited to pages the cheap pre-pass flags.
+                    table_pages, detection = ingestor.detect_table_pages(pages) if DOCLING_TABLE_PREDETECT else (None, {})
+                    docling_result = self.docling.process(file_path, table_pages=table_pages, pages=pages)
                     
                     structure = docling_result["chunks"]
                     tables = docling_result["tables"]
+                    table_stats = {**docling_result.get("stats", {}), "detection": detection}
+                    # Pages no pass could convert are reported like Gemini's and retried next upload
+                    failed_pages.extend(table_stats.get("failed_pages", []))
+                    if table_pages is not None:
+                        print(f"[{filename}] Table structure on {table_stats.get('table_structure_pages')} of "
+                              f"{table_stats.get('pages')} pages (detect {detection.get('detect_ms')} ms, "
+                              f"est. saved {table_stats.get('est_saved_ms')} ms)")
                     
                     # Phase 4 (Enhanced): LLM Summarization of Tables
                     # Iterating through chunks to find tables
-                    print(f"[{filename}] Enhancing {len(structure)} chunks (LLM Table Summary)...")
-                    for chunk in structure:
-                         if chunk.get("type") == "table" and "full_content" in chunk:
-                             # Generate LLM Summary to replace the weak heuristic one
-                             table_md = chunk["full_content"]
-                             # Only summarize if it's substantial
-                             if len(table_md) > 50:
-                                 llm_summary = self.gemini.summarize_text(table_md)
-                                 chunk["text"] = f"LLM Summary: {llm_summary}"
-                                 print(f" > Summarized Table on Pg {chunk['page']}")
+                    # (deferred to the enrichment queue unless ENRICHMENT_DEFER_TABLE_SUMMARIES is off)
+                    if not self._defer(ENRICHMENT_DEFER_TABLE_SUMMARIES):
+                        print(f"[{filename}] Enhancing {len(structure)} chunks (LLM Table Summary)...")
+                        for chunk in structure:
+                             if chunk.get("type") == "table" and "full_content" in chunk:
+                                 # Generate LLM Summary to replace the weak heuristic one
+                                 table_md = chunk["full_content"]
+                                 # Only summarize if it's substantial
+                                 if len(table_md) > 50:
+                                     try:
+                                         llm_summary = self.gemini.summarize_text(table_md)
+                                     except GeminiError as e:
+                                         # Keep Docling's heuristic summary
+                                         print(f" > Table summary skipped on Pg {chunk['page']}: {e}")
+                                         continue
+                                     chunk["text"] = f"LLM Summary: {llm_summary}"
+                                     print(f" > Summarized Table on Pg {chunk['page']}")
                     
                     # Log success
                     print(f"[{filename}] Docling success: {len(structure)} chunks, {len(tables)} tables.")
@@ -123,13 +223,19 @@ class Pipeline:
                  print("Docling not initialized. Attempting fallback...")
 
             # --- FALLBACK MECHANISM ---
-            # If structure is empty or contains errors, fallback to standard PyMuPDF text extraction
-            if not structure or (len(structure) == 1 and structure[0].get("role") == "error"):
+            # If structure is empty or contains errors, fallback to standard PyMuPDF text extraction.
+            # Pages Docling failed on get the same plain text, but stay in failed_pages (no
+            # fingerprint), so the next upload gives Docling another try.
+            fallback_pages = set(failed_pages)
+            if changed and (not structure or (len(structure) == 1 and structure[0].get("role") == "error")):
+                 structure, fallback_pages = [], changed
+            if fallback_pages:
                  print(f"[{filename}] Falling back to Standard PDF Text Extraction...")
                  try:
                      doc = fitz.open(file_path)
-                     structure = []
                      for i, page in enumerate(doc):
+                         if i + 1 not in fallback_pages:
+                             continue
                          text = page.get_text()
                          # Basic cleanup
                          text = text.strip()
@@ -141,15 +247,19 @@ class Pipeline:
                                  "type": "text"
                                  # No bbox check triggers basic chunker
                              })
-                     print(f"[{filename}] Fallback success: Extracted {len(structure)} pages of text.")
+                     print(f"[{filename}] Fallback success: Extracted text of {len(fallback_pages)} pages.")
                  except Exception as e:
                      print(f"[{filename}] Fallback failed: {e}")
-                     structure = [{"text": "Extraction Failed Completely", "role": "error", "page": 1}]
+                     if not structure:
+                         structure = [{"text": "Extraction Failed Completely", "role": "error", "page": 1}]
 
             # Extract standard images (figures) from PDF separate from Docling 
             # (Docling can do this in v2, but keeping our vision module for now is safer conflict resolution)
             print(f"[{filename}] Extracting Images/Figures...")
-            images = self.vision.extract_images(file_path, doc_id)
+            images = self.vision.extract_images(file_path, doc_id, caption=not self._defer(ENRICHMENT_DEFER_CAPTIONS),
+                                                pages=pages, output_dir=os.path.join(stage_dir, "images"))
+            if incremental:
+                tables, images = self._merge_artifacts(doc_id, changed | removed, tables, images)
             
             # If no embedded images found but it was scanned, maybe add the full pages as images?
             if not images and (classification == "SCANNED" or len(images) == 0):
@@ -161,21 +271,137 @@ class Pipeline:
                         "type": "scanned_page"
                     })
 
-        # 5. Chunking & Storage (Common)
+        # 5. Chunking & Embedding (Common)
         print(f"[{filename}] Chunking {len(structure)} structure blocks...")
-        chunks = self.chunker.chunk_by_structure(structure)
-        
-        print(f"[{filename}] Storing {len(chunks)} chunks and artifacts...")
-        self.vector_store.add_chunks(chunks, doc_id)
-        self.metadata_store.save_tables(tables, doc_id)
-        self.metadata_store.save_images(images, doc_id)
+        # Gemini pages (and any re-parsed subset) are chunked page by page so chunks can be replaced per page
+        by_page = incremental or extraction_mode == "GEMINI"
+        page_aligned = by_page or bool(structure and "bbox" in structure[0])
+        chunks = self.chunker.chunk_by_structure(structure, by_page=by_page)
+        embeddings = [list(map(float, e)) for e in self.embedding_fn([chunk_text(c) for c in chunks])] if chunks else []
+        if CITATION_PRERENDER_TABLES:
+            rendered = self.citations.prerender(doc_id, chunks, path=file_path)
+            if rendered:
+                print(f"[{filename}] Pre-rendered {rendered} table citation crops.")
+
+        return {
+            "filename": filename, "stage_dir": stage_dir, "doc_id": doc_id, "mode": extraction_mode, "partition": partition,
+            "known": known, "incremental": incremental, "changed": changed, "removed": removed, "delta": delta,
+            "fingerprints": fingerprints, "failed_pages": failed_pages, "carried_jobs": carried_jobs,
+            "chunks": chunks, "embeddings": embeddings, "tables": tables, "images": images,
+            "classification": classification, "table_stats": table_stats, "page_aligned": page_aligned,
+        }
+
+    def commit(self, ingest):
+        """Stores what prepare() produced, replacing the document's previous version."""
+        if "result" in ingest:
+            return ingest["result"]
+        doc_id, chunks = ingest["doc_id"], ingest["chunks"]
+        changed, removed, failed_pages = ingest["changed"], ingest["removed"], ingest["failed_pages"]
+        self.metadata_store.register_document(doc_id)
+        if ingest["known"]:
+            # Files of re-parsed and removed pages, or all of them when the whole document was re-parsed
+            self._drop_page_files(doc_id, changed | removed if ingest["incremental"] else None)
+        self._install_staged_files(ingest["stage_dir"], ingest["filename"], doc_id)
+        if self.answers:
+            # Cached answers built on the previous version of this document are stale
+            self.answers.invalidate(doc_id)
+
+        print(f"[{ingest['filename']}] Storing {len(chunks)} chunks and artifacts...")
+        if ingest["incremental"]:
+            chunk_ids = self.vector_store.replace_pages(chunks, doc_id, sorted(changed | removed),
+                                                        partition=ingest["partition"], embeddings=ingest["embeddings"])
+        else:
+            if ingest["known"]:
+                # Chunks of the previous version would otherwise stay searchable next to the new ones
+                self.vector_store.delete_document(doc_id)
+            chunk_ids = self.vector_store.add_chunks(chunks, doc_id, partition=ingest["partition"],
+                                                     embeddings=ingest["embeddings"])
+        self.metadata_store.save_artifacts(doc_id, ingest["tables"], ingest["images"])
+        self.metadata_store.save_ingest_stats(doc_id, {
+            "mode": ingest["mode"], "partition": ingest["partition"], "page_aligned": ingest["page_aligned"],
+            "table_detection": ingest["table_stats"], "incremental": ingest["delta"]
+        })
+        # A page Gemini or Docling could not read gets no fingerprint, so the next upload retries it
+        self.metadata_store.save_page_fingerprints(
+            doc_id, ["" if i + 1 in failed_pages else fp for i, fp in enumerate(ingest["fingerprints"])]
+        )
+        carried_jobs = [j for j in ingest["carried_jobs"]
+                        if j["kind"] == "table_summary" and j["payload"].get("page") not in changed | removed]
+        queued = self._queue_enrichment(doc_id, chunks, chunk_ids, ingest["images"], carried_jobs)
+        if queued:
+            print(f"[{ingest['filename']}] Queued {queued} enrichment jobs (captions / table summaries).")
         
         return {
             "status": "success", 
             "doc_id": doc_id, 
             "chunks": len(chunks), 
-            "tables": len(tables), 
-            "images": len(images),
-            "type": classification,
-            "mode": extraction_mode
+            "tables": len(ingest["tables"]), 
+            "images": len(ingest["images"]),
+            "type": ingest["classification"],
+            "mode": ingest["mode"],
+            "failed_pages": failed_pages,
+            "table_detection": ingest["table_stats"],
+            "enrichment": {"queued": queued},
+            "incremental": ingest["delta"]
         }
+
+    def _defer(self, setting: bool) -> bool:
+        # Without a key the inline path returns placeholders immediately; nothing to defer
+        return setting and bool(self.gemini.api_key)
+
+    def _merge_artifacts(self, doc_id: str, stale, tables, images):
+        """Stored tables/figures of untouched pages plus the freshly extracted ones, in page order."""
+        kept_tables = [t for t in self.metadata_store.load_tables(doc_id) if t.get("page") not in stale]
+        # Scanned-page entries are re-derived from the merged figure list by run()
+        kept_images = [img for img in self.metadata_store.load_images(doc_id)
+                       if img.get("page") not in stale and img.get("type") != "scanned_page"]
+        by_page = lambda item: item.get("page") or 0
+        return sorted(kept_tables + tables, key=by_page), sorted(kept_images + images, key=by_page)
+
+    def _drop_page_files(self, doc_id: str, pages=None):
+        """Deletes the stored renditions and extracted figures of `pages` (every page when None)."""
+        if pages is None:
+            shutil.rmtree(pages_dir(doc_id), ignore_errors=True)
+        else:
+            for page_num in pages:
+                for kind in ("thumb", "screen", "full"):
+                    path = os.path.join(pages_dir(doc_id), rendition_name(page_num, kind))
+                    if os.path.exists(path):
+                        os.remove(path)
+        if os.path.exists(self.vision.images_dir):
+            prefixes = tuple(f"{doc_id}_page{p}_img" for p in pages) if pages is not None else ()
+            for name in os.listdir(self.vision.images_dir):
+                if figure_doc_id(name) == doc_id and (pages is None or name.startswith(prefixes)):
+                    os.remove(os.path.join(self.vision.images_dir, name))
+
+    def _install_staged_files(self, stage_dir: str, filename: str, doc_id: str):
+        """Moves the staged PDF, page renditions and figures into place and removes the staging directory."""
+        os.replace(os.path.join(stage_dir, filename), os.path.join(PDF_DIR, filename))
+        for staged, dest in ((os.path.join(stage_dir, "pages"), pages_dir(doc_id)),
+                             (os.path.join(stage_dir, "images"), self.vision.images_dir)):
+            if not os.path.isdir(staged):
+                continue
+            os.makedirs(dest, exist_ok=True)
+            for name in os.listdir(staged):
+                os.replace(os.path.join(staged, name), os.path.join(dest, name))
+        shutil.rmtree(stage_dir, ignore_errors=True)
+
+    def _queue_enrichment(self, doc_id: str, chunks, chunk_ids, images, carried=()) -> int:
+        """
+        Queues the Gemini captions / table summaries deferred by run() for the enrichment
+        worker. `carried` are table-summary jobs of untouched pages (incremental re-ingest).
+        """
+        jobs = list(carried)
+        for idx, img in enumerate(images):
+            if img.get("caption_status") == "pending":
+                jobs.append({"kind": "caption", "payload": {"idx": idx, "page": img["page"], "path": img["path"]}})
+        if self._defer(ENRICHMENT_DEFER_TABLE_SUMMARIES):
+            for chunk, chunk_id in zip(chunks, chunk_ids):
+                table_md = chunk.get("full_content") or ""
+                # Only summarize if it's substantial
+                if chunk.get("type") == "table" and len(table_md) > 50:
+                    jobs.append({"kind": "table_summary",
+                                 "payload": {"chunk_id": chunk_id, "page": chunk.get("page"), "full_content": table_md}})
+        if not jobs:
+            return 0
+        return self.metadata_store.enqueue_enrichment(doc_id, jobs)
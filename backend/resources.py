@@ -0,0 +1,144 @@
+"""
+Process-wide registry of heavy resources: the embedding model, vector/metadata
+stores, Docling converter and Gemini client. Everything that needs one asks here,
+so each is built once per process no matter how many components use it.
+
+With several workers, run under gunicorn (see gunicorn.conf.py): the master calls
+preload_models() before forking, so workers share the model weights copy-on-write
+instead of each loading its own copy. Stores hold SQLite handles and file locks,
+which must not cross a fork, so they are always created inside the worker.
+"""
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+_instances: Dict[str, Any] = {}
+_load_ms: Dict[str, float] = {}
+_status: Dict[str, str] = {}
+_name_locks: Dict[str, threading.Lock] = {}
+_lock = threading.Lock()
+_pid = os.getpid()
+
+
+def get(name: str, factory: Callable[[], Any]) -> Any:
+    """Returns the shared instance called `name`, building it with `factory` on first use."""
+    instance = _instances.get(name)
+    if instance is not None:
+        return instance
+    # One lock per resource: a slow build (Docling) doesn't hold up the others
+    with _lock:
+        name_lock = _name_locks.setdefault(name, threading.Lock())
+    with name_lock:
+        if name not in _instances:
+            _status[name] = "loading"
+            start = time.perf_counter()
+            try:
+                _instances[name] = factory()
+            except Exception as e:
+                _status[name] = f"failed: {e}"
+                raise
+            _load_ms[name] = round((time.perf_counter() - start) * 1000, 1)
+            _status[name] = "ready"
+            print(f"Loaded shared resource '{name}' in {_load_ms[name]} ms (pid {os.getpid()})")
+        return _instances[name]
+
+def release(name: str):
+    """Forgets an instance so the next get() rebuilds it (e.g. a client for a retired store path)."""
+    with _lock:
+        _instances.pop(name, None)
+        _load_ms.pop(name, None)
+        _status.pop(name, None)
+
+def is_ready(name: str) -> bool:
+    return _status.get(name) == "ready"
+
+def loaded() -> Dict[str, Any]:
+    """Status and load time of every resource requested so far, for diagnostics."""
+    with _lock:
+        return {
+            "pid": os.getpid(),
+            "inherited_from_master": os.getpid() != _pid,
+            "resources": {
+                name: {"status": status, "load_ms": _load_ms.get(name)} for name, status in _status.items()
+            },
+        }
+
+# --- Resources ---
+
+def embedding_function():
+    from config import EMBEDDING_MODEL
+    def build():
+        from chromadb.utils import embedding_functions
+        return embedding_functions.SentenceTransformerEmbeddingFunction(model_name=EMBEDDING_MODEL)
+    return get("embedding_function", build)
+
+def chroma_client(path: str):
+    def build():
+        import chromadb
+        return chromadb.PersistentClient(path=path)
+    return get(f"chroma_client:{os.path.abspath(path)}", build)
+
+def release_chroma_client(path: str):
+    release(f"chroma_client:{os.path.abspath(path)}")
+
+def chroma_http_client(host: str, port: int):
+    def build():
+        import chromadb
+        return chromadb.HttpClient(host=host, port=port)
+    return get(f"chroma_http_client:{host}:{port}", build)
+
+def docling_parser():
+    def build():
+        from parsers.docling_parser import DoclingParser
+        return DoclingParser()
+    return get("docling_parser", build)
+
+def gemini():
+    def build():
+        from config import GOOGLE_API_KEY
+        from modules.gemini_vision import GeminiProcessor
+        return GeminiProcessor(api_key=GOOGLE_API_KEY)
+    return get("gemini", build)
+
+def vector_store():
+    def build():
+        from custom_storage.vector import VectorStore
+        return VectorStore()
+    return get("vector_store", build)
+
+def metadata_store():
+    def build():
+        from custom_storage.metadata import MetadataStore
+        return MetadataStore()
+    return get("metadata_store", build)
+
+def answer_cache():
+    def build():
+        from custom_storage.answer_cache import AnswerCache
+        return AnswerCache(metadata_store())
+    return get("answer_cache", build)
+
+def citation_renderer():
+    def build():
+        from modules.citations import CitationRenderer
+        return CitationRenderer()
+    return get("citation_renderer", build)
+
+def preload_models() -> List[str]:
+    """
+    Loads the fork-safe model weights (embedding model, Docling converter) so that
+    forked workers inherit them. Must not run inference: thread pools started by
+    torch/OpenMP in the master do not survive a fork.
+    """
+    embedding_function()
+    try:
+        parser = docling_parser()
+        # Docling loads its layout/table models lazily on first convert; pull them in now
+        if hasattr(parser.converter, "initialize_pipeline"):
+            from docling.datamodel.base_models import InputFormat
+            parser.converter.initialize_pipeline(InputFormat.PDF)
+            parser.text_converter.initialize_pipeline(InputFormat.PDF)
+    except Exception as e:
+        print(f"Warning: Docling preload failed: {e}")
+    return list(_instances)
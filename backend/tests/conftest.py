@@ -0,0 +1,70 @@
+import os
+import sys
+import tempfile
+import zlib
+
+import numpy as np
+import pytest
+
+# Modules import each other as top-level packages (run from backend/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the stores the tests open away from the real data directory, and off Chroma
+# (not needed to exercise the store logic)
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="nexus-tests-"))
+os.environ.setdefault("VECTOR_BACKEND", "compact_ann")
+os.makedirs(os.path.join(os.environ["DATA_DIR"], "static"), exist_ok=True)
+
+EMBEDDING_DIM = 64
+
+
+def fake_embedding(texts):
+    """Bag-of-words vectors from per-word random directions: texts sharing words land close."""
+    vectors = []
+    for text in texts:
+        vector = np.zeros(EMBEDDING_DIM)
+        for word in str(text).lower().split():
+            vector += np.random.RandomState(zlib.crc32(word.encode("utf-8"))).randn(EMBEDDING_DIM)
+        norm = np.linalg.norm(vector)
+        vectors.append((vector / norm if norm else vector).tolist())
+    return vectors
+
+
+@pytest.fixture(autouse=True)
+def _fake_embeddings(monkeypatch):
+    import resources
+    monkeypatch.setattr(resources, "embedding_function", lambda: fake_embedding)
+
+
+@pytest.fixture
+def make_vector_store(monkeypatch, tmp_path):
+    """Builds VectorStores on a per-test compact ANN directory (patch shard settings before calling)."""
+    from custom_storage import backends, vector
+    monkeypatch.setitem(backends.BACKEND_ROOTS, "compact_ann", str(tmp_path / "ann"))
+    monkeypatch.setattr(vector, "SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    stores = []
+
+    def build():
+        store = vector.VectorStore()
+        stores.append(store)
+        return store
+
+    yield build
+    for store in stores:
+        store.backend.close()
+        store._executor.shutdown(wait=False)
+
+
+@pytest.fixture
+def api(monkeypatch, make_vector_store):
+    """The API module with warm-up skipped: a scratch vector store, no answer cache (tests set `gemini`)."""
+    import main
+    import resources
+    from modules.table_query import TableQueryEngine
+    metadata_store = resources.metadata_store()
+    monkeypatch.setattr(main, "vector_store", make_vector_store())
+    monkeypatch.setattr(main, "metadata_store", metadata_store)
+    monkeypatch.setattr(main, "table_engine", TableQueryEngine(metadata_store))
+    monkeypatch.setattr(main, "answer_cache", None)
+    monkeypatch.setitem(main.readiness, "core", True)
+    return main
@@ -0,0 +1,76 @@
+import threading
+import time
+import pytest
+from fastapi.testclient import TestClient
+from admission import AdmissionRejected, WorkloadClass
+
+
+def test_queue_full_is_rejected_immediately():
+    workload = WorkloadClass("search", limit=1, queue=0, timeout=1)
+    held = workload.acquire()
+    with pytest.raises(AdmissionRejected) as e:
+        workload.acquire()
+    assert e.value.reason == "queue full"
+    assert e.value.retry_after >= 1
+    workload.release(held)
+    workload.release(workload.acquire())
+    assert workload.stats()["rejected_queue_full"] == 1
+    assert workload.stats()["in_flight"] == 0
+
+
+def test_queued_request_times_out():
+    workload = WorkloadClass("search", limit=1, queue=1, timeout=0.05)
+    held = workload.acquire()
+    with pytest.raises(AdmissionRejected) as e:
+        workload.acquire()
+    assert e.value.reason == "timed out in queue"
+    workload.release(held)
+    assert workload.stats()["queued"] == 0
+
+
+def test_released_slot_goes_to_the_queued_request():
+    workload = WorkloadClass("search", limit=1, queue=1, timeout=5)
+    held = workload.acquire()
+    admitted = threading.Event()
+
+    def waiter():
+        started = workload.acquire()
+        admitted.set()
+        workload.release(started)
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    while not workload.stats()["queued"]:
+        time.sleep(0.001)
+    workload.release(held)
+    thread.join(timeout=5)
+    assert admitted.is_set()
+    assert workload.stats()["in_flight"] == 0
+
+
+@pytest.fixture
+def client(monkeypatch):
+    import main
+    monkeypatch.setitem(main.readiness, "core", True)
+    monkeypatch.setitem(main.admission.classes, "search", WorkloadClass("search", limit=1, queue=0, timeout=0.01))
+    return main, TestClient(main.app)
+
+
+def test_search_over_capacity_gets_429(client):
+    main, http = client
+    held = main.admission["search"].acquire()
+    try:
+        response = http.get("/search", params={"q": "revenue"})
+    finally:
+        main.admission["search"].release(held)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert response.json()["retry_after"] >= 1
+
+
+def test_not_ready_gets_503(monkeypatch):
+    import main
+    monkeypatch.setitem(main.readiness, "core", False)
+    response = TestClient(main.app).get("/search", params={"q": "revenue"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"]
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+from custom_storage.ann_index import CompactANNCollection
+
+
+def _brute_force(vectors, queries, k):
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    q = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    return np.argsort(-(q @ unit.T), axis=1)[:, :k]
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(7)
+    # Clustered points, like real embeddings, so IVF lists are meaningful
+    centers = rng.normal(size=(8, 32))
+    vectors = np.concatenate([c + 0.3 * rng.normal(size=(200, 32)) for c in centers]).astype(np.float32)
+    queries = (centers[rng.integers(0, 8, 20)] + 0.3 * rng.normal(size=(20, 32))).astype(np.float32)
+    return vectors, queries
+
+
+def _collection(tmp_path, vectors, **kwargs):
+    collection = CompactANNCollection("test", str(tmp_path / "test"), **kwargs)
+    ids = [f"v{i}" for i in range(len(vectors))]
+    collection.add(ids=ids, documents=ids, metadatas=[{"doc_id": f"d{i % 4}"} for i in range(len(vectors))],
+                   embeddings=vectors.tolist())
+    return collection
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_exhaustive_probe_matches_brute_force(tmp_path, data, dtype):
+    vectors, queries = data
+    collection = _collection(tmp_path, vectors, dtype=dtype, nlist=4, nprobe=4)
+    collection.train()
+    result = collection.query(query_embeddings=queries.tolist(), n_results=10)
+    expected = _brute_force(vectors, queries, 10)
+    recall = np.mean([len({int(i[1:]) for i in got} & set(want)) / 10 for got, want in zip(result["ids"], expected)])
+    assert recall >= 0.95  # Only quantization can reorder near-ties
+
+
+def test_partial_probe_recall(tmp_path, data):
+    vectors, queries = data
+    collection = _collection(tmp_path, vectors, nlist=8, nprobe=3)
+    collection.train()
+    result = collection.query(query_embeddings=queries.tolist(), n_results=10)
+    expected = _brute_force(vectors, queries, 10)
+    recall = np.mean([len({int(i[1:]) for i in got} & set(want)) / 10 for got, want in zip(result["ids"], expected)])
+    assert recall >= 0.9
+
+
+def test_distances_are_cosine_and_filters_apply(tmp_path, data):
+    vectors, queries = data
+    collection = _collection(tmp_path, vectors, nlist=4, nprobe=4)
+    result = collection.query(query_embeddings=[vectors[5].tolist()], n_results=3, where={"doc_id": "d1"})
+    assert result["ids"][0][0] == "v5"
+    assert result["distances"][0][0] == pytest.approx(0.0, abs=1e-2)
+    assert all(m["doc_id"] == "d1" for m in result["metadatas"][0])
+    assert result["distances"][0] == sorted(result["distances"][0])
+
+
+def test_deleted_rows_are_not_returned(tmp_path, data):
+    vectors, _ = data
+    collection = _collection(tmp_path, vectors, nlist=4, nprobe=4)
+    collection.delete(ids=["v5"])
+    result = collection.query(query_embeddings=[vectors[5].tolist()], n_results=5)
+    assert "v5" not in result["ids"][0]
+    assert collection.count() == len(vectors) - 1
+
+
+def test_filtered_query_probes_the_inverted_lists(tmp_path, data):
+    vectors, queries = data
+    collection = _collection(tmp_path, vectors, nlist=8, nprobe=3)
+    collection.train()
+    lists = collection._inverted_lists()
+    assert collection._inverted_lists() is lists
+    assert sum(len(rows) for rows in lists) == len(vectors)
+
+    in_d1 = np.arange(1, len(vectors), 4)
+    result = collection.query(query_embeddings=queries.tolist(), n_results=5, where={"doc_id": "d1"})
+    expected = in_d1[_brute_force(vectors[in_d1], queries, 5)]
+    recall = np.mean([len({int(i[1:]) for i in got} & set(want)) / 5 for got, want in zip(result["ids"], expected)])
+    assert recall >= 0.9
+    assert all(m["doc_id"] == "d1" for hits in result["metadatas"] for m in hits)
+
+
+def test_selective_filter_still_fills_the_results(tmp_path, data):
+    vectors, _ = data
+    collection = _collection(tmp_path, vectors, nlist=8, nprobe=1)
+    collection.train()
+    wanted = [f"v{i}" for i in (3, 600, 1200)]
+    collection.update(ids=wanted, metadatas=[{"doc_id": "rare"}] * 3)
+    result = collection.query(query_embeddings=[vectors[0].tolist()], n_results=3, where={"doc_id": "rare"})
+    assert sorted(result["ids"][0]) == sorted(wanted)
+
+
+def test_empty_include_skips_documents_and_metadata(tmp_path, data):
+    vectors, _ = data
+    collection = _collection(tmp_path, vectors[:10])
+    fetched = collection.get(include=[])
+    assert fetched["ids"] == [f"v{i}" for i in range(10)]
+    assert fetched["documents"] is None and fetched["metadatas"] is None
+    result = collection.query(query_embeddings=[vectors[0].tolist()], n_results=1, include=["distances"])
+    assert result["ids"][0] == ["v0"]
+    assert result["metadatas"][0] == [None]
@@ -0,0 +1,96 @@
+import time
+import pytest
+import resources
+from custom_storage.answer_cache import AnswerCache
+
+SCOPE = AnswerCache.scope_key(partition=None, mode="flat", limit=5)
+
+
+@pytest.fixture
+def store():
+    return resources.metadata_store()
+
+
+def _embed(texts):
+    return resources.embedding_function()(texts)
+
+
+def _cache(store, tmp_path, **kwargs):
+    return AnswerCache(store, path=str(tmp_path / "answers.sqlite"), threshold=0.9, **kwargs)
+
+
+def _remember(cache, store, doc_id, question="what was revenue in 2024"):
+    store.register_document(doc_id)
+    cache.store(SCOPE, question, _embed([question])[0], {"answer": "42"}, [doc_id])
+
+
+def test_hit_for_the_same_question_in_the_same_scope(store, tmp_path):
+    cache = _cache(store, tmp_path)
+    _remember(cache, store, "cache-hit")
+    hit = cache.lookup(SCOPE, _embed(["what was revenue in 2024"])[0])
+    assert hit["response"] == {"answer": "42"}
+    other_scope = AnswerCache.scope_key(partition="t2", mode="flat", limit=5)
+    assert cache.lookup(other_scope, _embed(["what was revenue in 2024"])[0]) is None
+
+
+def test_invalidate_drops_answers_of_the_document(store, tmp_path):
+    cache = _cache(store, tmp_path)
+    _remember(cache, store, "cache-a")
+    _remember(cache, store, "cache-b", question="who audits the accounts")
+    assert cache.invalidate("cache-a") == 1
+    assert cache.lookup(SCOPE, _embed(["what was revenue in 2024"])[0]) is None
+    assert cache.lookup(SCOPE, _embed(["who audits the accounts"])[0]) is not None
+
+
+def test_reingest_elsewhere_retires_the_answer(store, tmp_path):
+    # Another worker re-ingests the document: only the version check can notice
+    cache = _cache(store, tmp_path)
+    _remember(cache, store, "cache-reingest")
+    time.sleep(0.01)
+    store.register_document("cache-reingest")
+    assert cache.lookup(SCOPE, _embed(["what was revenue in 2024"])[0]) is None
+    assert cache.counters["stale"] == 1
+
+
+def test_deletions_replay_to_other_workers(store, tmp_path):
+    first, second = _cache(store, tmp_path), _cache(store, tmp_path)
+    _remember(first, store, "cache-shared")
+    question = _embed(["what was revenue in 2024"])[0]
+    assert second.lookup(SCOPE, question) is not None
+    first.invalidate("cache-shared")
+    assert second.lookup(SCOPE, question) is None
+    assert second._ids.size == 0
+
+
+def test_eviction_keeps_the_newest(store, tmp_path):
+    cache = _cache(store, tmp_path, max_entries=10)
+    for i in range(12):
+        _remember(cache, store, f"cache-evict-{i}", question=f"question number {i}")
+    assert cache.stats()["entries"] <= 10
+    assert cache.lookup(SCOPE, _embed(["question number 11"])[0]) is not None
+    assert cache.lookup(SCOPE, _embed(["question number 0"])[0]) is None
+
+
+class SlowCache:
+    def __init__(self):
+        self.stored = []
+
+    def scope_key(self, **scope):
+        return "scope"
+
+    def lookup(self, scope, embedding):
+        time.sleep(0.5)
+
+    def store(self, *entry):
+        self.stored.append(entry)
+
+
+def test_slow_cache_lookup_counts_as_a_miss(api, monkeypatch):
+    from fastapi.testclient import TestClient
+    api.vector_store.add_chunks([{"text": "The headquarters are in Lyon, France.", "page": 1}], "hq")
+    monkeypatch.setattr(api, "answer_cache", SlowCache())
+    monkeypatch.setattr(api.run_search_stage, "__kwdefaults__", {"timeout": 0.2})
+    response = TestClient(api.app).get("/search", params={"q": "where are the headquarters", "answer_mode": "extractive"})
+    assert response.status_code == 200
+    assert "Lyon" in response.json()["answer"]
+    assert "cache" not in response.json()
@@ -0,0 +1,88 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import bulk_ingest
+import pipeline
+from bulk_ingest import BulkIngestor, file_sha256, iter_sources
+
+
+class InlinePool(ThreadPoolExecutor):
+    """Runs the "worker" side in threads of this process (no spawned models)."""
+    def __init__(self, workers, mp_context=None, initializer=None, initargs=()):
+        super().__init__(workers)
+
+
+class FakeWriter:
+    committed = []
+
+    def __init__(self, parse=True, store=True):
+        pass
+
+    def commit(self, ingest):
+        if "result" in ingest:
+            return ingest["result"]
+        FakeWriter.committed.append(ingest["doc_id"])
+        return {"status": "success", "chunks": 3, "incremental": {"pages": 2}}
+
+
+def fake_prepare(path, mode, partition):
+    if "broken" in path:
+        return {"result": {"status": "error", "message": "ValueError: not a PDF"}, "seconds": 0.1}
+    return {"doc_id": os.path.splitext(os.path.basename(path))[0], "seconds": 0.1}
+
+
+@pytest.fixture
+def archive(monkeypatch, tmp_path):
+    monkeypatch.setattr(bulk_ingest, "ProcessPoolExecutor", InlinePool)
+    monkeypatch.setattr(bulk_ingest, "_prepare", fake_prepare)
+    monkeypatch.setattr(pipeline, "Pipeline", FakeWriter)
+    FakeWriter.committed = []
+    root = tmp_path / "archive"
+    for rel, content in (("a.pdf", b"A"), ("b.pdf", b"B"), ("broken.pdf", b"C"),
+                         ("copy/a-copy.pdf", b"A"), ("other/b.pdf", b"D"), ("notes.txt", b"x")):
+        (root / rel).parent.mkdir(parents=True, exist_ok=True)
+        (root / rel).write_bytes(content)
+    return root
+
+
+def _run(tmp_path, source, **kwargs):
+    ingestor = BulkIngestor(state_path=str(tmp_path / "state.sqlite"), workers=1, **kwargs)
+    return ingestor, ingestor.run(iter_sources(str(source), "auto", None), progress_every=0)
+
+
+def test_first_run_skips_duplicates_and_doc_id_conflicts(archive, tmp_path):
+    ingestor, report = _run(tmp_path, archive)
+    assert {k: report[k] for k in ("files", "ingested", "failed", "skipped_ingested", "skipped_conflict", "pages", "chunks")} == {
+        "files": 5, "ingested": 2, "failed": 1, "skipped_ingested": 1, "skipped_conflict": 1, "pages": 4, "chunks": 6
+    }
+    assert FakeWriter.committed == ["a", "b"]
+    assert ingestor.status() == {"done": 2, "failed": 1}
+
+
+def test_rerun_resumes_and_stops_retrying_after_max_attempts(archive, tmp_path):
+    _run(tmp_path, archive, max_attempts=2)
+    FakeWriter.committed = []
+    _, report = _run(tmp_path, archive, max_attempts=2)
+    assert report["ingested"] == 0 and report["skipped_ingested"] == 3
+    assert report["failed"] == 1  # Second attempt at broken.pdf
+    _, report = _run(tmp_path, archive, max_attempts=2)
+    assert report["failed"] == 0 and report["skipped_failed"] == 1
+    assert FakeWriter.committed == []
+
+
+def test_files_left_running_by_a_crash_are_retried(archive, tmp_path):
+    ingestor = BulkIngestor(state_path=str(tmp_path / "state.sqlite"))
+    path = str(archive / "a.pdf")
+    ingestor._record(file_sha256(path), path, "a", "running", attempts=1)
+    ingestor, report = _run(tmp_path, archive)
+    assert report["ingested"] == 2 and FakeWriter.committed == ["a", "b"]
+    assert ingestor._attempts(file_sha256(path)) == 2
+
+
+def test_manifest_entries_override_mode_and_partition(tmp_path):
+    manifest = tmp_path / "batch.txt"
+    manifest.write_text('# archive\nreports/a.pdf\n{"path": "b.pdf", "mode": "gemini", "partition": "legal"}\n')
+    assert list(iter_sources(str(manifest), "auto", None)) == [
+        (str(tmp_path / "reports" / "a.pdf"), "auto", None),
+        (str(tmp_path / "b.pdf"), "gemini", "legal"),
+    ]
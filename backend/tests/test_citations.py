@@ -0,0 +1,72 @@
+import os
+import fitz
+import pytest
+from fastapi.testclient import TestClient
+from modules import citations
+from modules.citations import CitationRenderer
+
+BBOX = "50,50,200,120"
+
+
+def _write_pdf(path, text):
+    doc = fitz.open()
+    doc.new_page().insert_text((60, 80), text)
+    doc.save(str(path))
+    doc.close()
+
+
+@pytest.fixture
+def renderer(monkeypatch, tmp_path):
+    pdfs = tmp_path / "pdfs"
+    pdfs.mkdir()
+    monkeypatch.setattr(citations, "PDF_DIR", str(pdfs))
+    _write_pdf(pdfs / "Annual Report.pdf", "Revenue 1,200")
+    renderer = CitationRenderer(cache_dir=str(tmp_path / "cache"), memory_mb=1, pool_size=1)
+    yield renderer
+    renderer.invalidate()
+
+
+def test_render_caches_in_memory_and_on_disk(renderer, tmp_path):
+    data, etag = renderer.render("Annual_Report", 1, BBOX, dpi=72)
+    assert data.startswith(b"\x89PNG")
+    assert os.path.exists(tmp_path / "cache" / "Annual_Report" / f"{etag}.png")
+    assert renderer.render("Annual_Report", 1, BBOX, dpi=72) == (data, etag)
+    assert renderer.stats()["memory_entries"] == 1
+
+    # A fresh process serves the crop from disk without opening the PDF
+    cold = CitationRenderer(cache_dir=str(tmp_path / "cache"))
+    assert cold.render("Annual_Report", 1, BBOX, dpi=72) == (data, etag)
+    assert cold.stats()["open_pdfs"] == 0
+
+
+def test_reupload_changes_the_key_and_invalidate_drops_crops(renderer, tmp_path):
+    _, etag = renderer.render("Annual_Report", 1, BBOX, dpi=72)
+    path = tmp_path / "pdfs" / "Annual Report.pdf"
+    _write_pdf(path, "Revenue 9,999 restated")
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 10 ** 9))
+    _, new_etag = renderer.render("Annual_Report", 1, BBOX, dpi=72)
+    assert new_etag != etag
+
+    renderer.invalidate("Annual_Report")
+    assert not os.path.exists(tmp_path / "cache" / "Annual_Report")
+    assert renderer.stats() == {"memory_entries": 0, "memory_bytes": 0, "open_pdfs": 0}
+
+
+def test_bad_requests_raise(renderer):
+    with pytest.raises(ValueError):
+        renderer.render("Annual_Report", 1, "1,2,3")
+    with pytest.raises(IndexError):
+        renderer.render("Annual_Report", 5, BBOX)
+    with pytest.raises(FileNotFoundError):
+        renderer.render("missing", 1, BBOX)
+
+
+def test_endpoint_answers_304_for_a_matching_etag(api, renderer, monkeypatch):
+    monkeypatch.setattr(api, "citation_renderer", renderer)
+    client = TestClient(api.app)
+    response = client.get(f"/citation/Annual_Report/1/{BBOX}")
+    assert response.status_code == 200 and response.headers["content-type"] == "image/png"
+    etag = response.headers["etag"]
+    revalidated = client.get(f"/citation/Annual_Report/1/{BBOX}", headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304 and revalidated.headers["etag"] == etag
+    assert client.get("/citation/Annual_Report/1/oops").status_code == 400
@@ -0,0 +1,83 @@
+from modules.context import estimate_tokens, extract_answer, pack_context, trim_table
+
+WINDOW = "one two three four five six seven eight nine ten"
+
+
+def test_pack_drops_duplicates_and_stitches_overlapping_chunks():
+    meta = {"doc_id": "report", "page": 2}
+    documents = [
+        f"The plant opened in 2019. {WINDOW}",
+        f"{WINDOW} and it doubled output in 2021.",
+        f"The plant opened in 2019. {WINDOW}",
+    ]
+    context, report = pack_context("plant output", documents, [meta, meta, meta])
+    assert report["duplicates_dropped"] == 1
+    assert report["chunks_merged"] == 1
+    assert report["passages"] == 1
+    assert context.startswith("[report p.2]")
+    assert context.count(WINDOW) == 1
+    assert "doubled output in 2021." in context
+
+
+def test_pack_respects_the_budget():
+    documents = [" ".join(f"word{i}x{j}" for j in range(200)) for i in range(10)]
+    metas = [{"doc_id": "d", "page": i} for i in range(10)]
+    context, report = pack_context("word", documents, metas, budget_tokens=800)
+    assert estimate_tokens(context) <= 800
+    assert report["passages"] < 10
+    assert report["passages_truncated"] + report["chunks_over_budget"] > 0
+
+
+def test_pack_budget_zero_is_a_plain_join():
+    context, report = pack_context("q", ["a", "b"], budget_tokens=0)
+    assert context == "a\n---\nb"
+    assert report["budget_tokens"] == 0
+
+
+def test_trim_table_keeps_relevant_rows():
+    rows = [f"| region{i} | {i} |" for i in range(30)]
+    table = "\n".join(["| Region | Sales |", "|---|---|"] + rows)
+    trimmed, dropped = trim_table(table, "sales for region7", max_rows=5)
+    assert dropped == 25
+    assert "| region7 | 7 |" in trimmed
+    assert trimmed.startswith("| Region | Sales |")
+
+
+def test_extract_answer_with_a_clear_lead():
+    documents = ["Acme was founded in 1998. The headquarters are in Lyon, France, near the river."]
+    answer, decision = extract_answer("where are the headquarters", documents,
+                                      [{"doc_id": "acme", "page": 1, "bbox": ""}], [0.2, 0.6])
+    assert decision["reason"] == "score_margin"
+    assert "Lyon" in answer["answer"]
+    assert answer["citation"] == {"doc_id": "acme", "page": 1, "bbox": None, "rank": 0}
+
+
+def test_extract_answer_on_exact_keyword_match():
+    documents = ["Our headquarters in Lyon opened in 2004 after the merger.", "Sales were flat."]
+    answer, decision = extract_answer("headquarters Lyon", documents, distances=[0.50, 0.51])
+    assert decision["reason"] == "exact_keyword_match"
+    assert answer["citation"]["rank"] == 0
+
+
+def test_lower_ranked_phrase_falls_back_to_the_llm():
+    documents = ["Returns are accepted within 30 days.", "Repairs are handled by the dealer.",
+                 "The warranty period is two years from delivery."]
+    answer, decision = extract_answer("warranty period", documents, distances=[0.50, 0.51, 0.52])
+    assert answer is None
+    assert decision["reason"] == "no_clear_margin"
+    assert decision["rank"] == 2
+
+
+def test_extract_answer_needs_a_clear_margin():
+    documents = ["Revenue rose sharply last year.", "Revenue growth came from exports."]
+    answer, decision = extract_answer("revenue growth exports", documents, distances=[0.50, 0.52])
+    assert answer is None
+    assert decision["reason"] == "no_clear_margin"
+
+
+def test_extract_answer_leaves_reasoning_to_the_llm():
+    answer, decision = extract_answer("why did revenue rise", ["Revenue rose because of exports."])
+    assert answer is None
+    assert decision["reason"] == "needs_synthesis"
+    forced, _ = extract_answer("why did revenue rise", ["Revenue rose because of exports."], force=True)
+    assert "exports" in forced["answer"]
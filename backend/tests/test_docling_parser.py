@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+import fitz
+import pytest
+
+pytest.importorskip("docling")
+from parsers.docling_parser import DoclingParser
+
+
+class FakeConverter:
+    def __init__(self, fail_ranges=()):
+        self.fail_ranges = set(fail_ranges)
+        self.calls = []
+
+    def convert(self, path, page_range=None):
+        self.calls.append(page_range)
+        if page_range in self.fail_ranges:
+            raise RuntimeError("table model crashed")
+        return SimpleNamespace(document=SimpleNamespace(pages={}))
+
+
+def _parser(table_converter, text_converter):
+    parser = DoclingParser.__new__(DoclingParser)
+    parser.converter, parser.text_converter = table_converter, text_converter
+    parser.ms_per_page = {True: None, False: None}
+    return parser
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    doc = fitz.open()
+    for i in range(6):
+        doc.new_page().insert_text((72, 72), f"page {i + 1}")
+    path = str(tmp_path / "doc.pdf")
+    doc.save(path)
+    return path
+
+
+def test_plan_runs_the_table_model_only_on_flagged_pages():
+    assert DoclingParser._plan(10, {3, 4}) == [(1, 2, False), (3, 4, True), (5, 10, False)]
+    # A one-page gap between table pages is folded into one table pass
+    assert DoclingParser._plan(10, {3, 5}) == [(1, 2, False), (3, 5, True), (6, 10, False)]
+
+
+def test_failed_table_pass_is_retried_without_the_table_model(pdf):
+    table, text = FakeConverter(fail_ranges={(3, 4)}), FakeConverter()
+    parser = _parser(table, text)
+    stats = parser.process(pdf, table_pages={3, 4})["stats"]
+    assert (3, 4) in text.calls
+    assert stats["failed_pages"] == []
+    assert stats["table_structure_pages"] == 0
+    assert parser.ms_per_page[False] is not None
+
+
+def test_pages_that_fail_every_pass_are_reported(pdf):
+    parser = _parser(FakeConverter(fail_ranges={(3, 4)}), FakeConverter(fail_ranges={(3, 4)}))
+    stats = parser.process(pdf, table_pages={3, 4})["stats"]
+    assert stats["failed_pages"] == [3, 4]
@@ -0,0 +1,93 @@
+import time
+import pytest
+from custom_storage import metadata
+from custom_storage.metadata import MetadataStore
+from modules import enrichment
+from modules.enrichment import EnrichmentWorker
+from modules.gemini_gateway import GeminiUnavailable
+
+
+class FakeGemini:
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+
+    def _next(self):
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def describe_image(self, path, prompt, op=None):
+        return self._next()
+
+    def summarize_text(self, text):
+        return self._next()
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    monkeypatch.setattr(metadata, "PROCESSED_DIR", str(tmp_path))
+    monkeypatch.setattr(metadata, "METADATA_DB_PATH", str(tmp_path / "metadata.sqlite"))
+    store = MetadataStore()
+    store.save_artifacts("report", [], [{"page": 2, "image_id": "fig", "caption": "Figure on page 2", "path": "fig.png"}])
+    store.enqueue_enrichment("report", [{"kind": "caption", "payload": {"idx": 0, "page": 2, "path": "fig.png"}}])
+    yield store
+    store.close()
+
+
+def test_caption_job_updates_the_figure(store):
+    worker = EnrichmentWorker(FakeGemini(" A bar chart of revenue. "), None, store)
+    worker.run_job(store.claim_enrichment(lease_seconds=60))
+    [image] = store.load_images("report")
+    assert image["caption"] == "A bar chart of revenue."
+    assert image["caption_status"] == "done"
+    assert store.enrichment_status("report") == {"caption": {"pending": 0, "running": 0, "done": 1, "failed": 0}}
+    assert store.claim_enrichment(lease_seconds=60) is None
+
+
+def test_transient_failures_retry_later_then_give_up(store, monkeypatch):
+    monkeypatch.setattr(enrichment, "ENRICHMENT_MAX_ATTEMPTS", 2)
+    worker = EnrichmentWorker(FakeGemini(GeminiUnavailable("busy", retry_after=30), GeminiUnavailable("busy")), None, store)
+
+    job = store.claim_enrichment(lease_seconds=60)
+    worker.run_job(job)
+    assert store.enrichment_status("report")["caption"]["pending"] == 1
+    # Not runnable until retry_after has passed
+    assert store.claim_enrichment(lease_seconds=60) is None
+    store.finish_enrichment(job["id"], "pending", retry_at=time.time() - 1)
+
+    job = store.claim_enrichment(lease_seconds=60)
+    assert job["attempts"] == 2
+    worker.run_job(job)
+    assert worker.counters == {"done": 0, "failed": 1, "retried": 1, "dropped": 0}
+    [image] = store.load_images("report")
+    assert image["caption"] == "Figure on page 2" and image["caption_status"] == "failed"
+    assert store.enrichment_errors("report") == [{"kind": "caption", "page": 2, "error": "GeminiUnavailable: busy"}]
+
+
+def test_reingest_while_running_drops_the_result(store):
+    job = store.claim_enrichment(lease_seconds=60)
+    store.register_document("report")
+    worker = EnrichmentWorker(FakeGemini("Stale caption"), None, store)
+    worker.run_job(job)
+    assert worker.counters["dropped"] == 1
+    assert store.load_images("report")[0]["caption"] == "Figure on page 2"
+
+
+def test_expired_lease_is_claimed_again(store):
+    first = store.claim_enrichment(lease_seconds=60)
+    assert store.claim_enrichment(lease_seconds=60) is None
+    # The worker holding the job died; once its lease is over another one takes it
+    again = store.claim_enrichment(lease_seconds=-1)
+    assert again["id"] == first["id"] and again["attempts"] == 2
+
+
+def test_table_summary_replaces_the_chunk_text(store, make_vector_store):
+    vector_store = make_vector_store()
+    [chunk_id] = vector_store.add_chunks([{"text": "Region | Revenue", "page": 3, "type": "table"}], "report")
+    store.enqueue_enrichment("report", [{"kind": "table_summary", "payload": {"chunk_id": chunk_id, "full_content": "Region | Revenue"}}])
+    worker = EnrichmentWorker(FakeGemini("Revenue by region."), vector_store, store)
+    worker.run_job(store.claim_enrichment(lease_seconds=60))
+    [shard] = vector_store.shards
+    assert shard.get(ids=[chunk_id], include=["documents"])["documents"] == ["LLM Summary: Revenue by region."]
+    assert store.enrichment_status("report")["table_summary"]["done"] == 1
@@ -0,0 +1,103 @@
+import time
+import pytest
+from admission import WorkloadClass
+from modules.gemini_gateway import CircuitBreaker, GeminiGateway, GeminiUnavailable, TokenBucket
+
+
+def _trip(breaker: CircuitBreaker):
+    for _ in range(breaker.threshold):
+        breaker.before_call()
+        breaker.failure()
+    assert breaker.state == "open"
+
+
+def _cool_down(breaker: CircuitBreaker):
+    breaker.opened_at = time.monotonic() - breaker.cooldown - 1
+
+
+def test_breaker_opens_after_threshold_and_rejects():
+    breaker = CircuitBreaker(threshold=2, cooldown=30)
+    _trip(breaker)
+    with pytest.raises(GeminiUnavailable) as e:
+        breaker.before_call()
+    assert e.value.retry_after >= 1
+
+
+def test_breaker_half_open_probe_success_closes():
+    breaker = CircuitBreaker(threshold=2, cooldown=30)
+    _trip(breaker)
+    _cool_down(breaker)
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    # Only one probe at a time
+    with pytest.raises(GeminiUnavailable):
+        breaker.before_call()
+    breaker.success()
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+
+def test_breaker_half_open_probe_failure_reopens():
+    breaker = CircuitBreaker(threshold=2, cooldown=30)
+    _trip(breaker)
+    _cool_down(breaker)
+    breaker.before_call()
+    breaker.failure()
+    assert breaker.state == "open"
+    assert breaker.trips == 2
+    with pytest.raises(GeminiUnavailable):
+        breaker.before_call()
+
+
+def test_breaker_abandoned_probe_lets_next_call_probe():
+    breaker = CircuitBreaker(threshold=1, cooldown=30)
+    _trip(breaker)
+    _cool_down(breaker)
+    breaker.before_call()
+    breaker.abandon()
+    assert breaker.state == "half_open"
+    breaker.before_call()
+
+
+@pytest.fixture
+def gateway():
+    gw = GeminiGateway(api_key="test-key")
+    gw.slots = WorkloadClass("gemini", limit=1, queue=0, timeout=0.01)
+    return gw
+
+
+def test_rejection_while_probing_does_not_wedge_breaker(gateway):
+    _trip(gateway.breaker)
+    _cool_down(gateway.breaker)
+    held = gateway.slots.acquire()
+    with pytest.raises(GeminiUnavailable) as e:
+        gateway.call("probe", lambda client: "never called")
+    assert e.value.throttled
+    assert gateway.breaker.stats()["state"] == "half_open"
+
+    gateway.slots.release(held)
+    assert gateway.call("probe", lambda client: "ok") == "ok"
+    assert gateway.breaker.state == "closed"
+    assert gateway.stats()["operations"]["probe"]["rejected"] == 1
+
+
+def test_token_bucket_spends_then_waits():
+    bucket = TokenBucket(per_minute=60)
+    assert bucket.reserve(60) == 0.0
+    # Empty: the next unit is a second away at 1/s
+    assert bucket.reserve(1) == pytest.approx(1.0, abs=0.05)
+    assert bucket.reserve(1) == pytest.approx(2.0, abs=0.05)
+
+
+def test_token_bucket_refills_and_caps_oversized_requests():
+    bucket = TokenBucket(per_minute=60)
+    bucket.reserve(60)
+    bucket.updated -= 30  # Half a minute later
+    assert bucket.reserve(30) == 0.0
+    bucket.updated -= 120  # Refill never exceeds capacity
+    assert bucket.reserve(500) == 0.0
+    assert bucket.level == pytest.approx(0.0, abs=0.01)
+
+
+def test_token_bucket_disabled():
+    assert TokenBucket(per_minute=0).reserve(10 ** 6) == 0.0
@@ -0,0 +1,53 @@
+import io
+from types import SimpleNamespace
+import pytest
+from PIL import Image
+from modules.context import IMAGE_TOKENS, estimate_tokens, image_tokens
+from modules.gemini_vision import GeminiProcessor
+from modules.renditions import encode_for_model
+
+
+def _image(tmp_path, size, fmt="PNG", name="page.png"):
+    path = tmp_path / name
+    Image.new("RGB", size, (200, 30, 30)).save(path, fmt)
+    return str(path)
+
+
+def test_encode_downscales_and_converts_to_grayscale(tmp_path):
+    data, mime = encode_for_model(_image(tmp_path, (2400, 1200)), max_side=1000, grayscale=True, fmt="jpeg")
+    assert mime == "image/jpeg"
+    with Image.open(io.BytesIO(data)) as encoded:
+        assert encoded.size == (1000, 500)
+        assert encoded.mode == "L"
+
+
+def test_encode_keeps_a_small_source_as_is(tmp_path):
+    # A heavily compressed JPEG re-encodes larger at full quality, so its own bytes are sent
+    path = str(tmp_path / "tiny.jpg")
+    Image.effect_noise((64, 64), 80).convert("RGB").save(path, "JPEG", quality=10)
+    data, mime = encode_for_model(path, max_side=1000, grayscale=False, fmt="webp", quality=100)
+    assert mime == "image/jpeg"
+    assert data == open(path, "rb").read()
+
+
+def test_image_tokens_count_tiles():
+    assert image_tokens(300, 200) == IMAGE_TOKENS
+    assert image_tokens(768, 768) == IMAGE_TOKENS
+    assert image_tokens(1600, 1000) == IMAGE_TOKENS * 3 * 2
+
+
+class RecordingGateway:
+    def __init__(self):
+        self.tokens = []
+
+    def call(self, op, fn, tokens=1, payload_bytes=None):
+        self.tokens.append(tokens)
+        return SimpleNamespace(text="a red square")
+
+
+@pytest.mark.parametrize("mode", ["inline", "upload"])
+def test_vision_calls_charge_the_image(tmp_path, mode):
+    processor = GeminiProcessor.__new__(GeminiProcessor)
+    processor.model_name, processor.gateway = "test-model", RecordingGateway()
+    processor.describe_image(_image(tmp_path, (1600, 1000)), "Describe it.", max_side=1600, mode=mode)
+    assert processor.gateway.tokens == [IMAGE_TOKENS * 6 + estimate_tokens("Describe it.")]
@@ -0,0 +1,75 @@
+import os
+import time
+import pytest
+from custom_storage import housekeeping, metadata
+from custom_storage.housekeeping import ArtifactCollector
+from custom_storage.metadata import MetadataStore
+
+DAY = 24 * 3600
+
+
+@pytest.fixture
+def collector(monkeypatch, tmp_path, make_vector_store):
+    for name in ("pdfs", "pages", "images", "processed"):
+        (tmp_path / name).mkdir()
+    monkeypatch.setattr(housekeeping, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(housekeeping, "PDF_DIR", str(tmp_path / "pdfs"))
+    monkeypatch.setattr(housekeeping, "PAGES_DIR", str(tmp_path / "pages"))
+    monkeypatch.setattr(housekeeping, "IMAGE_DIR", str(tmp_path / "images"))
+    monkeypatch.setattr(housekeeping, "PROCESSED_DIR", str(tmp_path / "processed"))
+    monkeypatch.setattr(metadata, "PROCESSED_DIR", str(tmp_path / "processed"))
+    monkeypatch.setattr(metadata, "METADATA_DB_PATH", str(tmp_path / "metadata.sqlite"))
+    metadata_store = MetadataStore()
+    metadata_store.seed_documents(lambda: [])
+    yield ArtifactCollector(make_vector_store(), metadata_store, grace_seconds=DAY)
+    metadata_store.close()
+
+
+def _write(path, age=0.0):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * 10)
+    stamp = time.time() - age
+    os.utime(path, (stamp, stamp))
+    return path
+
+
+def test_collect_removes_only_old_orphans(collector, tmp_path):
+    collector.metadata_store.register_document("report")
+    collector.vector_store.add_chunks([{"text": "kept", "page": 1}], "report")
+    collector.vector_store.add_chunks([{"text": "stale", "page": 1}], "old")
+    collector.metadata_store.save_artifacts("old", [{"page": 1, "data": [["a"]]}], [])
+    collector.metadata_store._db.execute("DELETE FROM documents WHERE doc_id = 'old'")
+
+    live_pdf = _write(tmp_path / "pdfs" / "report.pdf", age=2 * DAY)
+    stale_pdf = _write(tmp_path / "pdfs" / "old.pdf", age=2 * DAY)
+    stale_figure = _write(tmp_path / "images" / "old_page1_img1.png", age=2 * DAY)
+    fresh_upload = _write(tmp_path / "pdfs" / "uploading.pdf")
+    stale_pages = tmp_path / "pages" / "old"
+    _write(stale_pages / "page_1.webp")
+    os.utime(stale_pages, (time.time() - 2 * DAY,) * 2)
+
+    preview = collector.collect(dry_run=True)
+    assert sorted(f["path"] for f in preview["orphan_files"]) == [
+        "images/old_page1_img1.png", "pages/old", "pdfs/old.pdf"
+    ]
+    assert stale_pdf.exists() and collector.last_run is None
+
+    result = collector.collect()
+    assert result["orphan_vector_documents"] == ["old"]
+    assert result["orphan_metadata_documents"] == ["old"]
+    assert not stale_pdf.exists() and not stale_figure.exists() and not stale_pages.exists()
+    assert live_pdf.exists() and fresh_upload.exists()
+    assert set(collector.vector_store.chunk_counts()) == {"report"}
+    assert collector.metadata_store.load_tables("old") == []
+
+
+def test_usage_attributes_files_to_documents(collector, tmp_path):
+    collector.metadata_store.register_document("report")
+    _write(tmp_path / "pdfs" / "report.pdf")
+    _write(tmp_path / "images" / "report_page2_img1.png")
+    _write(tmp_path / "pdfs" / "ghost.pdf")
+
+    usage = collector.usage()
+    docs = {d["doc_id"]: d for d in usage["documents"]}
+    assert docs["report"]["pdfs"] == 10 and docs["report"]["figures"] == 10 and docs["report"]["live"]
+    assert usage["orphan_documents"] == ["ghost"]
@@ -0,0 +1,122 @@
+import io
+import os
+from types import SimpleNamespace
+import fitz
+import pytest
+import pipeline as pipeline_module
+import resources
+from config import UPLOAD_DIR
+from modules.gemini_gateway import GeminiError
+from modules.renditions import pages_dir
+from pipeline import Pipeline
+
+
+def _pdf(pages):
+    doc = fitz.open()
+    for text in pages:
+        doc.new_page().insert_text((72, 72), text)
+    return doc.tobytes()
+
+
+@pytest.fixture
+def pipeline(monkeypatch, make_vector_store):
+    store = make_vector_store()
+    monkeypatch.setattr(resources, "vector_store", lambda: store)
+    pipe = Pipeline(parse=False)
+    state = SimpleNamespace(pipe=pipe, store=store, calls=[], fail_call=None)
+
+    def read_page(path, mode=None):
+        # Text differs per call, so a re-parsed page gets new chunks
+        state.calls.append(path)
+        if len(state.calls) == state.fail_call:
+            raise GeminiError("unavailable")
+        return {"text": f"contents of {path.rsplit('/', 1)[-1]} call {len(state.calls)}"}
+
+    monkeypatch.setattr(pipe.gemini, "extract_text_from_image", read_page)
+    return state
+
+
+def _ingest(pipe, pages, name="increment.pdf"):
+    return pipe.run(io.BytesIO(_pdf(pages)), name, extraction_mode="GEMINI")
+
+
+def _chunks_by_page(store, doc_id):
+    metas = store.shards[0].get(where={"doc_id": doc_id}, include=["metadatas"])
+    return {m["page"]: chunk_id for chunk_id, m in zip(metas["ids"], metas["metadatas"])}
+
+
+def test_only_changed_and_added_pages_are_reparsed(pipeline):
+    pipe, store, calls = pipeline.pipe, pipeline.store, pipeline.calls
+    first = _ingest(pipe, ["north region", "south region", "west region"])
+    assert first["status"] == "success"
+    assert first["incremental"]["mode"] == "full"
+    assert len(calls) == 3
+    before = _chunks_by_page(store, "increment")
+
+    second = _ingest(pipe, ["north region", "south region revised", "west region", "east region"])
+    assert second["incremental"] == {"mode": "incremental", "pages": 4, "unchanged": 2, "changed": 1,
+                                     "added": 1, "removed": 0}
+    assert len(calls) == 5
+    after = _chunks_by_page(store, "increment")
+    assert sorted(after) == [1, 2, 3, 4]
+    assert after[1] == before[1] and after[3] == before[3]
+    assert after[2] != before[2]
+
+    third = _ingest(pipe, ["north region", "south region revised"])
+    assert third["incremental"]["removed"] == 2
+    assert sorted(_chunks_by_page(store, "increment")) == [1, 2]
+
+
+def test_unchanged_upload_does_nothing(pipeline):
+    pipe, calls = pipeline.pipe, pipeline.calls
+    _ingest(pipe, ["alpha", "beta"], name="same.pdf")
+    result = _ingest(pipe, ["alpha", "beta"], name="same.pdf")
+    assert result["incremental"]["unchanged"] == 2
+    assert "chunks" not in result
+    assert len(calls) == 2
+
+
+def test_failed_page_is_retried_on_the_next_upload(pipeline):
+    pipe, store, calls = pipeline.pipe, pipeline.store, pipeline.calls
+    pipeline.fail_call = 2
+    first = _ingest(pipe, ["alpha", "beta", "gamma"], name="retry.pdf")
+    assert first["failed_pages"] == [2]
+    assert pipe.metadata_store.page_fingerprints("retry")[2] == ""
+
+    pipeline.fail_call = None
+    second = _ingest(pipe, ["alpha", "beta", "gamma"], name="retry.pdf")
+    assert second["incremental"]["changed"] == 1
+    assert calls[-1].endswith(calls[1].rsplit("/", 1)[-1])
+    assert sorted(_chunks_by_page(store, "retry")) == [1, 2, 3]
+
+
+def test_new_document_that_fails_completely_is_not_registered(pipeline):
+    pipeline.fail_call = 1
+    result = _ingest(pipeline.pipe, ["only page"], name="broken.pdf")
+    assert result["status"] == "error"
+    assert pipeline.pipe.metadata_store.updated_at("broken") is None
+    assert pipeline.pipe.citations.pdf_path("broken") is None
+
+
+def test_failed_reupload_keeps_the_previous_renditions(pipeline):
+    pipe = pipeline.pipe
+    _ingest(pipe, ["alpha", "beta"], name="keep.pdf")
+    stored = sorted(os.listdir(pages_dir("keep")))
+    before = {name: os.path.getmtime(os.path.join(pages_dir("keep"), name)) for name in stored}
+
+    pipeline.fail_call = len(pipeline.calls) + 1
+    result = _ingest(pipe, ["alpha", "beta revised"], name="keep.pdf")
+    assert result["status"] == "error"
+    assert {name: os.path.getmtime(os.path.join(pages_dir("keep"), name)) for name in stored} == before
+    assert not os.listdir(UPLOAD_DIR)
+
+
+def test_full_reingest_drops_pages_the_new_version_lacks(pipeline, monkeypatch):
+    pipe = pipeline.pipe
+    _ingest(pipe, ["one", "two", "three"], name="shrink.pdf")
+    assert any(name.startswith("page_003.") for name in os.listdir(pages_dir("shrink")))
+
+    monkeypatch.setattr(pipeline_module, "INCREMENTAL_REINGEST", False)
+    result = _ingest(pipe, ["one"], name="shrink.pdf")
+    assert result["incremental"]["mode"] == "full"
+    assert {name.split(".")[0] for name in os.listdir(pages_dir("shrink"))} == {"page_001"}
@@ -0,0 +1,106 @@
+import gzip
+import json
+import os
+import shutil
+import zipfile
+import pytest
+import resources
+from config import PDF_DIR, DATA_DIR
+from custom_storage import knowledge_pack
+
+TABLE = {"page": 1, "headers": ["Item", "Cost"], "data": [["Item", "Cost"], ["Rent", "10"]], "rows": 2, "cols": 2}
+
+
+@pytest.fixture
+def stores(make_vector_store):
+    vector_store, metadata_store = make_vector_store(), resources.metadata_store()
+    for doc_id, text in (("pack_a", "office rent and utilities"), ("pack_b", "travel and hotel costs")):
+        metadata_store.register_document(doc_id)
+        vector_store.add_chunks([{"text": text, "page": 1}], doc_id)
+        metadata_store.save_artifacts(doc_id, [TABLE], [])
+        metadata_store.save_page_fingerprints(doc_id, ["fp1"])
+        os.makedirs(PDF_DIR, exist_ok=True)
+        with open(os.path.join(PDF_DIR, f"{doc_id}.pdf"), "wb") as f:
+            f.write(b"%PDF-1.4 " + doc_id.encode())
+    yield vector_store, metadata_store
+    for doc_id in ("pack_a", "pack_b"):
+        metadata_store.delete_document(doc_id)
+
+
+def _rewrite(src, dest, edit):
+    """Copies a pack with each member passed through `edit(name, data)`; returns dest."""
+    with zipfile.ZipFile(src) as packed, zipfile.ZipFile(dest, "w") as out:
+        for name in packed.namelist():
+            out.writestr(name, edit(name, packed.read(name)))
+    return dest
+
+
+@pytest.fixture
+def exported(stores):
+    vector_store, metadata_store = stores
+    pack = knowledge_pack.export_pack(vector_store, metadata_store, name="source", doc_ids=["pack_a"])
+    yield pack["path"]
+    os.remove(pack["path"])
+
+
+def test_round_trip_restores_vectors_and_artifacts(stores, exported):
+    vector_store, metadata_store = stores
+    before = vector_store.search("office rent", n_results=1)
+
+    metadata_store.delete_document("pack_a")
+    vector_store.delete_document("pack_a")
+    assert not os.path.exists(os.path.join(PDF_DIR, "pack_a.pdf"))
+
+    result = knowledge_pack.import_pack(vector_store, metadata_store, exported)
+    assert result["doc_ids"] == ["pack_a"]
+    assert result["chunks"] == 1
+    assert vector_store.search("office rent", n_results=1)["ids"] == before["ids"]
+    assert metadata_store.load_tables("pack_a")[0]["data"] == TABLE["data"]
+    assert metadata_store.page_fingerprints("pack_a") == {1: "fp1"}
+    assert os.path.exists(os.path.join(PDF_DIR, "pack_a.pdf"))
+    assert vector_store.doc_index.get(ids=["pack_a"], include=[])["ids"] == ["pack_a"]
+
+
+def _refused(stores, path, message):
+    vector_store, metadata_store = stores
+    count = vector_store.count()
+    with pytest.raises(ValueError, match=message):
+        knowledge_pack.import_pack(vector_store, metadata_store, str(path))
+    assert vector_store.count() == count
+
+
+def test_path_traversal_member_is_refused(stores, exported, tmp_path):
+    path = shutil.copy(exported, tmp_path / "slip.pack")
+    with zipfile.ZipFile(path, "a") as pack:
+        pack.writestr("../../escaped.txt", "owned")
+    _refused(stores, path, "Unsafe path")
+    assert not os.path.exists(os.path.join(os.path.dirname(DATA_DIR), "escaped.txt"))
+
+
+def test_traversing_doc_id_is_refused(stores, exported, tmp_path):
+    def rename(name, data):
+        if name == "documents.jsonl.gz":
+            entries = [json.loads(line) for line in gzip.decompress(data).decode().splitlines()]
+            entries[0]["doc_id"] = "../../static"
+            return gzip.compress("\n".join(json.dumps(e) for e in entries).encode())
+        return data
+    _refused(stores, _rewrite(exported, tmp_path / "docid.pack", rename), "Invalid doc_id")
+    assert resources.metadata_store().updated_at("../../static") is None
+
+
+def test_rows_of_unlisted_documents_are_refused(stores, exported, tmp_path):
+    def smuggle(name, data):
+        if name == "knowledge_base.rows.jsonl.gz":
+            rows = [json.loads(line) for line in gzip.decompress(data).decode().splitlines()]
+            rows[0]["metadata"]["doc_id"] = "pack_b"
+            return gzip.compress("\n".join(json.dumps(r) for r in rows).encode())
+        return data
+    _refused(stores, _rewrite(exported, tmp_path / "smuggle.pack", smuggle), "unlisted document")
+
+
+def test_pack_from_another_embedding_model_is_refused(stores, exported, tmp_path):
+    def other_model(name, data):
+        if name == "manifest.json":
+            return json.dumps(dict(json.loads(data), embedding_model="other-model"))
+        return data
+    _refused(stores, _rewrite(exported, tmp_path / "model.pack", other_model), "other-model")
@@ -0,0 +1,52 @@
+import json
+import os
+import pytest
+from custom_storage import metadata
+from custom_storage.metadata import MetadataStore
+
+
+@pytest.fixture
+def processed_dir(monkeypatch, tmp_path):
+    processed = tmp_path / "processed"
+    processed.mkdir()
+    monkeypatch.setattr(metadata, "PROCESSED_DIR", str(processed))
+    monkeypatch.setattr(metadata, "METADATA_DB_PATH", str(tmp_path / "metadata.sqlite"))
+    return processed
+
+
+TABLE = {"page": 3, "data": [["North", "1,200"], ["East", "(40)"], ["South"]],
+         "headers": ["Region", "Revenue"], "rows": 3, "cols": 2, "bbox": [1, 2, 3, 4]}
+
+
+def test_legacy_json_is_imported_once_and_backed_up(processed_dir):
+    (processed_dir / "report_tables.json").write_text(json.dumps([TABLE]))
+    (processed_dir / "report_images.json").write_text(json.dumps([{"page": 1, "image_id": "fig", "caption": "A chart", "path": "x.png"}]))
+
+    store = MetadataStore()
+    assert store.list_documents() == ["report"]
+    [table] = store.load_tables("report")
+    assert table["data"] == [["North", "1,200"], ["East", "(40)"], ["South", None]]
+    assert table["bbox"] == [1, 2, 3, 4]
+    assert store.load_images("report") == [{"path": "x.png", "image_id": "fig", "page": 1, "caption": "A chart"}]
+    assert sorted(os.listdir(processed_dir / "json_backup")) == ["report_images.json", "report_tables.json"]
+    store.close()
+
+    # A file that reappears later is not imported over the database
+    (processed_dir / "memo_tables.json").write_text(json.dumps([TABLE]))
+    store = MetadataStore()
+    assert store.list_documents() == ["report"]
+    assert (processed_dir / "memo_tables.json").exists()
+    store.close()
+
+
+def test_artifacts_page_and_paginate(processed_dir):
+    store = MetadataStore()
+    tables = [dict(TABLE, page=page) for page in (1, 2, 2, 2)]
+    store.save_artifacts("report", tables, [])
+    assert len(store.load_tables("report", page=2)) == 3
+    assert [t["page"] for t in store.load_tables("report", offset=1, limit=2)] == [2, 2]
+    assert store.count_artifacts("report", page=2) == {"tables": 3, "images": 0}
+    typed = store.load_typed_tables("report")[0]
+    assert typed["column_types"] == ["text", "integer"]
+    assert typed["columns"][1] == [1200, -40, None]
+    store.close()
@@ -0,0 +1,42 @@
+import pytest
+from fastapi.testclient import TestClient
+import main
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setitem(main.readiness, "core", False)
+    monkeypatch.setitem(main.readiness, "ingest", False)
+    monkeypatch.setitem(main.startup_report, "error", None)
+    return TestClient(main.app)
+
+
+def test_probes_follow_warm_up(client, monkeypatch):
+    assert client.get("/healthz").status_code == 200
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    assert response.json()["components"] == {"core": False, "ingest": False}
+
+    monkeypatch.setitem(main.readiness, "core", True)
+    response = client.get("/readyz")
+    assert response.status_code == 200
+    assert response.json()["ready"] is True
+
+
+def test_uploads_wait_for_the_ingest_stage(client, monkeypatch):
+    monkeypatch.setitem(main.readiness, "core", True)
+    response = client.post("/upload")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "5"
+    assert "ingest not ready" in response.json()["message"]
+
+
+def test_failed_warm_up_is_reported(client, monkeypatch):
+    def broken():
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(main.resources, "metadata_store", broken)
+    main._warm_up()
+    assert main.readiness["core"] is False
+    assert client.get("/readyz").json()["startup"]["error"] == "disk full"
+    assert client.get("/search", params={"q": "revenue"}).json()["message"] == "Warm-up failed: disk full"
@@ -0,0 +1,58 @@
+import os
+import pytest
+from PIL import Image
+from modules import renditions
+from modules.renditions import PAGE_SCREEN_WIDTH, PAGE_THUMB_WIDTH, backfill_document, rendition_name, resolve
+
+
+@pytest.fixture
+def pages(monkeypatch, tmp_path):
+    monkeypatch.setattr(renditions, "PAGES_DIR", str(tmp_path / "pages"))
+    directory = tmp_path / "pages" / "report"
+    directory.mkdir(parents=True)
+    return directory
+
+
+def _legacy_page(directory, page_num, size=(1600, 2000)):
+    Image.new("RGB", size, (240, 240, 240)).save(directory / f"page_{page_num:03d}.png")
+
+
+def test_backfill_replaces_legacy_pngs_with_renditions(pages):
+    _legacy_page(pages, 1)
+    _legacy_page(pages, 2)
+    report = backfill_document("report")
+    assert report["pages"] == 2 and 0 < report["bytes_after"] < report["bytes_before"]
+    assert sorted(os.listdir(pages)) == sorted(
+        rendition_name(n, kind) for n in (1, 2) for kind in ("screen", "thumb")
+    )
+    with Image.open(pages / rendition_name(1, "thumb")) as thumb:
+        assert thumb.width == PAGE_THUMB_WIDTH
+    with Image.open(pages / rendition_name(1, "screen")) as screen:
+        assert screen.width == PAGE_SCREEN_WIDTH
+    # Nothing left to convert
+    assert backfill_document("report")["pages"] == 0
+
+
+def test_backfill_can_keep_the_png_as_the_full_rendition(pages):
+    _legacy_page(pages, 1)
+    backfill_document("report", keep_full=True)
+    assert resolve("report", 1, size="full") == (str(pages / rendition_name(1, "full")), "full")
+
+
+def test_resolve_picks_the_smallest_rendition_wide_enough(pages):
+    _legacy_page(pages, 1)
+    backfill_document("report")
+    assert resolve("report", 1, width=PAGE_THUMB_WIDTH)[1] == "thumb"
+    assert resolve("report", 1, width=PAGE_THUMB_WIDTH + 1)[1] == "screen"
+    assert resolve("report", 1)[1] == "screen"
+    # Wider than screen asks for full, which this document didn't keep
+    assert resolve("report", 1, width=PAGE_SCREEN_WIDTH + 1) == (None, "full")
+    with pytest.raises(ValueError):
+        resolve("report", 1, size="poster")
+    with pytest.raises(FileNotFoundError):
+        resolve("report", 9, size="thumb")
+
+
+def test_resolve_serves_legacy_pngs_until_backfilled(pages):
+    _legacy_page(pages, 1, size=(100, 100))
+    assert resolve("report", 1, size="thumb") == (str(pages / "page_001.png"), "legacy")
@@ -0,0 +1,51 @@
+import pytest
+from fastapi.testclient import TestClient
+from conftest import fake_embedding
+
+
+class EchoGemini:
+    async def generate_answer_async(self, query, context):
+        return f"answer to {query}"
+
+
+@pytest.fixture
+def batch_api(api, monkeypatch):
+    api.vector_store.add_chunks([{"text": "quarterly revenue grew in the north region", "page": 1}], "report")
+    api.vector_store.add_chunks([{"text": "headcount fell in the south office", "page": 2}], "memo")
+    monkeypatch.setattr(api, "gemini", EchoGemini())
+    return api
+
+
+def test_batch_embeds_once_and_keeps_order(batch_api, monkeypatch):
+    calls = []
+
+    def counting(texts):
+        calls.append(list(texts))
+        return fake_embedding(texts)
+
+    monkeypatch.setattr(batch_api.vector_store, "embedding_fn", counting)
+    response = TestClient(batch_api.app).post("/search/batch", json={"limit": 1, "queries": [
+        {"q": "south headcount"},
+        {"q": "north revenue"},
+        {"q": "north revenue", "filters": {"doc_id": "memo"}},
+    ]})
+    body = response.json()
+    assert calls == [["south headcount", "north revenue", "north revenue"]]
+    assert body["count"] == 3
+    assert [r["q"] for r in body["results"]] == ["south headcount", "north revenue", "north revenue"]
+    assert [r["metadatas"][0][0]["doc_id"] for r in body["results"]] == ["memo", "report", "memo"]
+    assert "answer" not in body["results"][0]
+
+
+def test_batch_synthesizes_per_query(batch_api):
+    response = TestClient(batch_api.app).post("/search/batch", json={
+        "synthesize": True, "answer_mode": "llm", "queries": [{"q": "north revenue"}, {"q": "south headcount"}]
+    })
+    assert [r["answer"] for r in response.json()["results"]] == ["answer to north revenue", "answer to south headcount"]
+
+
+def test_batch_rejects_oversized_batches(batch_api, monkeypatch):
+    monkeypatch.setattr(batch_api, "BATCH_SEARCH_MAX_QUERIES", 2)
+    response = TestClient(batch_api.app).post("/search/batch", json={"queries": [{"q": "a"}, {"q": "b"}, {"q": "c"}]})
+    assert response.status_code == 413
+    assert batch_api.admission["search"].stats()["in_flight"] == 0
@@ -0,0 +1,54 @@
+import asyncio
+import json
+import pytest
+from fastapi.testclient import TestClient
+from admission import WorkloadClass
+
+
+class StreamingGemini:
+    async def stream_answer_async(self, query, context):
+        for text in ("Revenue grew ", "in the north."):
+            yield text
+
+
+def _events(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.fixture
+def stream_api(api, monkeypatch):
+    api.vector_store.add_chunks([{"text": "quarterly revenue grew in the north region", "page": 1}], "report")
+    monkeypatch.setattr(api, "gemini", StreamingGemini())
+    monkeypatch.setitem(api.admission.classes, "search", WorkloadClass("search", limit=1, queue=0, timeout=0.01))
+    return api
+
+
+def test_stream_sends_sources_then_tokens_then_done(stream_api):
+    response = TestClient(stream_api.app).get("/search/stream", params={"q": "revenue north", "answer_mode": "llm"})
+    events = _events(response.text)
+    assert [name for name, _ in events] == ["sources", "token", "token", "done"]
+    assert events[0][1]["metadatas"][0][0]["doc_id"] == "report"
+    assert events[-1][1]["answer"] == "Revenue grew in the north."
+    assert "first_token_ms" in events[-1][1]["retrieval"]
+    assert stream_api.admission["search"].stats()["in_flight"] == 0
+
+
+def test_unread_stream_holds_no_slot(stream_api):
+    # A client that disconnects before the body is iterated never runs the generator
+    asyncio.run(stream_api.search_stream(q="revenue north"))
+    assert stream_api.admission["search"].stats()["in_flight"] == 0
+
+
+def test_stream_over_capacity_reports_429_as_an_event(stream_api):
+    held = stream_api.admission["search"].acquire()
+    try:
+        response = TestClient(stream_api.app).get("/search/stream", params={"q": "revenue north"})
+    finally:
+        stream_api.admission["search"].release(held)
+    [(name, data)] = _events(response.text)
+    assert name == "error"
+    assert data["status_code"] == 429 and data["retry_after"] >= 1
@@ -0,0 +1,62 @@
+import pytest
+from custom_storage.metadata import MetadataStore
+from modules.table_query import TableQueryEngine
+
+REVENUE = {
+    "page": 3,
+    "headers": ["Region", "Q3 Revenue", "Q4 Revenue"],
+    "data": [
+        ["Region", "Q3 Revenue", "Q4 Revenue"],
+        ["North", "120", "150"],
+        ["South", "80", "95"],
+        ["Subtotal", "200", "245"],
+        ["West", "50", "60"],
+        ["Total", "250", "305"],
+    ],
+    "rows": 6,
+    "cols": 3,
+}
+
+
+@pytest.fixture(scope="module")
+def engine():
+    store = MetadataStore()
+    store.save_tables([REVENUE], "tq-doc")
+    yield TableQueryEngine(store)
+    store.delete_document("tq-doc")
+    store.close()
+
+
+def test_lookup_needs_row_and_column(engine):
+    hit = engine.answer_lookup("What was the Q3 revenue for North?", ["tq-doc"])
+    assert hit["operation"] == "lookup"
+    assert hit["row_label"] == "North"
+    assert hit["value"] == 120
+
+
+def test_sum_skips_total_rows(engine):
+    hit = engine.answer_lookup("What is the sum of Q4 revenue?", ["tq-doc"])
+    assert hit["operation"] == "sum"
+    assert hit["value"] == 150 + 95 + 60
+
+
+def test_total_question_reads_the_total_row(engine):
+    hit = engine.answer_lookup("What is the total Q4 revenue?", ["tq-doc"])
+    assert hit["row_label"] == "Total"
+    assert hit["value"] == 305
+
+
+def test_max_skips_total_rows(engine):
+    hit = engine.answer_lookup("Which region had the highest Q3 revenue?", ["tq-doc"])
+    assert hit["operation"] == "max"
+    assert hit["row_label"] == "North"
+
+
+@pytest.mark.parametrize("question", [
+    "What is the company's strategy in the North?",
+    "What are the main risks for revenue?",
+    "Who leads the South region?",
+    "Where do most customers come from?",
+])
+def test_prose_questions_go_to_the_llm(engine, question):
+    assert engine.answer_lookup(question, ["tq-doc"]) is None
@@ -0,0 +1,106 @@
+import pytest
+from custom_storage import vector
+
+DOCS = {
+    "alpha": ["quarterly revenue grew in the north region", "the board approved a new dividend policy"],
+    "beta": ["warehouse safety inspection found no violations", "forklift training is required yearly"],
+    "gamma": ["cloud migration cut hosting costs", "the data center lease ends next spring"],
+}
+
+
+def _fill(store, partitions=None):
+    for doc_id, texts in DOCS.items():
+        store.add_chunks([{"text": t, "page": i + 1} for i, t in enumerate(texts)], doc_id,
+                         partition=(partitions or {}).get(doc_id))
+
+
+def _shard_doc_ids(store):
+    return [{(m or {}).get("doc_id") for m in shard.get(include=["metadatas"])["metadatas"]} for shard in store.shards]
+
+
+def test_chunks_live_in_the_shard_that_owns_them(monkeypatch, make_vector_store):
+    monkeypatch.setattr(vector, "VECTOR_SHARDS", 3)
+    store = make_vector_store()
+    _fill(store)
+    for index, doc_ids in enumerate(_shard_doc_ids(store)):
+        assert all(store.shard_for(doc_id) == index for doc_id in doc_ids)
+    assert store.count() == 6
+    assert store._relevant_shards({"doc_id": "beta"}) == [store.shard_for("beta")]
+
+    hits = store.search("forklift training", n_results=1)
+    assert hits["metadatas"][0][0]["doc_id"] == "beta"
+    hits = store.search("revenue", n_results=6, where={"doc_id": {"$in": ["gamma"]}})
+    assert {m["doc_id"] for m in hits["metadatas"][0]} == {"gamma"}
+
+
+def test_rebalance_moves_chunks_to_the_new_layout(monkeypatch, make_vector_store):
+    store = make_vector_store()
+    _fill(store)
+    store.backend.close()
+
+    monkeypatch.setattr(vector, "VECTOR_SHARDS", 4)
+    resharded = make_vector_store()
+    report = resharded.rebalance_shards()
+    assert report["dropped"] == ["knowledge_base"]
+    assert report["moved"] == 6
+    for index, doc_ids in enumerate(_shard_doc_ids(resharded)):
+        assert all(resharded.shard_for(doc_id) == index for doc_id in doc_ids)
+    assert resharded.count() == 6
+
+
+def test_snapshot_restore_round_trip(make_vector_store):
+    store = make_vector_store()
+    _fill(store)
+    before = store.search("dividend policy", n_results=3)
+    snap = store.snapshot("round-trip")
+    assert snap["collections"]["knowledge_base"]["count"] == 6
+
+    store.delete_document("alpha")
+    assert store.count() == 4
+
+    report = store.restore("round-trip")
+    assert report["status"] == "success"
+    assert report["collections"]["knowledge_base"] == 6
+    assert store.count() == 6
+    after = store.search("dividend policy", n_results=3)
+    assert after["ids"] == before["ids"]
+    assert [m["doc_id"] for m in store.doc_index.get(include=["metadatas"])["metadatas"]].count("alpha") == 1
+    with pytest.raises(ValueError):
+        store.restore("missing")
+
+
+
+@pytest.mark.parametrize("name", ["../static/x", "nested/snap", ".hidden"])
+def test_snapshot_names_stay_inside_the_snapshot_dir(make_vector_store, tmp_path, name):
+    store = make_vector_store()
+    _fill(store)
+    with pytest.raises(ValueError, match="Invalid snapshot name"):
+        store.snapshot(name)
+    with pytest.raises(ValueError, match="Invalid snapshot name"):
+        store.restore(name)
+    assert not (tmp_path / "static").exists()
+
+
+def test_two_stage_honours_the_partition(monkeypatch, make_vector_store):
+    monkeypatch.setattr(vector, "VECTOR_SHARD_KEY", "tenant")
+    monkeypatch.setattr(vector, "VECTOR_SHARDS", 2)
+    store = make_vector_store()
+    _fill(store, partitions={"alpha": "t1", "beta": "t2", "gamma": "t2"})
+
+    hits = store.search_two_stage("quarterly revenue", n_results=3, candidate_docs=1, where={"tenant": "t2"})
+    assert hits["candidate_docs"] and "alpha" not in hits["candidate_docs"]
+    assert {m["tenant"] for m in hits["metadatas"][0]} == {"t2"}
+
+
+def test_two_stage_searches_flat_until_the_index_is_rebuilt(make_vector_store):
+    store = make_vector_store()
+    _fill(store)
+    store.doc_index.delete(ids=list(DOCS))
+
+    hits = store.search_two_stage("forklift training", n_results=1)
+    assert hits["candidate_docs"] is None
+    assert hits["metadatas"][0][0]["doc_id"] == "beta"
+
+    store._index_rebuild.join(timeout=10)
+    assert store.doc_index.count() == 3
+    assert store.search_two_stage("forklift training", n_results=1)["candidate_docs"]
@@ -38,6 +38,13 @@ def benchmark_system(file_path):
     
     print(f"✅ Search Latency: {(end_time - start_time) * 1000:.2f} ms")
 
+    # 3. Two-Stage vs Flat Retrieval
+    response = requests.get(f"{API_URL}/search", params={"q": query, "mode": "two_stage", "compare": "true"})
+    if response.status_code == 200:
+        retrieval = response.json().get("retrieval", {})
+        print(f"✅ Two-Stage Retrieval: {retrieval.get('latency_ms')} ms "
+              f"(flat: {retrieval.get('flat_latency_ms')} ms, recall@k: {retrieval.get('recall_at_k')})")
+
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("Usage: python benchmarks.py <path_to_pdf>")
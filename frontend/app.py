@@ -16,6 +16,28 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+def stream_search(prompt: str, state: dict, limit: int = 4):
+    """
+    Reads the /search/stream Server-Sent Events and yields answer tokens.
+    The `sources` payload (and the final answer) are stored in state["data"].
+    """
+    with requests.get(f"{API_URL}/search/stream", params={"q": prompt, "limit": limit}, stream=True, timeout=120) as resp:
+        resp.raise_for_status()
+        event = "message"
+        for line in resp.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                payload = json.loads(line[len("data:"):].strip())
+                if event == "sources":
+                    state["data"] = payload
+                elif event == "token":
+                    yield payload["text"]
+                elif event == "done":
+                    state.setdefault("data", {}).update(payload)
+                elif event == "error":
+                    raise RuntimeError(payload.get("message", "stream failed"))
+
 # --- INITIALIZE SESSION STATE ---
 if "app_state" not in st.session_state:
     st.session_state.app_state = "landing"
@@ -269,30 +291,28 @@ elif st.session_state.app_state == "dashboard":
                 with st.chat_message("user"): st.markdown(prompt)
                 
                 with st.chat_message("assistant"):
-                    with st.spinner("Analyzing knowledge..."):
-                        try:
-                            resp = requests.get(f"{API_URL}/search", params={"q": prompt, "limit": 4})
-                            if resp.status_code == 200:
-                                data = resp.json()
-                                # Get AI Synthesis and Chunks
-                                answer = data.get("answer", "I couldn't synthesize an answer, but here are the relevant extracts.")
-                                chunks = data.get('documents', [[]])[0]
-                                metas = data.get('metadatas', [[]])[0]
-                                
-                                # Store for reference panel
-                                st.session_state.last_search_results = data
-                                
-                                current_chat["messages"].append({"role": "assistant", "content": answer})
-                                st.markdown(answer)
-                                
-                                # Show Quick Sources
-                                if metas:
-                                    st.markdown("---")
-                                    st.caption("Quick Sources:")
-                                    for m in metas[:3]:
-                                        st.markdown(f"<span class='source-pill'>Pg {m.get('page','?')}</span>", unsafe_allow_html=True)
-                        except Exception as e:
-                            st.error(f"Search failed: {e}")
+                    try:
+                        # Sources arrive first, then the answer renders token by token
+                        search_state = {}
+                        answer = st.write_stream(stream_search(prompt, search_state))
+                        data = search_state.get("data", {})
+                        if not answer:
+                            answer = data.get("answer", "I couldn't synthesize an answer, but here are the relevant extracts.")
+                        metas = data.get('metadatas', [[]])[0]
+                        
+                        # Store for reference panel
+                        st.session_state.last_search_results = data
+                        
+                        current_chat["messages"].append({"role": "assistant", "content": answer})
+                        
+                        # Show Quick Sources
+                        if metas:
+                            st.markdown("---")
+                            st.caption("Quick Sources:")
+                            for m in metas[:3]:
+                                st.markdown(f"<span class='source-pill'>Pg {m.get('page','?')}</span>", unsafe_allow_html=True)
+                    except Exception as e:
+                        st.error(f"Search failed: {e}")
                 st.rerun()
 
         with c_ref:
@@ -362,7 +382,10 @@ elif st.session_state.app_state == "dashboard":
                         
                         if sel["type"] == "img":
                             st.info(f"**Context Summary:** {sel['data'].get('caption', 'No summary available.')}")
-                            st.image(f"{API_URL}/static/images/{sel['data']['image_id']}", use_container_width=True)
+                            if sel['data'].get("type") == "scanned_page":
+                                st.image(f"{API_URL}/pages/{doc_id}/{sel['data']['page']}?size=screen", use_container_width=True)
+                            else:
+                                st.image(f"{API_URL}/static/images/{sel['data']['image_id']}", use_container_width=True)
                         elif sel["type"] == "tbl":
                             df = pd.DataFrame(sel["data"]["data"], columns=sel["data"]["headers"])
                             st.dataframe(df, use_container_width=True)